@@ -22,17 +22,22 @@ along with MPM.  If not, see <http://www.gnu.org/licenses/>.
 
 import sys
 import time
+from bisect import bisect_right
 from datetime import datetime
-from math import degrees, sqrt
+from math import cos, degrees, radians, sqrt
 
 import configuration
 import moon_ephem
 import numpy as np
 import telescope
 from PyQt5 import QtWidgets
+from drift_estimator import DriftEstimator
 from image_shift import ImageShift
 from landmark_selection import LandmarkSelection
 from miscellaneous import Miscellaneous
+from pointing_filter import PointingFilter
+from session_clock import SessionClock
+from settle_detector import SettleDetector
 
 
 class Alignment:
@@ -79,6 +84,21 @@ class Alignment:
         self.default_last_drift = True
         self.first_index = 0
         self.last_index = 0
+        # The drift rate is fitted to all alignment points in the interval. The estimator keeps
+        # running sums which are updated with each new alignment point.
+        self.drift_estimator = DriftEstimator(self.configuration)
+
+        # The pointing correction (and its drift) is tracked by a Kalman filter which is fed with
+        # all alignments. Changes of the coordinate read-out correction of the telescope increase
+        # the uncertainty of the correction. The last read-out correction seen is stored.
+        self.pointing_filter = PointingFilter(self.configuration)
+        self.readout_correction_seen = None
+
+        # For chain alignments, a still image is stored for every tile recorded (key: tile index),
+        # together with the time and the pointing correction applied. "chain_links" counts the
+        # chain alignments since the last alignment on the landmark.
+        self.tile_references = {}
+        self.chain_links = 0
 
         # Initialize current corrections in RA and DE (telescope - celestial coordinates).
         self.ra_correction = 0.
@@ -89,17 +109,24 @@ class Alignment:
         self.tel = None
         self.alignment_time = None
         self.im_shift = None
+        self.settle_detector = None
         self.shift_angle = None
         self.flip_x = None
         self.flip_y = None
         self.drift_ra = None
         self.drift_de = None
+        # Standard errors of the drift rates (None if not enough points for an estimate).
+        self.drift_ra_error = None
+        self.drift_de_error = None
         self.true_ra_focus = None
         self.true_de_focus = None
         self.ra_offset_focus_area = None
         self.de_offset_focus_area = None
         self.ra_offset_landmark = None
         self.de_offset_landmark = None
+        # If a SessionJournal object is registered, all changes of the alignment state are
+        # recorded.
+        self.journal = None
 
     def set_moon_ephem(self, moon_ephem):
         """
@@ -119,6 +146,20 @@ class Alignment:
 
         self.tel = telescope
 
+    def slew_telescope(self, ra, de):
+        """
+        Move the telescope to a given position (in telescope coordinates). The telescope computes
+        a new coordinate read-out correction with every slew. Check it for changes which affect
+        the pointing filter.
+
+        :param ra: Target right ascension (radians)
+        :param de: Target declination (radians)
+        :return: -
+        """
+
+        self.tel.slew_to(ra, de)
+        self.check_readout_correction()
+
     def set_landmark(self):
         """
         Let the user select the landmark used for telescope alignment and compute its offset
@@ -128,7 +169,7 @@ class Alignment:
         """
 
         # Open a gui where the user can select among a collection of landmarks on the moon
-        offsets = self.ls.select_landmark(self.me, datetime.now())
+        offsets = self.ls.select_landmark(self.me, SessionClock.now())
         # A landmark has been selected, store and print coordinate offsets.
         if self.ls.landmark_selected:
             (self.ra_offset_landmark, self.de_offset_landmark) = offsets
@@ -137,6 +178,9 @@ class Alignment:
                     round(degrees(self.ra_offset_landmark) * 60., 3)) + ", DE ('): " + str(
                     round(degrees(self.de_offset_landmark) * 60., 3)) + ".")
             self.landmark_offset_set = True
+            if self.journal is not None:
+                self.journal.record_landmark(self.ls.selected_landmark, self.ra_offset_landmark,
+                                             self.de_offset_landmark)
         else:
             self.landmark_offset_set = False
 
@@ -174,8 +218,8 @@ class Alignment:
                 raise RuntimeError("Error: Attempt to do an auto-alignment before initialization.")
             # Move telescope to expected coordinates of alignment point
             (ra_landmark, de_landmark) = (self.compute_telescope_coordinates_of_landmark())
-            self.tel.slew_to(ra_landmark, de_landmark)
-            time.sleep(self.configuration.conf.getfloat("ASCOM", "wait interval"))
+            self.slew_telescope(ra_landmark, de_landmark)
+            self.wait_until_settled()
             try:
                 # Measure shift against reference frame
                 (x_shift, y_shift, in_cluster, outliers) = self.im_shift.shift_vs_reference()
@@ -210,9 +254,11 @@ class Alignment:
 
         # From here on, manual and auto-alignment can be treated the same. The current mount
         # position is given by(ra_landmark, de_landmark).
-        current_time = datetime.now()
         # Set the time of the alignment point with an accuracy better than a second.
-        self.alignment_time = self.current_time_seconds(current_time)
+        self.alignment_time = SessionClock.time()
+        current_time = SessionClock.now(self.alignment_time)
+        # An alignment on the landmark ends a chain of tile-to-tile alignments.
+        self.chain_links = 0
 
         # Update ephemeris of moon and sun
         self.me.update(current_time)
@@ -235,13 +281,31 @@ class Alignment:
                 round(degrees(ra_landmark), 5)) + ", landmark DE: " + str(
                 round(degrees(de_landmark), 5)) + " (all in degrees).")
 
+        self.add_alignment_point(alignment_manual)
+        return relative_alignment_error
+
+    def add_alignment_point(self, alignment_manual):
+        """
+        Store the current correction (attributes "ra_correction", "de_correction") measured at
+        time "alignment_time" as a new alignment point, and update the drift rate.
+
+        :param alignment_manual: True if the alignment point was set by the user
+        :return: -
+        """
+
         # Store a new alignment point
         alignment_point = {}
-        alignment_point['time_string'] = str(current_time)[11:19]
+        alignment_point['time_string'] = str(SessionClock.now(self.alignment_time))[11:19]
         alignment_point['time_seconds'] = self.alignment_time
         alignment_point['ra_correction'] = self.ra_correction
         alignment_point['de_correction'] = self.de_correction
+        alignment_point['manual'] = alignment_manual
         self.alignment_points.append(alignment_point)
+        self.drift_estimator.add_point(self.alignment_time, self.ra_correction,
+                                       self.de_correction)
+        self.update_pointing_filter(alignment_point)
+        if self.journal is not None:
+            self.journal.record_alignment_point(alignment_point)
 
         self.is_aligned = True
 
@@ -252,7 +316,6 @@ class Alignment:
             if self.default_last_drift:
                 self.last_index = len(self.alignment_points) - 1
                 self.compute_drift_rate()
-        return relative_alignment_error
 
     def initialize_auto_align(self, camera_socket):
         """
@@ -266,6 +329,9 @@ class Alignment:
         """
 
         self.autoalign_initialized = False
+        # Tile images captured with an earlier initialization may have a different orientation.
+        self.tile_references = {}
+        self.chain_links = 0
 
         try:
             # Capture an alignment reference frame
@@ -279,6 +345,16 @@ class Alignment:
         if self.configuration.protocol_level > 1:
             Miscellaneous.protocol("Alignment reference frame captured.")
 
+        # After slews, wait until the telescope image is stable. In camera debug mode the still
+        # images are read from a directory in a fixed order. Additional frames would mix up the
+        # sequence, so a fixed wait time is used.
+        if self.configuration.settle_detection_enabled and not self.configuration.camera_debug:
+            self.settle_detector = SettleDetector(self.configuration, camera_socket,
+                                                  self.im_shift.pixel_angle,
+                                                  self.im_shift.compression_factor)
+        else:
+            self.settle_detector = None
+
         # The shift_angle is the overlap width between panorama tiles (in radians).
         self.shift_angle = self.im_shift.ol_angle
         # Three positions in the sky are defined: right shift in x direction, zero shift, and
@@ -297,9 +373,9 @@ class Alignment:
                                                                     self.me.de, 1., 1., -1.,
                                                                     shift[0], shift[1])
             # Drive the telescope to the computed position in the sky.
-            self.tel.slew_to(ra_landmark + shift_angle_ra, de_landmark + shift_angle_de)
+            self.slew_telescope(ra_landmark + shift_angle_ra, de_landmark + shift_angle_de)
             # Wait until the telescope orientation has stabilized.
-            time.sleep(self.configuration.conf.getfloat("ASCOM", "wait interval"))
+            self.wait_until_settled()
             try:
                 # Capture a still image of the area around landmark and determine the shift versus
                 # the reference frame.
@@ -368,16 +444,266 @@ class Alignment:
         # Return the relative error as compared with tile overlap width.
         return error
 
+    def wait_until_settled(self):
+        """
+        Wait after a slew until the telescope image is stable. If the settle detector is not
+        available or fails to capture a frame, wait for the fixed "wait interval" of the
+        telescope interface in use.
+
+        :return: -
+        """
+
+        if self.settle_detector is not None:
+            try:
+                self.settle_detector.wait()
+                return
+            except RuntimeError as e:
+                if self.configuration.protocol_level > 0:
+                    Miscellaneous.protocol("Settle detection failed (" + str(
+                        e) + "), waiting for the fixed wait interval instead.")
+        interface_type = self.configuration.conf.get("Telescope", "interface type")
+        time.sleep(self.configuration.conf.getfloat(interface_type, "wait interval"))
+
+    def capture_tile_reference(self, tile_index, tc):
+        """
+        Capture a still image at the current tile, to be used later for chain alignments at
+        neighboring tiles. The telescope must have been moved to the tile before. Together with
+        the image, the pointing correction applied and the time are stored. The true pointing
+        error of the image is computed only when it is used (see method "correction_at").
+
+        :param tile_index: index of the tile in "tc.list_of_tiles_sorted"
+        :param tc: TileConstructor object
+        :return: -
+        """
+
+        if not self.chain_alignment_enabled():
+            return
+        self.wait_until_settled()
+        time_seconds = SessionClock.time()
+        (ra_correction, de_correction) = self.compute_coordinate_correction(time_seconds)
+        try:
+            image = self.im_shift.capture_tile_image(tile_index)
+        except RuntimeError as e:
+            # Without the image, chain alignments at the neighboring tiles use other references
+            # or fall back to the landmark.
+            if self.configuration.protocol_level > 1:
+                Miscellaneous.protocol("Capturing still image of tile " + str(
+                    tile_index) + " failed: " + str(e))
+            return
+        self.store_tile_reference(tile_index, tc, image, time_seconds, ra_correction,
+                                  de_correction)
+
+    def store_tile_reference(self, tile_index, tc, image, time_seconds, ra_correction,
+                             de_correction):
+        """
+        Store a still image taken at a tile for later chain alignments.
+
+        :param tile_index: index of the tile in "tc.list_of_tiles_sorted"
+        :param tc: TileConstructor object
+        :param image: normalized still image (Numpy array)
+        :param time_seconds: time when the image was taken (seconds)
+        :param ra_correction: pointing correction in RA applied when the image was taken
+        :param de_correction: pointing correction in DE applied when the image was taken
+        :return: -
+        """
+
+        tile = tc.list_of_tiles_sorted[tile_index]
+        # The tile offsets are stored to detect if the tile arrangement has changed since.
+        self.tile_references[tile_index] = {'image': image, 'time_seconds': time_seconds,
+                                            'ra_correction': ra_correction,
+                                            'de_correction': de_correction,
+                                            'delta_ra_center': tile['delta_ra_center'],
+                                            'delta_de_center': tile['delta_de_center']}
+
+    def discard_tile_references(self, tile_indices):
+        """
+        Remove the still images of tiles, e.g. if the tiles have to be recorded again.
+
+        :param tile_indices: list of tile indices
+        :return: -
+        """
+
+        for tile_index in tile_indices:
+            self.tile_references.pop(tile_index, None)
+
+    def chain_alignment_enabled(self):
+        """
+        Check if chain alignments can be used. In camera debug mode the still images are read
+        from a directory in a fixed order, so no additional images can be taken.
+
+        :return: True, if chain alignment is enabled and auto-alignment is initialized
+        """
+
+        return self.configuration.chain_alignment_enabled and self.autoalign_initialized and \
+            not self.configuration.camera_debug
+
+    def select_tile_reference(self, tile_index, tc):
+        """
+        Select the still image of a neighboring tile to be used for a chain alignment at a tile.
+        Among all tiles overlapping with the given tile, take the one whose image was captured
+        closest in time to an alignment, because its pointing error is known best.
+
+        :param tile_index: index of the tile in "tc.list_of_tiles_sorted"
+        :param tc: TileConstructor object
+        :return: index of the neighboring tile, or None if no suitable image is available
+        """
+
+        tile = tc.list_of_tiles_sorted[tile_index]
+        best_index = None
+        best_distance = None
+        for neighbor_index in tc.tiles_in_box(tile['x_left'], tile['x_right'], tile['y_bottom'],
+                                              tile['y_top'], mode="intersecting"):
+            if neighbor_index == tile_index or neighbor_index not in self.tile_references:
+                continue
+            reference = self.tile_references[neighbor_index]
+            neighbor = tc.list_of_tiles_sorted[neighbor_index]
+            # Skip images taken for a different tile arrangement.
+            if reference['delta_ra_center'] != neighbor['delta_ra_center'] or \
+                    reference['delta_de_center'] != neighbor['delta_de_center']:
+                continue
+            distance = min([abs(reference['time_seconds'] - point['time_seconds']) for point in
+                            self.alignment_points])
+            if best_distance is None or distance < best_distance:
+                best_index = neighbor_index
+                best_distance = distance
+        return best_index
+
+    def chain_alignment_possible(self, tile_index, tc):
+        """
+        Check if an auto-alignment due before a tile can be done as a chain alignment.
+
+        :param tile_index: index of the tile in "tc.list_of_tiles_sorted"
+        :param tc: TileConstructor object
+        :return: True, if a chain alignment is possible
+        """
+
+        if not self.chain_alignment_enabled() or not self.is_aligned:
+            return False
+        if self.chain_links >= self.configuration.chain_alignment_max_links:
+            return False
+        return self.select_tile_reference(tile_index, tc) is not None
+
+    def correction_at(self, time_seconds):
+        """
+        Estimate the true pointing correction at a past time: Between two alignment points
+        interpolate linearly, after the last alignment point use the current prediction.
+
+        :param time_seconds: time (seconds)
+        :return: telescope - celestial coordinates: (Offset in RA, Offset in DE)
+        """
+
+        times = [point['time_seconds'] for point in self.alignment_points]
+        index = bisect_right(times, time_seconds)
+        if index == len(times):
+            return self.compute_coordinate_correction(time_seconds)
+        point_after = self.alignment_points[index]
+        if index == 0:
+            return point_after['ra_correction'], point_after['de_correction']
+        point_before = self.alignment_points[index - 1]
+        weight = (time_seconds - point_before['time_seconds']) / (
+                point_after['time_seconds'] - point_before['time_seconds'])
+        return (point_before['ra_correction'] + weight * (
+                point_after['ra_correction'] - point_before['ra_correction']),
+                point_before['de_correction'] + weight * (
+                        point_after['de_correction'] - point_before['de_correction']))
+
+    def chain_align(self, tile_index, tc):
+        """
+        Perform an auto-alignment at a tile instead of the landmark: Move the telescope to the
+        tile, take a still image, and measure its shift versus the image of a neighboring tile in
+        their overlap region. The pointing of the neighboring image is known from the alignment
+        points, so the pointing error at the current tile can be computed. Errors accumulate
+        along the chain. Therefore, after a given number of chain alignments the landmark has to
+        be used again (see method "chain_alignment_possible").
+
+        :param tile_index: index of the tile in "tc.list_of_tiles_sorted"
+        :param tc: TileConstructor object
+        :return: relative alignment error, i.e. the deviation of the telescope pointing from
+                 the predicted position, divided by the width of the overlap between tiles.
+        """
+
+        reference_index = self.select_tile_reference(tile_index, tc)
+        if reference_index is None:
+            raise RuntimeError("Error: No image of a neighboring tile for chain alignment.")
+        reference = self.tile_references[reference_index]
+        tile = tc.list_of_tiles_sorted[tile_index]
+
+        # Move the telescope to the tile, using the predicted correction.
+        (ra_tile, de_tile) = self.tile_to_telescope_coordinates(tile)
+        self.slew_telescope(ra_tile, de_tile)
+        self.wait_until_settled()
+        time_seconds = SessionClock.time()
+        (ra_correction, de_correction) = self.compute_coordinate_correction(time_seconds)
+
+        # Pointing error (applied minus true correction) of the neighboring image.
+        (ra_true, de_true) = self.correction_at(reference['time_seconds'])
+        ra_error_reference = reference['ra_correction'] - ra_true
+        de_error_reference = reference['de_correction'] - de_true
+        # Expected shift (as rotated to RA/DE in method "align") if the current pointing was
+        # perfect: the difference of the pointings of the neighboring and the current tile.
+        ra_expected = reference['delta_ra_center'] - tile['delta_ra_center'] + ra_error_reference
+        de_expected = reference['delta_de_center'] - tile['delta_de_center'] + de_error_reference
+        # Translate into pixels of the still image (see method "align" for the y flip).
+        expected_shift = Miscellaneous.rotate_inverse(self.me.pos_angle_pole, self.me.de,
+                                                      self.im_shift.scale, self.flip_x,
+                                                      -1. * self.flip_y, ra_expected, de_expected)
+        search_radius = self.configuration.chain_alignment_search_radius * \
+            self.configuration.pixels_in_overlap_width
+        try:
+            (image, x_shift, y_shift, in_cluster, outliers) = self.im_shift.tile_shift(
+                reference['image'], expected_shift, search_radius)
+            if self.configuration.protocol_level > 1:
+                Miscellaneous.protocol("Chain alignment at tile " + str(
+                    tile_index) + " versus tile " + str(reference_index) + ", x_shift: " + str(
+                    round(x_shift / self.im_shift.pixel_angle, 1)) + ", y_shift: " + str(
+                    round(y_shift / self.im_shift.pixel_angle, 1)) + " (pixels), expected: " +
+                    str([round(shift * self.im_shift.compression_factor, 1) for shift in
+                         expected_shift]) + ", # consistent shifts: " + str(
+                    in_cluster) + ", # outliers: " + str(outliers) + ".")
+        except RuntimeError as e:
+            if self.configuration.protocol_level > 0:
+                Miscellaneous.protocol("Exception in chain alignment: " + str(e))
+            raise RuntimeError(str(e))
+        (ra_shift, de_shift) = Miscellaneous.rotate(self.me.pos_angle_pole, self.me.de, 1.,
+                                                    self.flip_x, -1. * self.flip_y, x_shift,
+                                                    y_shift)
+        # The deviation of the measured from the expected shift is the pointing error at the
+        # current tile.
+        ra_error = ra_expected - ra_shift
+        de_error = de_expected - de_shift
+        relative_alignment_error = sqrt(
+            (ra_error * cos(self.me.de)) ** 2 + de_error ** 2) / self.shift_angle
+
+        self.alignment_time = time_seconds
+        self.ra_correction = ra_correction - ra_error
+        self.de_correction = de_correction - de_error
+        if self.configuration.protocol_level > 0:
+            Miscellaneous.protocol("Computing new alignment (chain link " + str(
+                self.chain_links + 1) + "), current RA correction ('): " + str(
+                round(degrees(self.ra_correction) * 60., 3)) + ", current DE correction ('): " +
+                str(round(degrees(self.de_correction) * 60., 3)) + ".")
+        self.add_alignment_point(False)
+        self.chain_links += 1
+        # The image of the current tile has a known pointing now. Use it for the next links.
+        self.store_tile_reference(tile_index, tc, image, time_seconds, ra_correction,
+                                  de_correction)
+        return relative_alignment_error
+
     def compute_drift_rate(self):
         """
-        Compute the drift rate of the telescope mount, based on two alignment points. By default,
-        the first and last alignment point are used. Other indices may have been selected by the
-        user.
+        Compute the drift rate of the telescope mount. A straight line is fitted to all alignment
+        points between the first and the last index (see class DriftEstimator). Outliers, e.g.
+        from a failed auto-alignment, are rejected. By default, the first and last alignment
+        point define the interval. Other indices may have been selected by the user. With two
+        points only, the result is the difference quotient of the two alignment corrections.
 
         :return: -
         """
 
         self.is_drift_set = False
+        if self.journal is not None:
+            self.journal.record_drift(self.drift_disabled, self.default_first_drift,
+                                      self.default_last_drift, self.first_index, self.last_index)
         if self.drift_disabled:
             return
         time_diff = (self.alignment_points[self.last_index]['time_seconds'] -
@@ -385,16 +711,31 @@ class Alignment:
         # Drift is only computed if the time difference of the alignment points is large enough.
         if time_diff < self.configuration.minimum_drift_seconds:
             return
-        self.drift_ra = ((self.alignment_points[self.last_index]['ra_correction'] -
-                          self.alignment_points[self.first_index]['ra_correction']) / time_diff)
-        self.drift_de = ((self.alignment_points[self.last_index]['de_correction'] -
-                          self.alignment_points[self.first_index]['de_correction']) / time_diff)
+        # If the alignment points have been replaced (e.g. restored from the session journal),
+        # rebuild the running sums of the estimator.
+        if len(self.drift_estimator.times) != len(self.alignment_points):
+            self.drift_estimator.set_points(self.alignment_points)
+        fit = self.drift_estimator.fit(self.first_index, self.last_index)
+        if fit is None:
+            return
+        (self.drift_ra, self.drift_de) = fit['drift']
+        if fit['error'] is not None:
+            (self.drift_ra_error, self.drift_de_error) = fit['error']
+        else:
+            self.drift_ra_error = None
+            self.drift_de_error = None
         if self.configuration.protocol_level > 1:
+            # Drift rates (and uncertainties, if available) in arc min/hour.
+            ra_string = str(round(degrees(self.drift_ra) * 216000., 3))
+            de_string = str(round(degrees(self.drift_de) * 216000., 3))
+            if self.drift_ra_error is not None:
+                ra_string += " +/- " + str(round(degrees(self.drift_ra_error) * 216000., 3))
+                de_string += " +/- " + str(round(degrees(self.drift_de_error) * 216000., 3))
             Miscellaneous.protocol(
-                "Drift rate based on alignment points " + str(self.first_index + 1) + " and " + str(
-                    self.last_index + 1) + ": Drift in Ra = " + str(
-                    round(degrees(self.drift_ra) * 216000., 3)) + ", drift in De = " + str(round(
-                    degrees(self.drift_de) * 216000., 3)) + " (in arc min/hour).")
+                "Drift rate fitted to alignment points " + str(self.first_index + 1) + " to " + str(
+                    self.last_index + 1) + " (" + str(len(fit['outliers'])) +
+                " outliers rejected): Drift in Ra = " + ra_string + ", drift in De = " +
+                de_string + " (in arc min/hour).")
         # Set flag to true to indicate that a valid drift rate has been determined.
         self.is_drift_set = True
 
@@ -425,35 +766,149 @@ class Alignment:
         if not self.configuration.conf.getboolean("Workflow", "focus on star"):
             # Compute current moon position and displacement of telescope position relative to moon
             # center.
-            self.me.update(datetime.now())
+            self.me.update()
             self.ra_offset_focus_area = self.true_ra_focus - self.me.ra
             self.de_offset_focus_area = self.true_de_focus - self.me.de
+        if self.journal is not None:
+            self.journal.record_focus_area(self.true_ra_focus, self.true_de_focus,
+                                           self.ra_offset_focus_area, self.de_offset_focus_area)
+
+    def update_pointing_filter(self, alignment_point):
+        """
+        Feed an alignment point into the Kalman filter which tracks the pointing correction. The
+        measurement accuracy depends on whether the alignment was manual or automatic.
 
-    def compute_coordinate_correction(self):
+        :param alignment_point: alignment point as stored in "alignment_points"
+        :return: -
+        """
+
+        if alignment_point['manual']:
+            sigma = radians(self.configuration.pointing_filter_manual_sigma / 3600.)
+        else:
+            sigma = radians(self.configuration.pointing_filter_auto_sigma / 3600.)
+        self.pointing_filter.update(alignment_point['time_seconds'],
+                                    alignment_point['ra_correction'],
+                                    alignment_point['de_correction'], sigma)
+        if self.configuration.protocol_level > 1:
+            (ra_error, de_error) = self.pointing_filter.correction_error(
+                alignment_point['time_seconds'])
+            Miscellaneous.protocol("Pointing filter updated, correction in RA: " + str(
+                round(degrees(self.pointing_filter.state[0, 0]) * 60., 3)) + " +/- " + str(
+                round(degrees(ra_error) * 60., 3)) + ", in DE: " + str(
+                round(degrees(self.pointing_filter.state[0, 1]) * 60., 3)) + " +/- " + str(
+                round(degrees(de_error) * 60., 3)) + " (arc min).")
+
+    def rebuild_pointing_filter(self):
+        """
+        Recompute the state of the pointing filter from all alignment points, e.g. after they
+        have been restored from the session journal.
+
+        :return: -
+        """
+
+        self.pointing_filter.reset()
+        self.readout_correction_seen = None
+        for alignment_point in self.alignment_points:
+            self.update_pointing_filter(alignment_point)
+
+    def check_readout_correction(self):
+        """
+        The telescope updates its coordinate read-out correction (the difference between slew
+        target and looked-up position) with every slew-to operation. A change of this correction
+        indicates that the coordinates reported by the mount have shifted. Add the square of the
+        change to the variance of the pointing correction. This method is called after each slew
+        (see method "slew_telescope").
+
+        :return: -
+        """
+
+        if self.tel is None:
+            return
+        readout_correction = (self.tel.readout_correction_ra, self.tel.readout_correction_de)
+        if self.readout_correction_seen is not None:
+            ra_change = readout_correction[0] - self.readout_correction_seen[0]
+            de_change = readout_correction[1] - self.readout_correction_seen[1]
+            if ra_change or de_change:
+                self.pointing_filter.add_uncertainty(ra_change ** 2, de_change ** 2)
+        self.readout_correction_seen = readout_correction
+
+    def seconds_until_alignment_needed(self, max_error):
+        """
+        Use the uncertainty of the predicted pointing correction to compute how long it stays
+        within a given limit. After this time a new alignment is necessary.
+
+        :param max_error: maximum acceptable standard deviation of the correction (radians)
+        :return: seconds from now (0. if the limit is exceeded already, inf if it never will be),
+                 or None if the pointing filter has no measurement yet.
+        """
+
+        if not self.pointing_filter.is_initialized():
+            return None
+        return self.pointing_filter.seconds_until_uncertainty(SessionClock.time(), max_error)
+
+    def pointing_filter_active(self):
+        """
+        Check if the pointing correction is taken from the pointing filter.
+
+        :return: True, if the filter is enabled and has been fed with an alignment point
+        """
+
+        return self.configuration.pointing_filter_enabled and \
+            self.pointing_filter.is_initialized()
+
+    def drift_rate(self):
+        """
+        Get the drift rate of the mount which is in effect, both for the pointing correction and
+        for guiding. If the pointing filter is active, its drift estimate is used, unless the user
+        has selected other alignment points for drift determination in the drift dialog. In that
+        case (and if the filter is disabled) the drift rate fitted to the selected alignment
+        points is used. No drift rate is applied unless a valid drift has been determined (see
+        method "compute_drift_rate"), e.g. if drift correction is disabled.
+
+        :return: (drift rate in RA, drift rate in DE) in radians per second, or None if no drift
+                 rate is to be applied
+        """
+
+        if not self.is_drift_set:
+            return None
+        if self.pointing_filter_active() and self.default_first_drift and \
+                self.default_last_drift:
+            return self.pointing_filter.drift_rate()
+        return self.drift_ra, self.drift_de
+
+    def compute_coordinate_correction(self, time_seconds=None):
         """
         Compute the current difference between telescope and celestial coordinates, including
-        alignment and (if available) drift rate.
+        alignment and (if available) drift rate. If the pointing filter is enabled, its estimate
+        of the correction is used, otherwise the correction of the last alignment. The drift rate
+        is the one returned by method "drift_rate".
 
+        :param time_seconds: time (seconds) for which the correction is computed. If None, the
+                             current time is used.
         :return: telescope - celestial coordinates: (Offset in RA, Offset in DE)
         """
 
+        if time_seconds is None:
+            time_seconds = SessionClock.time()
         # If an alignment has been performed, compute offsets in RA and DE.
         if self.is_aligned:
-            # Set correction to static value from last alignment
-            ra_offset = self.ra_correction
-            de_offset = self.de_correction
-            # In case drift has been determined, add time-dependent correction
-            # term
-            if self.is_drift_set:
-                now = datetime.now()
-                try:
-                    fract = float(str(now)[19:24])
-                except:
-                    fract = 0.
-                # Compute time in seconds since last alignment.
-                time_diff = (time.mktime(now.timetuple()) + fract - self.alignment_time)
-                ra_offset += time_diff * self.drift_ra
-                de_offset += time_diff * self.drift_de
+            # If the pointing filter is enabled, start from its estimate of the correction at the
+            # time of the last alignment. Otherwise use the correction of the last alignment.
+            if self.pointing_filter_active():
+                (ra_offset, de_offset) = self.pointing_filter.correction(time_seconds,
+                                                                         use_drift=False)
+                reference_time = self.pointing_filter.time
+            else:
+                ra_offset = self.ra_correction
+                de_offset = self.de_correction
+                reference_time = self.alignment_time
+            # In case drift has been determined, add time-dependent correction term. The same
+            # drift rate is used for guiding.
+            drift = self.drift_rate()
+            if drift is not None:
+                time_diff = time_seconds - reference_time
+                ra_offset += time_diff * drift[0]
+                de_offset += time_diff * drift[1]
         # Before the first alignment, set offsets to zero and print a warning to stdout.
         else:
             if self.configuration.protocol_level > 2:
@@ -511,7 +966,7 @@ class Alignment:
         """
 
         # Compute current position of the moon.
-        self.me.update(datetime.now())
+        self.me.update()
         if self.configuration.protocol_level > 2:
             Miscellaneous.protocol("Translating center offset to equatorial coordinates, "
                                    "center offsets: RA: " + str(
@@ -570,11 +1025,7 @@ class Alignment:
         :return: time measured in consecutive seconds
         """
 
-        try:
-            fract = float(str(current_time)[19:24])
-        except:
-            fract = 0.
-        return time.mktime(current_time.timetuple()) + fract
+        return SessionClock.seconds(current_time)
 
     def seconds_since_last_alignment(self):
         """
@@ -583,8 +1034,7 @@ class Alignment:
         :return: time measured in consecutive seconds
         """
 
-        current_time = datetime.now()
-        return self.current_time_seconds(current_time) - self.alignment_time
+        return SessionClock.time() - self.alignment_time
 
 
 if __name__ == "__main__":
@@ -0,0 +1,176 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (c) 2016 Rolf Hempel, rolf6419@gmx.de
+
+This file is part of the MoonPanoramaMaker tool (MPM).
+https://github.com/Rolf-Hempel/MoonPanoramaMaker
+
+MPM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with MPM.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+from collections import deque
+from math import inf
+
+import numpy as np
+
+from miscellaneous import Miscellaneous
+from session_clock import SessionClock
+
+
+class AlignmentScheduler:
+    """
+    The AlignmentScheduler decides before each tile of the recording loop whether an
+    auto-alignment has to be performed first. Every unnecessary alignment costs two slews plus
+    settle time, and every alignment which comes too late leads to re-recording tiles.
+
+    The pointing filter of class Alignment predicts how the uncertainty of the pointing
+    correction grows with time, based on the measured drift and its uncertainty. The alignment
+    becomes due when this uncertainty (times a safety factor) reaches the maximum alignment error
+    (a fraction of the overlap between tiles). Alignments are only done at tile boundaries:
+    If the alignment would become due while the next tile is recorded, it is performed before
+    that tile. The time per tile is the median of the last recorded tiles.
+
+    If after an alignment the error turns out to be larger than allowed, the filter has
+    underestimated the error growth. In this case the predicted time is shortened by
+    "align_interval_change_factor", after very precise alignments it is lengthened again. The time
+    between alignments is always kept between the minimum and maximum auto-align intervals.
+
+    If the pointing filter is disabled, the scheduler falls back to an alignment interval which
+    is adapted in the same way.
+
+    """
+
+    def __init__(self, configuration, al, min_interval, max_interval, max_alignment_error):
+        """
+        Initialize the scheduler right after the initialization of auto-alignment.
+
+        :param configuration: object containing parameters set by the user
+        :param al: Alignment object
+        :param min_interval: minimum time between auto-alignments (seconds)
+        :param max_interval: maximum time between auto-alignments (seconds)
+        :param max_alignment_error: maximum alignment error as a fraction of the tile overlap
+                                    (between 0. and 1.)
+        """
+
+        self.configuration = configuration
+        self.al = al
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_alignment_error = max_alignment_error
+
+        # Factor by which the time predicted by the pointing filter is divided.
+        self.prediction_scale = 1.
+        # Alignment interval used if the pointing filter is not available.
+        self.seconds_between_autoaligns = min_interval
+
+        # Durations of the last tiles (time between the starts of consecutive tiles without an
+        # alignment in between).
+        self.tile_durations = deque(maxlen=configuration.align_scheduler_tile_history)
+        self.last_tile_start = None
+
+    def tile_started(self, now=None):
+        """
+        Register the start of a tile (just before the telescope is moved to it).
+
+        :param now: time (seconds) of the tile start. If None, the current time is used.
+        :return: -
+        """
+
+        if now is None:
+            now = SessionClock.time()
+        if self.last_tile_start is not None:
+            self.tile_durations.append(now - self.last_tile_start)
+        self.last_tile_start = now
+
+    def tile_duration(self):
+        """
+        Estimate the time until the next tile boundary. The median is not affected by long breaks
+        in the recording loop (e.g. if the user interrupted the workflow).
+
+        :return: time per tile (seconds), 0. if no tile has been recorded yet
+        """
+
+        if not self.tile_durations:
+            return 0.
+        return float(np.median(self.tile_durations))
+
+    def seconds_until_due(self):
+        """
+        Compute the time from now until the next auto-alignment is required.
+
+        :return: time in seconds (may be negative if the alignment is overdue)
+        """
+
+        since_last_alignment = self.al.seconds_since_last_alignment()
+        seconds = None
+        if self.configuration.pointing_filter_enabled:
+            # The standard deviation of the predicted correction must stay below the maximum
+            # alignment error, divided by the safety factor.
+            limit = self.max_alignment_error * self.al.shift_angle / \
+                self.configuration.align_scheduler_sigma_factor
+            seconds = self.al.seconds_until_alignment_needed(limit)
+        if seconds is None:
+            return self.seconds_between_autoaligns - since_last_alignment
+        seconds = seconds / self.prediction_scale
+        # Keep the time between alignments within the configured bounds.
+        if seconds != inf:
+            seconds = max(seconds, self.min_interval - since_last_alignment)
+        return min(seconds, self.max_interval - since_last_alignment)
+
+    def alignment_due(self):
+        """
+        Decide at a tile boundary if an auto-alignment has to be performed before the next tile.
+
+        :return: True, if the alignment is required now
+        """
+
+        seconds = self.seconds_until_due()
+        due = seconds <= self.tile_duration()
+        if self.configuration.protocol_level > 2:
+            Miscellaneous.protocol("Next auto-alignment required in " + str(
+                round(seconds, 1)) + " seconds, time per tile: " + str(
+                round(self.tile_duration(), 1)) + " seconds.")
+        return due
+
+    def record_alignment(self, relative_alignment_error):
+        """
+        Adapt the schedule after an auto-alignment.
+
+        :param relative_alignment_error: deviation of the telescope pointing from the predicted
+                                         position, relative to the tile overlap width
+        :return: True, if the error was larger than allowed (tiles recorded since the previous
+                 alignment have to be repeated)
+        """
+
+        # The time of the alignment does not count as tile time.
+        self.last_tile_start = None
+        change_factor = self.configuration.align_interval_change_factor
+        inaccurate = relative_alignment_error > self.max_alignment_error
+        if inaccurate:
+            # The error has grown faster than predicted: Schedule alignments earlier.
+            self.prediction_scale *= change_factor
+            self.seconds_between_autoaligns = max(self.seconds_between_autoaligns / change_factor,
+                                                  self.min_interval)
+        elif relative_alignment_error < self.max_alignment_error / \
+                self.configuration.align_very_precise_factor:
+            # The prediction has been on the safe side. Do not go beyond the pure filter
+            # prediction, though.
+            self.prediction_scale = max(self.prediction_scale / change_factor, 1.)
+            self.seconds_between_autoaligns = min(self.seconds_between_autoaligns * change_factor,
+                                                  self.max_interval)
+        if self.configuration.protocol_level > 0:
+            Miscellaneous.protocol("Next auto-alignment scheduled in " + str(
+                round(self.seconds_until_due(), 1)) + " seconds.")
+        return inaccurate
@@ -93,6 +93,9 @@ class Configuration:
         # time (in seconds) before it accesses its instance variables.
         self.polling_interval = 0.1
         self.polling_time_out_count = 200
+        # Maximum time (in seconds) to wait for the telescope thread to execute an instruction.
+        # Looking up the telescope position includes waiting for the end of a slew.
+        self.telescope_instruction_timeout = 300.
         self.wait_for_workflow_initialization = 2.
 
         # The INDI telescope server uses a fixed port number for communication.
@@ -105,6 +108,96 @@ class Configuration:
         # Minimum length of time interval for drift computation:
         self.minimum_drift_seconds = 600.  # 10 minutes
 
+        # The drift rate is fitted to all alignment points in the selected interval (weighted least
+        # squares). Residuals larger than "drift_huber_threshold" times the robust residual scale
+        # are down-weighted (Huber), points beyond "drift_outlier_threshold" times the scale are
+        # rejected. The scale is not taken smaller than the typical alignment accuracy
+        # "drift_residual_floor" (arc seconds).
+        self.drift_huber_threshold = 1.5
+        self.drift_outlier_threshold = 4.
+        self.drift_residual_floor = 1.
+        self.drift_fit_iterations = 10
+
+        # The pointing correction is tracked with a Kalman filter (see module pointing_filter). If
+        # "pointing_filter_enabled" is False, the correction of the last alignment plus the
+        # constant drift rate is used instead. The drift rate of the filter is also used for
+        # guiding, unless other alignment points are selected in the drift dialog. In that case
+        # pointing and guiding use the drift rate fitted to these points. Parameters of the
+        # filter: accuracy of manual and auto-alignments (arc seconds), random walk of the
+        # correction (arc seconds**2 per second) and of the drift rate (arc seconds**2 per
+        # second**3), and the typical size of the drift rate before it has been measured (arc
+        # seconds per second).
+        self.pointing_filter_enabled = True
+        self.pointing_filter_manual_sigma = 5.
+        self.pointing_filter_auto_sigma = 1.5
+        self.pointing_filter_correction_noise = 0.01
+        self.pointing_filter_drift_noise = 1.e-8
+        self.pointing_filter_initial_drift_sigma = 0.02
+
+        # Parameters of the ephemeris table: Positions of sun and moon are computed with PyEphem
+        # only at the nodes of piecewise Chebyshev polynomials. The table covers a time window
+        # of "ephemeris_table_hours", starting "ephemeris_table_lead_hours" before the first
+        # request. Each polynomial segment has the given length (in hours) and degree.
+        self.ephemeris_table_hours = 12.
+        self.ephemeris_table_lead_hours = 0.5
+        self.ephemeris_table_segment_hours = 2.
+        self.ephemeris_table_degree = 10
+
+        # Parameters used by the session simulator: Speed (degrees per second) of the mount axes
+        # during slews, constant time (seconds) added to each slew for acceleration / deceleration,
+        # length (seconds) of a single video, time (seconds) for capturing and evaluating a still
+        # image for auto-alignment, time (seconds) until the telescope image has settled after a
+        # slew, and the relative alignment error assumed for each auto-alignment (as a fraction of
+        # the maximum alignment error). The moon altitude (degrees) below which the moon is
+        # assumed to be unobservable.
+        self.simulation_slew_speed = 2.
+        self.simulation_slew_overhead = 2.
+        self.simulation_exposure_time = 30.
+        self.simulation_still_image_time = 3.
+        self.simulation_settle_time = 2.
+        self.simulation_relative_alignment_error = 0.2
+        self.simulation_minimum_altitude = 20.
+
+        # If set to True, the order in which tiles are recorded is optimized to reduce the slew
+        # times between tiles. The columns of tiles are traversed in alternate directions, and
+        # the path is improved further, keeping the "limb first" order of columns. Since this
+        # changes the tile numbering (and thus the names of video files), it is off by default.
+        self.tile_path_optimization = False
+
+        # Strategy for the tesselation of the sunlit phase: "rectangular" (rows of tiles),
+        # "columns" (vertical columns of tiles, starting at the sunlit limb), or "optimized" (the
+        # row or column layout with the smallest number of tiles). In the optimized strategy the
+        # overlap and position of rows / columns is varied in the given number of steps each.
+        self.tesselation_strategy = "rectangular"
+        self.tesselation_search_steps = 9
+        # The tesselation may be restricted to a region of the sunlit phase: "full" (the whole
+        # sunlit phase), "terminator" (a strip along the terminator, width in arc minutes), or
+        # "selenographic box" (longitude min / max, latitude min / max in degrees). A tile is kept
+        # if one of the given number of sample points in each direction is in the region.
+        self.tesselation_region = "full"
+        self.tesselation_terminator_width = 4.
+        self.tesselation_selenographic_box = (-30., 30., -30., 30.)
+        self.tesselation_region_samples = 9
+        # If set to True, tiles are recorded in the order of their distance from the terminator,
+        # where the illumination changes fastest. Parameter "limb first" is ignored then.
+        self.tesselation_terminator_priority = False
+
+        # A session journal records all state changes (tesselation, tile states, landmark,
+        # alignment points, drift and focus area settings). After a program crash, a session is
+        # resumed from the journal if it is not older than the given time (hours).
+        self.journal_resume_hours = 3.
+
+        # The outline of the moon phase in the tile visualization window is drawn with one vertex
+        # per given number of screen pixels along the limb and the terminator. The number of
+        # vertices is limited to the given range.
+        self.phase_outline_pixels_per_vertex = 2.
+        self.phase_outline_min_vertices = 32
+        self.phase_outline_max_vertices = 500
+
+        # Tiles selected by drawing a rectangle in the tile visualization window: either the tiles
+        # "contained" completely in the rectangle, or all tiles "intersecting" it.
+        self.tile_selection_mode = "contained"
+
         # Resolution (in pixels) of overlap width in still pictures for shift determination:
         self.pixels_in_overlap_width = 40  # 40 pixels
 
@@ -121,6 +214,50 @@ class Configuration:
         self.align_interval_change_factor = 1.5
         # Criterion for very precise alignment:
         self.align_very_precise_factor = 4.
+        # Auto-alignments are scheduled when the standard deviation of the predicted pointing
+        # correction, multiplied with the following safety factor, reaches the maximum alignment
+        # error:
+        self.align_scheduler_sigma_factor = 2.
+        # Number of recent tiles used to estimate the time per tile:
+        self.align_scheduler_tile_history = 10
+        # Chain alignment: If an auto-alignment is due, the pointing error is measured at the
+        # next tile by comparing a still image with the overlap region of a neighboring tile
+        # captured before, instead of slewing to the landmark. A landmark alignment is still
+        # performed after "chain_alignment_max_links" chain alignments in a row, to keep the
+        # accumulated error small. Matching keypoints are searched within a radius of
+        # "chain_alignment_search_radius" times the overlap width around the expected shift.
+        self.chain_alignment_enabled = True
+        self.chain_alignment_max_links = 4
+        self.chain_alignment_search_radius = 0.5
+
+        # Pointing model of the mount, fitted to the residuals of all slews (slew target minus
+        # position reached). If "mount_model_enabled" is True, slew targets are corrected by the
+        # predicted residual. The model is fitted as soon as "mount_model_min_residuals" residuals
+        # are available, only the latest "mount_model_max_residuals" are kept. The fit assumes
+        # a measurement error of "mount_model_residual_sigma" (arc seconds) and a typical size of
+        # the model terms of "mount_model_prior_sigma" (arc minutes). Residuals are down-weighted
+        # with age: their weight is halved every "mount_model_half_life" hours, so that residuals
+        # of earlier nights do not bias the model of a mount which has been set up anew.
+        # Residuals older than "mount_model_max_age" days are dropped.
+        self.mount_model_enabled = True
+        self.mount_model_min_residuals = 5
+        self.mount_model_max_residuals = 500
+        self.mount_model_residual_sigma = 10.
+        self.mount_model_prior_sigma = 30.
+        self.mount_model_half_life = 6.
+        self.mount_model_max_age = 30.
+
+        # After slews during auto-alignment, wait until the telescope image has settled. Still
+        # images are captured with a compression "settle_extra_compression" times stronger than
+        # the alignment images. The telescope is settled when "settle_stable_frames" consecutive
+        # frame shifts are below "settle_shift_threshold" (arc seconds). After "settle_timeout"
+        # seconds the wait ends anyway. If "settle_detection_enabled" is False, the fixed "wait
+        # interval" of the telescope interface is used instead.
+        self.settle_detection_enabled = True
+        self.settle_extra_compression = 4.
+        self.settle_shift_threshold = 2.
+        self.settle_stable_frames = 3
+        self.settle_timeout = 10.
         # Delete alignment pictures if they are older than the given retention period (in seconds).
         self.alignment_pictures_retention_time = 43200.
 
@@ -157,6 +294,9 @@ class Configuration:
         self.home = os.path.expanduser("~")
         self.config_filename = os.path.join(self.home, ".MoonPanoramaMaker.ini")
         self.protocol_filename = os.path.join(self.home, "MoonPanoramaMaker.log")
+        self.journal_filename = os.path.join(self.home, "MoonPanoramaMaker.journal")
+        # Slew residuals for the mount pointing models (see module mount_model).
+        self.mount_model_filename = os.path.join(self.home, ".MoonPanoramaMaker_mount_models.json")
 
         self.file_new = not os.path.isfile(self.config_filename)
         self.file_identical = False
@@ -0,0 +1,247 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (c) 2016 Rolf Hempel, rolf6419@gmx.de
+
+This file is part of the MoonPanoramaMaker tool (MPM).
+https://github.com/Rolf-Hempel/MoonPanoramaMaker
+
+MPM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with MPM.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import numpy as np
+
+from miscellaneous import Miscellaneous
+
+
+class CoverageVerification:
+    """
+    This class checks if a tile layout computed by the TileConstructor covers the sunlit phase of
+    the moon as required. The sunlit phase (with the same geometry as drawn in the tile
+    visualization window) and all tile rectangles are rasterized on a Numpy grid in the
+    "normalized" (x,y) coordinate system. Three properties are checked:
+
+    - Every pixel of the sunlit phase (or of the region to which the tesselation is restricted) is
+      covered by at least one tile.
+    - The external margin: Pixels closer to the sunlit phase than the external margin width are
+      covered as well.
+    - The overlap between neighboring tiles is not smaller than the minimum tile overlap. The
+      neighbor of a tile to the left (below) is the nearest tile in this direction which overlaps
+      it by at least half the tile height (width), and which is less than half a tile size away.
+      The effective overlap is the overlap in x (y) direction, negative if there is a gap.
+
+    """
+
+    def __init__(self, tc, pixels=600):
+        """
+        Set up the raster for a tile layout.
+
+        :param tc: TileConstructor object with the tile layout to be checked
+        :param pixels: number of raster pixels across the moon diameter plus external margins
+        """
+
+        self.tc = tc
+        half_width = tc.m_diameter / 2. + tc.ol_outer
+        self.pixel_size = 2. * half_width / pixels
+        # Pixel centers in x and y.
+        self.coordinates = -half_width + self.pixel_size * (np.arange(pixels) + 0.5)
+
+        # Results of the last verification.
+        self.uncovered_pixels = None
+        self.margin_violations = None
+        self.minimum_overlap = None
+        self.overlap_violations = None
+
+    def coverage_count(self):
+        """
+        Rasterize all tile rectangles and count for each pixel by how many tiles it is covered.
+        Instead of painting each rectangle, +1 / -1 is entered at its corners in a difference
+        array. Cumulative sums along both axes then give the coverage count.
+
+        :return: integer Numpy array (y index, x index) with the number of tiles per pixel
+        """
+
+        table = self.tc.tile_table
+        start = self.coordinates[0]
+        pixels = len(self.coordinates)
+        # Index ranges of pixel centers inside each tile (the upper limits are exclusive).
+        x_low = np.clip(np.ceil((table['x_left'] - start) / self.pixel_size), 0, pixels)
+        x_high = np.clip(np.floor((table['x_right'] - start) / self.pixel_size) + 1, 0, pixels)
+        y_low = np.clip(np.ceil((table['y_bottom'] - start) / self.pixel_size), 0, pixels)
+        y_high = np.clip(np.floor((table['y_top'] - start) / self.pixel_size) + 1, 0, pixels)
+        (x_low, x_high, y_low, y_high) = [index.astype(int) for index in
+                                          (x_low, x_high, y_low, y_high)]
+
+        difference = np.zeros((pixels + 1, pixels + 1), dtype=np.int32)
+        np.add.at(difference, (y_low, x_low), 1)
+        np.add.at(difference, (y_low, x_high), -1)
+        np.add.at(difference, (y_high, x_low), -1)
+        np.add.at(difference, (y_high, x_high), 1)
+        return difference.cumsum(axis=0).cumsum(axis=1)[:pixels, :pixels]
+
+    @staticmethod
+    def dilate(mask, radius):
+        """
+        Extend a boolean mask by all pixels within a given distance (dilation with a disk). The
+        disk is composed of horizontal lines. For each line the sliding window sums along x are
+        computed from one array of cumulative sums, and shifted in y.
+
+        :param mask: boolean Numpy array (y index, x index)
+        :param radius: dilation radius in pixels
+        :return: dilated boolean Numpy array
+        """
+
+        if radius <= 0:
+            return mask.copy()
+        (rows, columns) = mask.shape
+        cumulative = np.zeros((rows, columns + 1), dtype=np.int32)
+        cumulative[:, 1:] = mask.cumsum(axis=1)
+        index = np.arange(columns)
+        result = np.zeros_like(mask)
+        for dy in range(-radius, radius + 1):
+            half_width = int(np.sqrt(radius ** 2 - dy ** 2))
+            upper = np.minimum(index + half_width + 1, columns)
+            lower = np.maximum(index - half_width, 0)
+            line = cumulative[:, upper] - cumulative[:, lower] > 0
+            # Shift the dilated line by dy rows.
+            if dy >= 0:
+                result[dy:, :] |= line[:rows - dy, :]
+            else:
+                result[:dy, :] |= line[-dy:, :]
+        return result
+
+    def pair_overlaps(self):
+        """
+        Compute the effective overlap of all pairs of neighboring tiles.
+
+        :return: (first tile indices, second tile indices, effective overlaps) Numpy arrays
+        """
+
+        table = self.tc.tile_table
+        # Overlap of all tile pairs in x and y (negative if they do not intersect).
+        overlap_x = np.minimum(table['x_right'][:, np.newaxis], table['x_right'][np.newaxis, :]) - \
+            np.maximum(table['x_left'][:, np.newaxis], table['x_left'][np.newaxis, :])
+        overlap_y = np.minimum(table['y_top'][:, np.newaxis], table['y_top'][np.newaxis, :]) - \
+            np.maximum(table['y_bottom'][:, np.newaxis], table['y_bottom'][np.newaxis, :])
+        x_center = table['x_center']
+        y_center = table['y_center']
+
+        firsts = []
+        seconds = []
+        overlaps = []
+        # The neighbor to the left of a tile shares a vertical seam, the neighbor below a
+        # horizontal one. The overlap across the seam is the overlap in x or y, respectively.
+        # Tiles separated by more than half a tile size (e.g. across the dark part of a crescent)
+        # are not neighbors.
+        for (seam, across, center, seam_size, across_size) in [
+            (overlap_y, overlap_x, x_center, self.tc.im_h, self.tc.im_w),
+            (overlap_x, overlap_y, y_center, self.tc.im_w, self.tc.im_h)]:
+            distance = center[:, np.newaxis] - center[np.newaxis, :]
+            distance = np.where((seam >= 0.5 * seam_size) & (across > -0.5 * across_size) & (
+                    distance > 0.), distance, np.inf)
+            nearest = distance.argmin(axis=1)
+            has_neighbor = np.isfinite(distance.min(axis=1))
+            first = np.flatnonzero(has_neighbor)
+            firsts.append(first)
+            seconds.append(nearest[first])
+            overlaps.append(across[first, nearest[first]])
+        return np.concatenate(firsts), np.concatenate(seconds), np.concatenate(overlaps)
+
+    def verify(self):
+        """
+        Check the tile layout.
+
+        :return: True, if all requirements are met, otherwise False. Details are stored in
+                 instance variables "uncovered_pixels" (number of sunlit pixels in the region not
+                 covered), "margin_violations" (number of uncovered pixels in the external
+                 margin), "minimum_overlap" (smallest effective overlap of neighboring tiles, in
+                 radians), and "overlap_violations" (list of (tile index, tile index, overlap) for
+                 neighbors with too small overlap).
+        """
+
+        x, y = np.meshgrid(self.coordinates, self.coordinates)
+        covered = self.coverage_count() > 0
+        sunlit = self.tc.sunlit_points(x, y) & self.tc.in_region(x, y)
+        self.uncovered_pixels = int(np.count_nonzero(sunlit & ~covered))
+
+        # Pixels in the external margin. Allow for one pixel of rasterization error.
+        margin = self.dilate(sunlit, int(self.tc.ol_outer / self.pixel_size) - 1)
+        self.margin_violations = int(np.count_nonzero(margin & ~sunlit & ~covered))
+
+        (first, second, overlaps) = self.pair_overlaps()
+        if len(overlaps):
+            self.minimum_overlap = float(overlaps.min())
+        else:
+            self.minimum_overlap = None
+        too_small = overlaps < self.tc.ol_inner_min - 1.e-12
+        self.overlap_violations = list(zip(first[too_small].tolist(), second[too_small].tolist(),
+                                           overlaps[too_small].tolist()))
+
+        valid = self.uncovered_pixels == 0 and self.margin_violations == 0 and not \
+            self.overlap_violations
+        if not valid and self.tc.configuration.protocol_level > 0:
+            Miscellaneous.protocol("Tile layout coverage check failed: " + str(
+                self.uncovered_pixels) + " uncovered pixels, " + str(
+                self.margin_violations) + " margin violations, " + str(
+                len(self.overlap_violations)) + " tile pairs with too small overlap.")
+        return valid
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from math import radians
+
+    import configuration
+    from tile_constructor import TileConstructor
+
+    # Benchmark: Check the layouts for many moon phases, declinations and camera profiles, with
+    # all tesselation strategies.
+    c = configuration.Configuration()
+    camera_profiles = [(1280, 960), (640, 480), (1920, 1080), (3000, 2000)]
+    number_layouts = 0
+    number_failures = 0
+    construction_time = 0.
+    verification_time = 0.
+    for strategy in ["rectangular", "columns", "optimized"]:
+        c.tesselation_strategy = strategy
+        for (pixel_horizontal, pixel_vertical) in camera_profiles:
+            c.conf.set("Camera", "pixel horizontal", str(pixel_horizontal))
+            c.conf.set("Camera", "pixel vertical", str(pixel_vertical))
+            for de_center in [-25., 0., 25.]:
+                for phase_angle in range(5, 180, 5):
+                    start = time.perf_counter()
+                    tc = TileConstructor(c, radians(de_center), radians(0.52),
+                                         radians(phase_angle), radians(30.))
+                    construction_time += time.perf_counter() - start
+                    start = time.perf_counter()
+                    verification = CoverageVerification(tc)
+                    valid = verification.verify()
+                    verification_time += time.perf_counter() - start
+                    number_layouts += 1
+                    if not valid:
+                        number_failures += 1
+                        print("Failure: strategy: " + strategy + ", camera: " + str(
+                            (pixel_horizontal, pixel_vertical)) + ", phase angle: " + str(
+                            phase_angle) + ", uncovered: " + str(
+                            verification.uncovered_pixels) + ", margin: " + str(
+                            verification.margin_violations) + ", overlap: " + str(
+                            len(verification.overlap_violations)))
+    print(str(number_layouts) + " layouts checked, " + str(number_failures) + " failures.")
+    print("Average time per layout: construction: " + str(
+        round(construction_time / number_layouts * 1000., 2)) + " ms, verification: " + str(
+        round(verification_time / number_layouts * 1000., 2)) + " ms.")
+    # Exit with a non-zero status if a layout failed, so that the benchmark can be used as a
+    # check in scripts.
+    sys.exit(1 if number_failures > 0 else 0)
@@ -0,0 +1,236 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (c) 2016 Rolf Hempel, rolf6419@gmx.de
+
+This file is part of the MoonPanoramaMaker tool (MPM).
+https://github.com/Rolf-Hempel/MoonPanoramaMaker
+
+MPM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with MPM.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+from math import radians
+
+import numpy as np
+
+
+class DriftEstimator:
+    """
+    The DriftEstimator fits a straight line (alignment correction versus time) to the alignment
+    points, separately for RA and DE. The slope is the drift rate of the telescope mount. Other
+    than the difference quotient of two alignment points, the fit uses all points in the selected
+    interval, so that the noise of single measurements is averaged out.
+
+    The sums needed for the least squares fit are updated with each new alignment point. As long
+    as all residuals are small, the fit over all points is available from these running sums
+    without looking at the individual points again. Otherwise, the fit is made robust by
+    iteratively reweighted least squares: Points with large residuals are down-weighted with Huber
+    weights, and outliers (e.g. a failed auto-alignment) are rejected completely.
+
+    The uncertainty of the drift rate is estimated from the scatter of the weighted residuals.
+
+    """
+
+    def __init__(self, configuration):
+        """
+        Initialize the estimator without alignment points.
+
+        :param configuration: object containing parameters set by the user
+        """
+
+        self.configuration = configuration
+        self.times = []
+        self.corrections = []
+        self.time_origin = None
+        self.sum_t = None
+        self.sum_tt = None
+        self.sum_y = None
+        self.sum_ty = None
+        self.sum_yy = None
+        self.reset()
+
+    def reset(self):
+        """
+        Remove all alignment points.
+
+        :return: -
+        """
+
+        self.times = []
+        self.corrections = []
+        # Times are counted from the first alignment point to avoid loss of precision in the sums.
+        self.time_origin = None
+        # Running sums over all points: t, t**2, y, t*y, y**2. The sums involving the corrections
+        # y are arrays with entries for RA and DE.
+        self.sum_t = 0.
+        self.sum_tt = 0.
+        self.sum_y = np.zeros(2)
+        self.sum_ty = np.zeros(2)
+        self.sum_yy = np.zeros(2)
+
+    def add_point(self, time_seconds, ra_correction, de_correction):
+        """
+        Add an alignment point and update the running sums.
+
+        :param time_seconds: time of the alignment (seconds)
+        :param ra_correction: alignment correction in RA (radians)
+        :param de_correction: alignment correction in DE (radians)
+        :return: -
+        """
+
+        if self.time_origin is None:
+            self.time_origin = time_seconds
+        t = time_seconds - self.time_origin
+        y = np.array([ra_correction, de_correction])
+        self.times.append(t)
+        self.corrections.append(y)
+        self.sum_t += t
+        self.sum_tt += t * t
+        self.sum_y += y
+        self.sum_ty += t * y
+        self.sum_yy += y * y
+
+    def set_points(self, alignment_points):
+        """
+        Replace all points with a list of alignment points (e.g. restored from the session
+        journal).
+
+        :param alignment_points: list of alignment points as stored in class Alignment
+        :return: -
+        """
+
+        self.reset()
+        for point in alignment_points:
+            self.add_point(point['time_seconds'], point['ra_correction'], point['de_correction'])
+
+    @staticmethod
+    def line_fit(sum_w, sum_t, sum_tt, sum_y, sum_ty):
+        """
+        Compute the weighted least squares line from the (weighted) sums.
+
+        :param sum_w: sum of weights
+        :param sum_t: weighted sum of times
+        :param sum_tt: weighted sum of squared times
+        :param sum_y: weighted sum of corrections
+        :param sum_ty: weighted sum of products of times and corrections
+        :return: (slope, intercept, determinant), or None if the times do not span an interval
+        """
+
+        determinant = sum_w * sum_tt - sum_t * sum_t
+        if np.any(determinant <= 0.):
+            return None
+        slope = (sum_w * sum_ty - sum_t * sum_y) / determinant
+        intercept = (sum_tt * sum_y - sum_t * sum_ty) / determinant
+        return slope, intercept, determinant
+
+    def fit(self, first_index=0, last_index=None):
+        """
+        Fit the drift rate to the alignment points in an index interval.
+
+        :param first_index: index of the first alignment point to be used
+        :param last_index: index of the last alignment point to be used (default: last point)
+        :return: dictionary with the drift rates "drift" (radians per second, array with entries
+                 for RA and DE), their standard errors "error" (None for less than three
+                 points), the number of points "points" and the list "outliers" with the
+                 indices of rejected points. None, if there are less than two points.
+        """
+
+        if last_index is None:
+            last_index = len(self.times) - 1
+        n = last_index - first_index + 1
+        if n < 2:
+            return None
+        t = np.array(self.times[first_index:last_index + 1])
+        y = np.array(self.corrections[first_index:last_index + 1])
+
+        # Unweighted fit. For the full interval, take the running sums.
+        if first_index == 0 and last_index == len(self.times) - 1:
+            sums = (float(n), self.sum_t, self.sum_tt, self.sum_y, self.sum_ty)
+        else:
+            sums = (float(n), t.sum(), (t * t).sum(), y.sum(axis=0), (t[:, np.newaxis] * y).sum(
+                axis=0))
+        line = self.line_fit(*sums)
+        if line is None:
+            return None
+        (slope, intercept, determinant) = line
+        weights = np.ones((n, 2))
+
+        # Robust refinement (only possible with redundant points): Iteratively reweighted least
+        # squares with Huber weights. The residual scale is estimated from the median absolute
+        # residual, but not below the accuracy of an alignment.
+        if n > 2:
+            floor = radians(self.configuration.drift_residual_floor / 3600.)
+            huber = self.configuration.drift_huber_threshold
+            rejection = self.configuration.drift_outlier_threshold
+            for iteration in range(self.configuration.drift_fit_iterations):
+                residuals = np.abs(y - intercept - t[:, np.newaxis] * slope)
+                scale = np.maximum(1.4826 * np.median(residuals, axis=0), floor)
+                u = residuals / scale
+                new_weights = np.where(u <= huber, 1., huber / np.maximum(u, huber))
+                new_weights[u > rejection] = 0.
+                if np.array_equal(new_weights, weights):
+                    break
+                weights = new_weights
+                tw = t[:, np.newaxis] * weights
+                line = self.line_fit(weights.sum(axis=0), tw.sum(axis=0),
+                                     (tw * t[:, np.newaxis]).sum(axis=0), (weights * y).sum(axis=0),
+                                     (tw * y).sum(axis=0))
+                # Too many points rejected: Keep the previous fit.
+                if line is None:
+                    break
+                (slope, intercept, determinant) = line
+
+        # Standard error of the slope from the weighted residuals.
+        used = np.count_nonzero(weights > 0., axis=0)
+        if np.all(used > 2):
+            residuals = y - intercept - t[:, np.newaxis] * slope
+            variance = (weights * residuals ** 2).sum(axis=0) / (used - 2)
+            error = np.sqrt(variance * weights.sum(axis=0) / determinant)
+        else:
+            error = None
+
+        outliers = (first_index + np.flatnonzero(np.any(weights == 0., axis=1))).tolist()
+        return {'drift': slope, 'error': error, 'points': n, 'outliers': outliers}
+
+
+if __name__ == "__main__":
+    from math import degrees
+
+    import configuration
+
+    # Simulate alignment points every five minutes over two hours, with a constant drift,
+    # measurement noise of two arc seconds, and one failed alignment. Compare the fit with the
+    # two-point difference quotient.
+    c = configuration.Configuration()
+    rng = np.random.default_rng(1)
+    drift_true = np.array([radians(0.5 / 60.) / 3600., radians(-0.3 / 60.) / 3600.])
+    noise = radians(2. / 3600.)
+    estimator = DriftEstimator(c)
+    times = np.arange(0., 7200., 300.)
+    for index, time_seconds in enumerate(times):
+        correction = drift_true * time_seconds + rng.normal(0., noise, 2)
+        if index == 10:
+            correction += radians(30. / 3600.)
+        estimator.add_point(1.5e9 + time_seconds, correction[0], correction[1])
+
+    # Conversion from radians per second to arc minutes per hour.
+    to_arcmin_hour = degrees(1.) * 60. * 3600.
+    result = estimator.fit()
+    two_point = (estimator.corrections[-1] - estimator.corrections[0]) / (
+            estimator.times[-1] - estimator.times[0])
+    print("True drift (arc min/hour):      " + str(np.round(drift_true * to_arcmin_hour, 4)))
+    print("Fitted drift (arc min/hour):    " + str(
+        np.round(result['drift'] * to_arcmin_hour, 4)) + " +/- " + str(
+        np.round(result['error'] * to_arcmin_hour, 4)) + ", outliers: " + str(result['outliers']))
+    print("Two-point drift (arc min/hour): " + str(np.round(two_point * to_arcmin_hour, 4)))
@@ -31,7 +31,7 @@ import matplotlib.pyplot as plt
 from PIL.Image import fromarray
 from configuration import Configuration
 from miscellaneous import Miscellaneous
-from numpy import ndarray, zeros_like, count_nonzero
+from numpy import ndarray, zeros, zeros_like, count_nonzero, hypot, uint8
 from sklearn.cluster import DBSCAN
 from socket_client import SocketClient, SocketClientDebug
 
@@ -136,15 +136,11 @@ class ImageShift:
 
         try:
             if self.configuration.camera_debug:
-                # For debugging purposes: use stored image (already compressed) from observation run
-                # Begin with first stored image for every autoalignment initialization.
+                # For debugging purposes: Begin with first stored image for every autoalignment
+                # initialization.
                 self.camera_socket.image_counter = 0
-                (reference_image_array, width, height,
-                 dynamic) = self.camera_socket.acquire_still_image(1)
-            else:
-                # Capture the reference image which shows perfect alignment, apply compression.
-                (reference_image_array, width, height,
-                 dynamic) = self.camera_socket.acquire_still_image(self.compression_factor)
+            # Capture the reference image which shows perfect alignment.
+            reference_image_array = self.acquire_image()
 
             # Normalize brightness and contrast, and determine keypoints and their descriptors.
             (self.reference_image_array, self.reference_image, self.reference_image_kp,
@@ -160,6 +156,26 @@ class ImageShift:
             plt.imshow(img)
             plt.show()
 
+    def acquire_image(self):
+        """
+        Capture a still image through the camera_socket. The image is compressed such that the
+        overlap between tiles is resolved in "pixels_in_overlap_width" pixels.
+
+        :return: Numpy array with the image as produced by the camera object
+        """
+
+        try:
+            if self.configuration.camera_debug:
+                # For debugging purposes: use stored image (already compressed) from observation run
+                (image_array, width, height, dynamic) = self.camera_socket.acquire_still_image(1)
+            else:
+                # Acquire a still image, apply compression.
+                (image_array, width, height,
+                 dynamic) = self.camera_socket.acquire_still_image(self.compression_factor)
+        except:
+            raise RuntimeError("Acquisition of still image failed.")
+        return image_array
+
     def normalize_and_analyze_image(self, image_array, filename_appendix):
         """
         For an image array (as produced by the camera), optimize brightness and contrast. Store the
@@ -173,6 +189,22 @@ class ImageShift:
         keypoints, and the keypoint descriptors.
         """
 
+        (normalized_image_array, normalized_image) = self.normalize_image(image_array,
+                                                                          filename_appendix)
+        (normalized_image_kp, normalized_image_des) = self.analyze_image(normalized_image_array)
+        return normalized_image_array, normalized_image, normalized_image_kp, normalized_image_des
+
+    def normalize_image(self, image_array, filename_appendix):
+        """
+        For an image array (as produced by the camera), optimize brightness and contrast, and store
+        the image in the reference image directory.
+
+        :param image_array: Numpy array with image as produced by the camera object.
+        :param filename_appendix: String to be appended to filename. The filename begins with
+        the current time (hours, minutes, seconds) for later reference.
+        :return: tuple with two objects: the normalized image array and the image object.
+        """
+
         # height, width = image_array.shape[:2]
 
         # Optimize the contrast in the image.
@@ -189,12 +221,24 @@ class ImageShift:
         if self.configuration.protocol_level > 2:
             Miscellaneous.protocol("Still image '" + filename_appendix +
                                    " captured for auto-alignment.")
+        return normalized_image_array, normalized_image
+
+    def analyze_image(self, normalized_image_array, mask=None):
+        """
+        Use ORB for keypoint detection and descriptor computation in a normalized image.
+
+        :param normalized_image_array: Numpy array with normalized image
+        :param mask: optional Numpy array (uint8) of the image shape. If given, keypoints are only
+        detected where the mask is non-zero.
+        :return: tuple with two objects: the keypoints and the keypoint descriptors.
+        """
+
         # Use the ORB for keypoint detection
-        normalized_image_kp = self.orb.detect(normalized_image_array, None)
+        normalized_image_kp = self.orb.detect(normalized_image_array, mask)
         # Compute the descriptors with ORB
         normalized_image_kp, normalized_image_des = self.orb.compute(normalized_image_array,
                                                                      normalized_image_kp)
-        return normalized_image_array, normalized_image, normalized_image_kp, normalized_image_des
+        return normalized_image_kp, normalized_image_des
 
     def build_filename(self):
         """
@@ -219,18 +263,7 @@ class ImageShift:
 
         filename_appendix = "alignment_image-{0:0>3}.pgm".format(self.alignment_image_counter)
 
-        try:
-            if self.configuration.camera_debug:
-                # For debugging purposes: use stored image (already compressed) from observation run
-                (shifted_image_array, width, height,
-                 dynamic) = self.camera_socket.acquire_still_image(1)
-            else:
-                # Acquire a still image, apply compression.
-                (shifted_image_array, width, height,
-                 dynamic) = self.camera_socket.acquire_still_image(self.compression_factor)
-
-        except:
-            raise RuntimeError("Acquisition of still image failed.")
+        shifted_image_array = self.acquire_image()
 
         try:
             # Normalize and analyze the image.
@@ -240,9 +273,114 @@ class ImageShift:
         except:
             raise RuntimeError("Still image normalization failed.")
 
+        return self.shift_between(self.reference_image_array, self.reference_image_kp,
+                                  self.reference_image_des, self.shifted_image_array,
+                                  self.shifted_image_kp, self.shifted_image_des)
+
+    def capture_tile_image(self, tile_index):
+        """
+        Take an image through the camera_socket at the position of a panorama tile, and normalize
+        it. The image can be used later to measure the pointing at a neighboring tile (see method
+        "tile_shift").
+
+        :param tile_index: index of the tile (used in the filename only)
+        :return: Numpy array with the normalized image
+        """
+
+        image_array = self.acquire_image()
+        try:
+            (normalized_image_array, normalized_image) = self.normalize_image(
+                image_array, "tile_image-{0:0>3}.pgm".format(tile_index))
+        except:
+            raise RuntimeError("Still image normalization failed.")
+        return normalized_image_array
+
+    @staticmethod
+    def overlap_mask(shape, shift_x, shift_y, margin):
+        """
+        Compute a mask for the part of an image which is also contained in a second image. The
+        second image is taken with the telescope pointing moved such that image features appear
+        shifted by (shift_x, shift_y) pixels.
+
+        :param shape: shape of the image (pixels in y, pixels in x)
+        :param shift_x: shift of image features in x (pixels)
+        :param shift_y: shift of image features in y (pixels)
+        :param margin: the overlap region is widened by this number of pixels on all sides
+        :return: Numpy array (uint8) of the image shape, with 255 in the overlap region, 0 outside
+        """
+
+        (height, width) = shape[:2]
+        mask = zeros(shape[:2], dtype=uint8)
+        # A pixel (x, y) of the first image appears at (x + shift_x, y + shift_y) in the second.
+        x_min = int(max(-shift_x - margin, 0))
+        x_max = int(min(width - shift_x + margin, width))
+        y_min = int(max(-shift_y - margin, 0))
+        y_max = int(min(height - shift_y + margin, height))
+        if x_min < x_max and y_min < y_max:
+            mask[y_min:y_max, x_min:x_max] = 255
+        return mask
+
+    def tile_shift(self, reference_image_array, expected_shift, search_radius):
+        """
+        Take an image through the camera_socket, and compute its shift as compared to the image of
+        a neighboring tile. The two images only have the overlap region between tiles in common.
+        Therefore, keypoints are only detected in the parts of the images which are expected to
+        overlap, and only matches with a shift close to the expected shift are used.
+
+        :param reference_image_array: normalized image of the neighboring tile
+        :param expected_shift: tuple with the expected shift in x and y (pixels)
+        :param search_radius: maximum deviation of a match from the expected shift (pixels)
+        :return: A tuple of five objects: the normalized image array, shift in x (radians), shift
+        in y (radians), number of keypoints with consistent shift values, number of outliers
+        """
+
+        filename_appendix = "alignment_image-{0:0>3}.pgm".format(self.alignment_image_counter)
+
+        shifted_image_array = self.acquire_image()
+
+        try:
+            # Normalize the image, and detect keypoints in the expected overlap regions.
+            (shifted_image_array, shifted_image) = self.normalize_image(shifted_image_array,
+                                                                        filename_appendix)
+            (reference_kp, reference_des) = self.analyze_image(
+                reference_image_array,
+                mask=self.overlap_mask(reference_image_array.shape, expected_shift[0],
+                                       expected_shift[1], search_radius))
+            (shifted_kp, shifted_des) = self.analyze_image(
+                shifted_image_array,
+                mask=self.overlap_mask(shifted_image_array.shape, -expected_shift[0],
+                                       -expected_shift[1], search_radius))
+        except:
+            raise RuntimeError("Still image normalization failed.")
+
+        (x_shift, y_shift, in_cluster, outliers) = self.shift_between(
+            reference_image_array, reference_kp, reference_des, shifted_image_array, shifted_kp,
+            shifted_des, expected_shift=expected_shift, search_radius=search_radius)
+        return shifted_image_array, x_shift, y_shift, in_cluster, outliers
+
+    def shift_between(self, reference_image_array, reference_kp, reference_des,
+                      shifted_image_array, shifted_kp, shifted_des, expected_shift=None,
+                      search_radius=None):
+        """
+        Compute the shift (linear translation) of an image as compared to a reference image from
+        the keypoints and descriptors of both images.
+
+        :param reference_image_array: normalized reference image (for debug display only)
+        :param reference_kp: keypoints of the reference image
+        :param reference_des: keypoint descriptors of the reference image
+        :param shifted_image_array: normalized shifted image (for debug display only)
+        :param shifted_kp: keypoints of the shifted image
+        :param shifted_des: keypoint descriptors of the shifted image
+        :param expected_shift: if given, tuple with the expected shift in x and y (pixels)
+        :param search_radius: if an expected shift is given, matches which deviate from it by more
+        than this number of pixels are discarded.
+        :return: A tuple of four objects: shift in x (radians), shift in y (radians), number of
+        keypoints with consistent shift values, number of outliers
+        """
+
         try:
             # Match descriptors.
-            matches = self.bf.match(self.reference_image_des, self.shifted_image_des)
+            matches = self.bf.match(reference_des, shifted_des)
         except:
             raise RuntimeError("Descriptor matching failed.")
 
@@ -251,9 +389,8 @@ class ImageShift:
 
         # Draw first 10 matches.
         if self.debug:
-            img3 = cv2.drawMatches(self.reference_image_array, self.reference_image_kp,
-                                   self.shifted_image_array, self.shifted_image_kp, matches[:10],
-                                   None, flags=2)
+            img3 = cv2.drawMatches(reference_image_array, reference_kp, shifted_image_array,
+                                   shifted_kp, matches[:10], None, flags=2)
             plt.imshow(img3), plt.show()
 
         # Set up a matrix containing for all matches the pixel shifts in x and y.
@@ -261,10 +398,13 @@ class ImageShift:
         for m in range(len(matches)):
             reference_index = matches[m].queryIdx
             shifted_index = matches[m].trainIdx
-            x_matrix[m][0] = self.shifted_image_kp[shifted_index].pt[0] - \
-                             self.reference_image_kp[reference_index].pt[0]
-            x_matrix[m][1] = self.shifted_image_kp[shifted_index].pt[1] - \
-                             self.reference_image_kp[reference_index].pt[1]
+            x_matrix[m][0] = shifted_kp[shifted_index].pt[0] - reference_kp[reference_index].pt[0]
+            x_matrix[m][1] = shifted_kp[shifted_index].pt[1] - reference_kp[reference_index].pt[1]
+
+        # If the shift is known approximately, discard matches far away from it.
+        if expected_shift is not None:
+            x_matrix = x_matrix[hypot(x_matrix[:, 0] - expected_shift[0],
+                                      x_matrix[:, 1] - expected_shift[1]) <= search_radius]
 
         try:
             # Use DBSCAN to find the cluster with consistent shifts. Set the cluster radius and
@@ -283,7 +423,7 @@ class ImageShift:
         # Compute the average shift for all matches within the cluster.
         x_shift = 0.
         y_shift = 0.
-        for m in range(len(matches)):
+        for m in range(len(x_matrix)):
             if labels[m] == 0:
                 x_shift += x_matrix[m][0]
                 y_shift += x_matrix[m][1]
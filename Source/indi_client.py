@@ -20,36 +20,141 @@ along with MPM.  If not, see <http://www.gnu.org/licenses/>.
 
 """
 
+import threading
+import time
+
 import PyIndi
 
 
 class IndiClient(PyIndi.BaseClient):
+    """
+    The INDI client receives all property updates from the INDI server through callbacks in a
+    separate thread. The callbacks store the time and contents of each update in a state cache
+    and notify a condition variable. Other threads wait on this condition for a property to be
+    defined or updated, instead of polling the device.
+
+    """
+
     def __init__(self, device_list, device_name_list):
         super(IndiClient, self).__init__()
         self.device_list = device_list
         self.device_name_list = device_name_list
+        # The state cache: For each (device name, property name) an entry with the time
+        # (time.monotonic) and number of updates received, the values (number vectors only), and
+        # a flag telling if the property is busy (e.g. the mount is slewing).
+        self.condition = threading.Condition()
+        self.properties = {}
+        self.server_connected = False
+
+    def update_property(self, device_name, property_name, values=None, busy=False):
+        """
+        Store a property update in the state cache and wake up all waiting threads.
+
+        :param device_name: name of the INDI device
+        :param property_name: name of the property
+        :param values: tuple with the values of a number vector, None otherwise
+        :param busy: True if the property state is "busy"
+        :return: -
+        """
+
+        with self.condition:
+            entry = self.properties.get((device_name, property_name))
+            count = entry['count'] + 1 if entry is not None else 0
+            self.properties[(device_name, property_name)] = {'time': time.monotonic(),
+                                                             'count': count, 'values': values,
+                                                             'busy': busy}
+            self.condition.notify_all()
+
+    def lookup_property(self, device_name, property_name):
+        """
+        Look up the last update of a property in the state cache.
+
+        :param device_name: name of the INDI device
+        :param property_name: name of the property
+        :return: cache entry (dictionary with keys 'time', 'count', 'values', 'busy'), or None if
+                 the property is not defined
+        """
+
+        with self.condition:
+            return self.properties.get((device_name, property_name))
+
+    def wait_for(self, predicate, timeout):
+        """
+        Block until a condition is met. The condition is checked after every update received
+        from the INDI server.
+
+        :param predicate: function without arguments which returns True if the condition is met
+        :param timeout: maximum waiting time (seconds)
+        :return: True, if the condition is met, False if the timeout was reached
+        """
+
+        with self.condition:
+            return self.condition.wait_for(predicate, timeout)
+
+    def wait_for_property(self, device_name, property_name, timeout):
+        """
+        Block until a property is defined by the INDI server.
+
+        :param device_name: name of the INDI device
+        :param property_name: name of the property
+        :param timeout: maximum waiting time (seconds)
+        :return: True, if the property is defined, False if the timeout was reached
+        """
+
+        return self.wait_for(lambda: (device_name, property_name) in self.properties, timeout)
+
+    def wait_for_update(self, device_name, property_name, count, timeout):
+        """
+        Block until a property has been updated after a given update.
+
+        :param device_name: name of the INDI device
+        :param property_name: name of the property
+        :param count: update count (as stored in the cache entry) of the last update seen, -1 if
+                      no update has been seen
+        :param timeout: maximum waiting time (seconds)
+        :return: cache entry of the new update, or None if the timeout was reached
+        """
+
+        key = (device_name, property_name)
+        with self.condition:
+            if self.condition.wait_for(
+                    lambda: key in self.properties and self.properties[key]['count'] > count,
+                    timeout):
+                return self.properties[key]
+            return None
 
     def newDevice(self, d):
-        self.device_list.append(d)
-        self.device_name_list.append(d.getDeviceName())
+        with self.condition:
+            self.device_list.append(d)
+            self.device_name_list.append(d.getDeviceName())
+            self.condition.notify_all()
 
     def newProperty(self, p):
-        pass
+        # For number vectors, the initial values are stored as well.
+        if p.getType() == PyIndi.INDI_NUMBER:
+            nvp = p.getNumber()
+            self.update_property(p.getDeviceName(), p.getName(),
+                                 tuple(number.value for number in nvp), nvp.s == PyIndi.IPS_BUSY)
+        else:
+            self.update_property(p.getDeviceName(), p.getName())
 
     def removeProperty(self, p):
-        pass
+        with self.condition:
+            self.properties.pop((p.getDeviceName(), p.getName()), None)
+            self.condition.notify_all()
 
     def newBLOB(self, bp):
         pass
 
     def newSwitch(self, svp):
-        pass
+        self.update_property(svp.device, svp.name, busy=svp.s == PyIndi.IPS_BUSY)
 
     def newNumber(self, nvp):
-        pass
+        self.update_property(nvp.device, nvp.name, tuple(number.value for number in nvp),
+                             nvp.s == PyIndi.IPS_BUSY)
 
     def newText(self, tvp):
-        pass
+        self.update_property(tvp.device, tvp.name)
 
     def newLight(self, lvp):
         pass
@@ -58,7 +163,11 @@ class IndiClient(PyIndi.BaseClient):
         pass
 
     def serverConnected(self):
-        pass
+        with self.condition:
+            self.server_connected = True
+            self.condition.notify_all()
 
     def serverDisconnected(self, code):
-        pass
+        with self.condition:
+            self.server_connected = False
+            self.condition.notify_all()
@@ -0,0 +1,230 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (c) 2016 Rolf Hempel, rolf6419@gmx.de
+
+This file is part of the MoonPanoramaMaker tool (MPM).
+https://github.com/Rolf-Hempel/MoonPanoramaMaker
+
+MPM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with MPM.  If not, see <http://www.gnu.org/licenses/>.
+
+
+This module contains two classes: "Instruction" is a request to the telescope thread. It carries
+the parameters of the request and serves as a future object on which the requesting thread can
+wait for the result.
+
+"InstructionQueue" is the thread-safe queue through which instructions are passed to the
+telescope thread. Instructions are served in the order of their priority, and in the order of
+their arrival within the same priority. Instructions can be scheduled with a delay, which is used
+for repeated instructions (e.g. guiding).
+
+"""
+
+import heapq
+import threading
+import time
+from itertools import count
+
+from exceptions import TelescopeException
+
+
+class Instruction:
+    """
+    A request to the telescope thread. The parameters are accessed by indexing the instruction
+    with the parameter name. When the telescope thread has executed the instruction, it sets the
+    result (or the error) with method "finish" (or "fail"). The requesting thread waits for this
+    with method "wait".
+
+    """
+
+    # Priorities of instructions: Urgent instructions (e.g. stopping a motion) are executed before
+    # all normal instructions waiting in the queue.
+    PRIORITY_URGENT = 0
+    PRIORITY_NORMAL = 1
+
+    def __init__(self, name, priority=PRIORITY_NORMAL, **parameters):
+        """
+        Create a new instruction.
+
+        :param name: name of the instruction type, e.g. "slew to"
+        :param priority: one of PRIORITY_URGENT, PRIORITY_NORMAL
+        :param parameters: parameters of the instruction
+        """
+
+        self.name = name
+        self.priority = priority
+        self.parameters = parameters
+        # The instruction is removed from the queue without execution if it is cancelled.
+        self.cancelled = False
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def __getitem__(self, key):
+        return self.parameters[key]
+
+    def finish(self, result=None):
+        """
+        Signal that the instruction has been executed, and wake up the waiting thread.
+
+        :param result: result of the instruction (e.g. the telescope position looked up)
+        :return: -
+        """
+
+        self.result = result
+        self.done.set()
+
+    def fail(self, error):
+        """
+        Signal that the execution of the instruction failed. The error is raised in the waiting
+        thread.
+
+        :param error: exception object
+        :return: -
+        """
+
+        self.error = error
+        self.done.set()
+
+    def wait(self, timeout=None):
+        """
+        Block until the instruction has been executed.
+
+        :param timeout: maximum waiting time (seconds), None for no limit
+        :return: result of the instruction
+        """
+
+        if not self.done.wait(timeout):
+            raise TelescopeException("Timeout in telescope instruction '" + self.name + "'.")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class InstructionQueue:
+    """
+    Thread-safe priority queue of instructions for the telescope thread. Instructions which are
+    due are kept in a heap ordered by priority and arrival, delayed instructions in a second heap
+    ordered by the time when they become due. The telescope thread blocks in method "get" until an
+    instruction is due, so no polling is necessary.
+
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty queue.
+
+        """
+
+        self.condition = threading.Condition()
+        # Heap entries: (priority, sequence number, instruction).
+        self.ready = []
+        # Heap entries: (due time, sequence number, instruction).
+        self.delayed = []
+        # The sequence number keeps the order of arrival within the same priority (or due time).
+        self.sequence = count()
+
+    def put(self, instruction, delay=0.):
+        """
+        Insert an instruction into the queue.
+
+        :param instruction: Instruction object
+        :param delay: time (seconds) after which the instruction is due
+        :return: the instruction
+        """
+
+        with self.condition:
+            if delay > 0.:
+                heapq.heappush(self.delayed,
+                               (time.monotonic() + delay, next(self.sequence), instruction))
+            else:
+                heapq.heappush(self.ready,
+                               (instruction.priority, next(self.sequence), instruction))
+            self.condition.notify()
+        return instruction
+
+    def get(self):
+        """
+        Remove the next due instruction from the queue. Block until an instruction is due.
+        Cancelled instructions are skipped.
+
+        :return: Instruction object
+        """
+
+        with self.condition:
+            while True:
+                # Move delayed instructions which are due now into the heap of due instructions.
+                now = time.monotonic()
+                while self.delayed and self.delayed[0][0] <= now:
+                    (due_time, sequence, instruction) = heapq.heappop(self.delayed)
+                    heapq.heappush(self.ready, (instruction.priority, sequence, instruction))
+                while self.ready:
+                    instruction = heapq.heappop(self.ready)[2]
+                    if not instruction.cancelled:
+                        return instruction
+                # Wait for a new instruction or the next delayed instruction to become due.
+                if self.delayed:
+                    self.condition.wait(self.delayed[0][0] - now)
+                else:
+                    self.condition.wait()
+
+    def cancel(self, name):
+        """
+        Cancel all instructions of a given type which are waiting in the queue.
+
+        :param name: name of the instruction type
+        :return: -
+        """
+
+        with self.condition:
+            for (key, sequence, instruction) in self.ready + self.delayed:
+                if instruction.name == name:
+                    instruction.cancelled = True
+                    # Nobody should wait for a cancelled instruction, but release waiters anyway.
+                    instruction.finish()
+
+
+if __name__ == "__main__":
+    # Simulate a telescope thread which repeats a "continue guiding" instruction every 0.5
+    # seconds, and measure the latency of urgent and normal requests issued meanwhile.
+    instruction_queue = InstructionQueue()
+
+    def serve():
+        while True:
+            instruction = instruction_queue.get()
+            if instruction.name == "terminate":
+                break
+            elif instruction.name == "continue guiding":
+                instruction_queue.put(instruction, delay=0.5)
+            elif instruction.name == "stop guiding":
+                instruction_queue.cancel("continue guiding")
+                instruction.finish()
+            else:
+                instruction.finish(time.monotonic())
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    instruction_queue.put(Instruction("continue guiding"))
+    for index in range(3):
+        time.sleep(0.3)
+        start = time.monotonic()
+        latency = instruction_queue.put(Instruction("lookup tel position")).wait(1.) - start
+        print("Latency of request " + str(index) + " (ms): " + str(round(latency * 1000., 3)))
+    instruction_queue.put(
+        Instruction("stop guiding", priority=Instruction.PRIORITY_URGENT)).wait(1.)
+    print("Instructions left in the queue: " + str(
+        len(instruction_queue.ready) + len(instruction_queue.delayed)) + ", cancelled: " + str(
+        len([entry for entry in instruction_queue.ready + instruction_queue.delayed if
+             entry[2].cancelled])))
+    instruction_queue.put(Instruction("terminate"))
+    thread.join()
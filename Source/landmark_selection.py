@@ -75,7 +75,6 @@ class LandmarkSelection:
         :return: Offsets in (RA, DE) of landmark relative to the center of the moon
         """
         me.update(date_time)
-        me.compute_libration()
         myapp = EditLandmarks(self.selected_landmark, self.landmarks, me.colong)
         myapp.exec_()
         if myapp.selected_landmark != "":
@@ -33,19 +33,20 @@ import pytz
 
 setup(windows=[{"script": "moon_panorama_maker.py"}],
       options={"py2exe": {
-          "includes": ["alignment", "camera", "camera_configuration_delete",
+          "includes": ["alignment", "alignment_scheduler", "camera", "camera_configuration_delete",
                        "camera_configuration_editor",
                        "camera_configuration_input", "camera_delete_dialog",
                        "camera_dialog", "compute_drift_rate", "configuration",
                        "configuration_dialog", "configuration_editor",
-                       "DisplayLandmark",
+                       "DisplayLandmark", "drift_estimator",
                        "drift_rate_dialog", "edit_landmarks", "image_shift",
-                       "input_error_dialog", "landmark_selection",
+                       "input_error_dialog", "instruction_queue", "landmark_selection",
                        "matplotlibwidget",
-                       "miscellaneous", "moon_ephem", "qtgui",
-                       "show_input_error", "show_landmark", "socket_client",
+                       "miscellaneous", "moon_ephem", "mount_model", "pointing_filter", "qtgui",
+                       "session_clock", "settle_detector",
+                       "session_journal", "show_input_error", "show_landmark", "socket_client",
                        "telescope",
-                       "tile_constructor", "tile_number_input_dialog",
+                       "tile_constructor", "tile_layout_renderer", "tile_number_input_dialog",
                        "tile_visualization", "ViewLandmarks", "workflow",
                        "scipy.sparse.csgraph._validation", "scipy.special._ufuncs_cxx",
                        "sklearn.utils.lgamma", "sklearn.neighbors.typedefs",
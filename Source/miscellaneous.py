@@ -187,6 +187,46 @@ class Miscellaneous:
         delta_de_rot = (dx * sin(pos_angle) + dy * cos(pos_angle))
         return [delta_ra_rot, delta_de_rot]
 
+    @staticmethod
+    def rotate_inverse(pos_angle, de_center, scale_factor, flip_x, flip_y, delta_ra, delta_de):
+        """
+        Inverse operation to method "rotate": Transform equatorial displacements
+        (diff_RA, diff_DE) back into vector (x,y).
+
+        :param pos_angle: angle between origin and target coordinate systems (counterclockwise)
+        :param de_center: declination (used for approximate correction of RA displacement)
+        :param scale_factor: scale factor between origin and target coordinate systems
+        :param flip_x: +1. if x axis is pointing to the right, -1. otherwise
+        :param flip_y: +1. if y axis is pointing to the right, -1. otherwise
+        :param delta_ra: displacement in RA
+        :param delta_de: displacement in DE
+        :return: tuple with coordinates (x, y)
+        """
+
+        # Undo the declination correction, then rotate back by angle pos_angle.
+        delta_ra_cos = delta_ra * cos(de_center)
+        dx = delta_de * sin(pos_angle) - delta_ra_cos * cos(pos_angle)
+        dy = delta_ra_cos * sin(pos_angle) + delta_de * cos(pos_angle)
+        # Undo scaling and flipping.
+        return [dx / (scale_factor * flip_x), dy / (scale_factor * flip_y)]
+
+    @staticmethod
+    def slew_time(delta_ra, delta_de, slew_speed, slew_overhead):
+        """
+        Estimate the time needed by the telescope mount to move between two positions. Both axes
+        are assumed to move simultaneously with constant speed, so the axis with the larger
+        displacement determines the duration.
+
+        :param delta_ra: displacement in right ascension (radians)
+        :param delta_de: displacement in declination (radians)
+        :param slew_speed: speed of the mount axes (radians per second)
+        :param slew_overhead: constant time added to each slew for acceleration and deceleration
+                              (seconds)
+        :return: estimated slew time (seconds)
+        """
+
+        return max(abs(delta_ra), abs(delta_de)) / slew_speed + slew_overhead
+
 
 if __name__ == "__main__":
     s = '    False   '
@@ -22,12 +22,120 @@ along with MPM.  If not, see <http://www.gnu.org/licenses/>.
 
 import datetime
 import time
-from math import asin, atan2, sin, cos, acos, pi, sqrt, radians, degrees
+from math import asin, atan2, sin, cos, acos, pi, radians, degrees, ceil
 
 import ephem
+import numpy as np
 import pytz
+from numpy.polynomial import chebyshev
 
 import configuration
+from miscellaneous import Miscellaneous
+from session_clock import SessionClock
+
+
+class EphemerisTable:
+    """
+    The EphemerisTable class approximates a set of ephemeris quantities (e.g. the positions of
+    the sun and the moon) by piecewise Chebyshev polynomials over a time window. The expensive
+    ephemeris computation is done only once at the Chebyshev nodes of each time segment. Afterwards
+    the quantities can be evaluated for any time within the window at very low cost.
+
+    """
+
+    def __init__(self, sample_function, angle_indices, start, duration, segment_length, degree):
+        """
+        Sample the quantities at the Chebyshev nodes of all segments and compute the polynomial
+        coefficients.
+
+        :param sample_function: function which for a given PyEphem date returns the list of
+                                quantities to be approximated
+        :param angle_indices: indices of quantities which are angles (radians) and may wrap around
+                              at 2*pi. They are unwrapped before the polynomial fit.
+        :param start: begin of the time window (PyEphem date, i.e. days)
+        :param duration: length of the time window (days)
+        :param segment_length: length of a single polynomial segment (days)
+        :param degree: degree of the Chebyshev polynomials
+        """
+
+        self.start = start
+        self.segment_length = segment_length
+        self.n_segments = max(1, int(ceil(duration / segment_length)))
+        self.end = start + self.n_segments * segment_length
+        self.degree = degree
+
+        # Chebyshev nodes on the interval [-1., 1.], in ascending order.
+        nodes = np.cos(np.pi * (np.arange(degree + 1)[::-1] + 0.5) / (degree + 1))
+
+        # For each segment, sample all quantities at the nodes. The resulting coefficient array
+        # has the shape (n_segments, degree + 1, number of quantities).
+        coefficients = []
+        for segment in range(self.n_segments):
+            segment_center = start + (segment + 0.5) * segment_length
+            samples = np.array([sample_function(segment_center + 0.5 * segment_length * node)
+                                for node in nodes])
+            # Remove jumps by 2*pi in angular quantities, so that they can be fit smoothly.
+            samples[:, angle_indices] = np.unwrap(samples[:, angle_indices], axis=0)
+            coefficients.append(chebyshev.chebfit(nodes, samples, degree))
+        self.coefficients = np.array(coefficients)
+
+        # Precompute the coefficients of the first and second time derivatives. Derivatives are
+        # taken with respect to the normalized segment variable x in [-1., 1.], so they have to
+        # be scaled by the factor dx/dt = 2 / segment_length (per day) when evaluated.
+        self.derivative_coefficients = [self.coefficients,
+                                        chebyshev.chebder(self.coefficients, m=1, axis=1),
+                                        chebyshev.chebder(self.coefficients, m=2, axis=1)]
+
+    def covers(self, date):
+        """
+        Check if a given time is contained in the time window of the table.
+
+        :param date: PyEphem date (days)
+        :return: True, if the table can be evaluated for this time. Otherwise False.
+        """
+
+        return self.start <= date <= self.end
+
+    def evaluate(self, date, derivative=0):
+        """
+        Evaluate all quantities (or their time derivatives) for a given time within the time
+        window.
+
+        :param date: PyEphem date (days)
+        :param derivative: order of the time derivative (0: values, 1: rates, 2: accelerations)
+        :return: Numpy array with the values of all quantities (derivatives are per day)
+        """
+
+        # Find the segment which contains the date, and map the date onto the interval [-1., 1.].
+        segment = min(int((date - self.start) / self.segment_length), self.n_segments - 1)
+        x = 2. * (date - self.start - segment * self.segment_length) / self.segment_length - 1.
+        return chebyshev.chebval(x, self.derivative_coefficients[derivative][segment]) * (
+                2. / self.segment_length) ** derivative
+
+    def evaluate_array(self, dates, derivative=0):
+        """
+        Evaluate all quantities (or their time derivatives) for an array of times within the time
+        window. The polynomials are evaluated for all times at once with the Clenshaw recurrence.
+
+        :param dates: Numpy array of PyEphem dates (days)
+        :param derivative: order of the time derivative (0: values, 1: rates, 2: accelerations)
+        :return: Numpy array of shape (len(dates), number of quantities)
+        """
+
+        dates = np.asarray(dates, dtype=float)
+        segments = np.clip(((dates - self.start) / self.segment_length).astype(int), 0,
+                           self.n_segments - 1)
+        x = (2. * (dates - self.start - segments * self.segment_length) / self.segment_length -
+             1.)[:, np.newaxis]
+
+        # Look up the coefficients of the segment for each time. Shape: (len(dates), degree + 1,
+        # number of quantities).
+        coefficients = self.derivative_coefficients[derivative][segments]
+        b1 = np.zeros((len(dates), coefficients.shape[2]))
+        b2 = np.zeros_like(b1)
+        for k in range(coefficients.shape[1] - 1, 0, -1):
+            b1, b2 = coefficients[:, k, :] + 2. * x * b1 - b2, b1
+        return (coefficients[:, 0, :] + x * b1 - b2) * (2. / self.segment_length) ** derivative
 
 
 class MoonEphem:
@@ -35,9 +143,32 @@ class MoonEphem:
     The MoonEphem class computes the positions of the sun and the moon in the sky, the position
     angles of the sunlit phase and of the rotational axis, and the topocentric libration angles in
     longitude and latitude. For algorithmic details refer to the user's manual.
+
+    The accurate computations with PyEphem are done only when an ephemeris table is fitted for a
+    time window (of "ephemeris_table_hours" length). All updates within this window evaluate the
+    Chebyshev polynomials of the table. If a time outside the window is requested, a new table
+    is fitted automatically.
     
     """
 
+    # Indices of the quantities stored in the ephemeris table.
+    MOON_RA = 0
+    MOON_DE = 1
+    MOON_RADIUS = 2
+    MOON_DISTANCE = 3
+    SUN_RA = 4
+    SUN_DE = 5
+    SUN_DISTANCE = 6
+    ASTROMETRIC_LIB_LAT = 7
+    ASTROMETRIC_LIB_LONG = 8
+    COLONG = 9
+    TOPOCENTRIC_LIB_LAT = 10
+    TOPOCENTRIC_LIB_LONG = 11
+    POS_ROT_NORTH = 12
+    # Quantities which are angles and can wrap around at 2*pi.
+    ANGLE_INDICES = [MOON_RA, SUN_RA, ASTROMETRIC_LIB_LONG, COLONG, TOPOCENTRIC_LIB_LONG,
+                     POS_ROT_NORTH]
+
     def __init__(self, configuration, date_time, debug=False):
         """
         Initialize the MoonEphem object.
@@ -63,7 +194,6 @@ class MoonEphem:
         self.utc = pytz.utc
 
         # Initialize instance variables.
-        self.moon = None
         self.ra = None
         self.de = None
         self.radius = None
@@ -78,19 +208,23 @@ class MoonEphem:
         self.topocentric_lib_long = None
         self.colong = None
         self.pos_rot_north = None
-        self.stored_ra = None
-        self.stored_de = None
-        self.stored_time = None
         self.sun_ra = None
         self.sun_de = None
-
-        # So far no position has been calculated. From the next call on, the previous position
-        # will be used to compute the speed of the moon in (RA,DE) (finite difference).
-        self.position_stored = False
-
-        # Set rates for the moon's motion per second in (RA,DE) to average values.
-        self.rate_ra = radians(38. / 60.) / 3600.
-        self.rate_de = 0.
+        self.moon_distance = None
+        self.sun_distance = None
+
+        # The ephemeris table is fitted at the first update. If the UTC offset of the local time
+        # zone does not change within the table window, it is stored to avoid time zone
+        # computations in every update.
+        self.table = None
+        self.table_utc_offset = None
+
+        # Rates (radians per second) and accelerations (radians per second squared) of the moon's
+        # motion in (RA,DE). They are set by each update.
+        self.rate_ra = None
+        self.rate_de = None
+        self.accel_ra = None
+        self.accel_de = None
 
         # Compute the coordinates for date_time.
         self.update(date_time)
@@ -108,6 +242,55 @@ class MoonEphem:
             self.sun_ra - self.ra)) / sin(self.elongation)
         return atan2(sinsd, cossd)
 
+    @staticmethod
+    def phase_geometry(ra, de, sun_ra, sun_de, moon_distance, sun_distance):
+        """
+        Compute the elongation, the position angle of the sun and the phase angle of the moon from
+        the positions and distances of sun and moon. All arguments can be scalars or Numpy arrays.
+
+        :param ra: right ascension of the moon (radians)
+        :param de: declination of the moon (radians)
+        :param sun_ra: right ascension of the sun (radians)
+        :param sun_de: declination of the sun (radians)
+        :param moon_distance: distance earth-moon (AU)
+        :param sun_distance: distance earth-sun (AU)
+        :return: (elongation, sun's position angle, phase angle), all in radians
+        """
+
+        # Compute the distance between sun and moon in the sky.
+        elongation = np.arccos(
+            np.sin(de) * np.sin(sun_de) + np.cos(de) * np.cos(sun_de) * np.cos(sun_ra - ra))
+
+        # Compute the position angle of the point on the moon limb pointing at the sun.
+        sinsd = (np.sin(sun_ra - ra) * np.cos(sun_de) / np.sin(elongation))
+        cossd = (np.sin(sun_de) * np.cos(de) - np.cos(sun_de) * np.sin(de) * np.cos(
+            sun_ra - ra)) / np.sin(elongation)
+        pos_angle_sun = np.arctan2(sinsd, cossd)
+
+        # Compute the phase angle of the sunlit moon phase.
+        c = np.sqrt(sun_distance ** 2 + moon_distance ** 2 - 2. * sun_distance * moon_distance *
+                    np.cos(elongation))
+        sina = sun_distance * np.sin(elongation) / c
+        cosa = ((sun_distance ** 2 - c ** 2 - moon_distance ** 2) / (2. * c * moon_distance))
+        phase_angle = np.arctan2(sina, cosa)
+        return elongation, pos_angle_sun, phase_angle
+
+    @staticmethod
+    def posix_to_ephem_date(timestamps):
+        """
+        Translate UTC time stamps into PyEphem dates (days since 1899-12-31 12:00 UT).
+
+        :param timestamps: Numpy array of POSIX time stamps (seconds), or of numpy.datetime64
+                           values (UTC)
+        :return: Numpy array of PyEphem dates (float)
+        """
+
+        timestamps = np.atleast_1d(timestamps)
+        if np.issubdtype(timestamps.dtype, np.datetime64):
+            timestamps = (timestamps - np.datetime64('1970-01-01T00:00:00')) / np.timedelta64(
+                1, 's')
+        return np.asarray(timestamps, dtype=float) / 86400. + 25567.5
+
     def local_time_to_utc(self, date_time):
         """
         Convert local time to UTC.
@@ -118,99 +301,250 @@ class MoonEphem:
         loc_dt = self.tz.localize(date_time)
         return loc_dt.astimezone(self.utc)
 
-    def update(self, date_time):
+    def ephem_date(self, date_time):
         """
-        Compute accurate topocentric positions of sun and moon, the moon's phase angle and the
-        position angle of its sunlit phase. If a previous position was stored for a time within the
-        last two hours, the speed of the moon in (RA,DE) is computed as finite difference values.
-        
-        :param date_time: datetime object of current time
+        Translate a local datetime object into a PyEphem date. Within the window of the current
+        ephemeris table the stored UTC offset is used, otherwise the time zone is looked up.
+
+        :param date_time: local datetime object
+        :return: PyEphem date (UTC)
+        """
+
+        if self.table_utc_offset is not None:
+            date = ephem.Date(date_time - self.table_utc_offset)
+            if self.table.covers(date):
+                return date
+        return ephem.Date(self.local_time_to_utc(date_time))
+
+    def fit_ephemeris_table(self, date_time, hours=None):
+        """
+        Fit a new ephemeris table for a time window beginning shortly before the given time. This
+        is the only place where PyEphem is used for the positions of the sun and moon.
+
+        :param date_time: local datetime object of the (planned) session start
+        :param hours: length of the time window (hours). If None, the length is taken from the
+                      configuration object.
+        :return: -
+        """
+
+        if hours is None:
+            hours = self.configuration.ephemeris_table_hours
+        # Begin the window a little earlier, so that the current time is not on its boundary.
+        start = ephem.Date(self.local_time_to_utc(date_time)) - \
+            self.configuration.ephemeris_table_lead_hours / 24.
+        self.fit_ephemeris_table_window(start, hours / 24.)
+
+    def fit_ephemeris_table_window(self, start, duration):
+        """
+        Fit a new ephemeris table for a given time window in UTC.
+
+        :param start: begin of the time window (PyEphem date)
+        :param duration: length of the time window (days)
         :return: -
         """
 
-        # Translate time stamp into UTC. In debug mode compute the moon position for a fixed time
-        # (as defined in configuration.py).
+        self.table = EphemerisTable(self.sample_ephemeris, self.ANGLE_INDICES, start, duration,
+                                    self.configuration.ephemeris_table_segment_hours / 24.,
+                                    self.configuration.ephemeris_table_degree)
+
+        # If the time zone offset is the same at both ends of the window (no change between
+        # summer and winter time), store it for fast time conversions.
+        offset_start = self.utc.localize(ephem.Date(self.table.start).datetime()).astimezone(
+            self.tz).utcoffset()
+        offset_end = self.utc.localize(ephem.Date(self.table.end).datetime()).astimezone(
+            self.tz).utcoffset()
+        if offset_start == offset_end:
+            self.table_utc_offset = offset_start
+        else:
+            self.table_utc_offset = None
+
+        if self.configuration.protocol_level > 2:
+            Miscellaneous.protocol("Ephemeris table fitted, UT from " + str(
+                ephem.Date(self.table.start)) + " to " + str(ephem.Date(self.table.end)) + ".")
+
+    def sample_ephemeris(self, date):
+        """
+        Compute accurate positions of sun and moon and the libration angles for a given time with
+        PyEphem. The results are used as sampling points for the ephemeris table.
+
+        :param date: PyEphem date (UTC)
+        :return: list of quantities, ordered as defined by the index constants of this class
+        """
+
+        self.location_time.date = date
+        moon = ephem.Moon(self.location_time)
+        sun = ephem.Sun(self.location_time)
+        (topocentric_lib_lat, topocentric_lib_long, pos_rot_north) = self.topocentric_libration(
+            date, moon.ra, moon.dec)
+        return [moon.ra, moon.dec, moon.radius, moon.earth_distance, sun.ra, sun.dec,
+                sun.earth_distance, moon.libration_lat, moon.libration_long, moon.colong,
+                topocentric_lib_lat, topocentric_lib_long, pos_rot_north]
+
+    def table_date(self, date_time):
+        """
+        Translate the time of an update request into a PyEphem date, and make sure that the
+        ephemeris table covers it. In debug mode the fixed time (as defined in configuration.py)
+        is used instead.
+
+        :param date_time: local datetime object. If None, the current time of the session clock
+                          is used.
+        :return: PyEphem date (UTC)
+        """
+
         if self.debug:
             # Alternative date, used for first tests of auto-alignment:
             t = self.configuration.ephemeris_fixed_datetime
-            dt = datetime.datetime(t[0], t[1], t[2], t[3], t[4], t[5])
-            self.location_time.date = self.local_time_to_utc(dt)
+            date = self.ephem_date(datetime.datetime(t[0], t[1], t[2], t[3], t[4], t[5]))
+        elif date_time is None:
+            # The session clock provides UTC directly, no time zone conversion is necessary.
+            date = SessionClock.ephem_date()
         else:
-            self.location_time.date = self.local_time_to_utc(date_time)
-
-        # Compute the ephemeris using PyEphem.
-        self.moon = ephem.Moon(self.location_time)
-        s = ephem.Sun(self.location_time)
-        self.ra = self.moon.ra
-        self.de = self.moon.dec
-        self.radius = self.moon.radius
-        self.diameter = self.moon.radius * 2.
-        self.sun_ra = s.ra
-        self.sun_de = s.dec
+            date = self.ephem_date(date_time)
 
-        # Compute the distance between sun and moon in the sky.
-        self.elongation = acos(
-            sin(self.de) * sin(self.sun_de) + cos(self.de) * cos(self.sun_de) * cos(
-                self.sun_ra - self.ra))
+        # If the time is not covered by the current table, fit a new one first.
+        if self.table is None or not self.table.covers(date):
+            self.fit_ephemeris_table_window(
+                date - self.configuration.ephemeris_table_lead_hours / 24.,
+                self.configuration.ephemeris_table_hours / 24.)
+        return date
+
+    def update(self, date_time=None):
+        """
+        Compute accurate topocentric positions of sun and moon, the moon's phase angle and the
+        position angle of its sunlit phase. The speed and acceleration of the moon in (RA,DE) are
+        computed from the time derivatives of the ephemeris table.
+        
+        :param date_time: datetime object of current time. If None, the current time is taken
+                          from the session clock.
+        :return: -
+        """
 
-        # Compute the position angles of the point on the moon limb pointing at the sun,
-        # and of the North pole of the sunlit moon phase.
-        self.pos_angle_sun = self.sun_direction()
+        # Translate time stamp into UTC, and evaluate the ephemeris table.
+        date = self.table_date(date_time)
+        self.location_time.date = date
+        values = self.table.evaluate(date)
+
+        self.ra = values[self.MOON_RA] % (2. * pi)
+        self.de = values[self.MOON_DE]
+        self.radius = values[self.MOON_RADIUS]
+        self.diameter = self.radius * 2.
+        self.moon_distance = values[self.MOON_DISTANCE]
+        self.sun_ra = values[self.SUN_RA] % (2. * pi)
+        self.sun_de = values[self.SUN_DE]
+        self.sun_distance = values[self.SUN_DISTANCE]
+        self.astrometric_lib_lat = values[self.ASTROMETRIC_LIB_LAT]
+        self.astrometric_lib_long = (values[self.ASTROMETRIC_LIB_LONG] + pi) % (2. * pi) - pi
+        self.colong = values[self.COLONG] % (2. * pi)
+        self.topocentric_lib_lat = values[self.TOPOCENTRIC_LIB_LAT]
+        self.topocentric_lib_long = (values[self.TOPOCENTRIC_LIB_LONG] + pi) % (2. * pi) - pi
+        self.pos_rot_north = (values[self.POS_ROT_NORTH] + pi) % (2. * pi) - pi
+
+        # Compute the elongation, the position angles of the point on the moon limb pointing at
+        # the sun and of the North pole of the sunlit moon phase, and the phase angle.
+        (self.elongation, self.pos_angle_sun, self.phase_angle) = self.phase_geometry(
+            self.ra, self.de, self.sun_ra, self.sun_de, self.moon_distance, self.sun_distance)
         self.pos_angle_pole = self.pos_angle_sun + pi / 2.
 
-        c = sqrt(
-            s.earth_distance ** 2 + self.moon.earth_distance ** 2 - 2. * s.earth_distance *
-            self.moon.earth_distance * cos(self.elongation))
-        sina = s.earth_distance * sin(self.elongation) / c
-        cosa = ((s.earth_distance ** 2 - c ** 2 - self.moon.earth_distance ** 2) / (
-                2. * c * self.moon.earth_distance))
-        # Compute the phase angle of the sunlit moon phase.
-        self.phase_angle = atan2(sina, cosa)
-
-        # For the computation of the moon speed, the time in consecutive seconds must be known to
-        # better than a second. Therefore, add the fractional part and store the result in
-        # "current_time".
-        try:
-            fract = float(str(date_time)[19:24])
-        except:
-            fract = 0.
-        current_time = time.mktime(date_time.timetuple()) + fract
-
-        # If a previous position was stored, check if it's in the valid time range.
-        # The two times must be at least one second apart (for stability), and at most two hours.
-        if self.position_stored:
-            if 1. < abs(current_time - self.stored_time) < 7200.:
-                self.rate_ra = (self.ra - self.stored_ra) / (current_time - self.stored_time)
-                self.rate_de = (self.de - self.stored_de) / (current_time - self.stored_time)
-                # Replace the stored time stamp and coordinates with the current values.
-                self.stored_time = current_time
-                self.stored_ra = self.ra
-                self.stored_de = self.de
-        # There is no previous data point, store the current one.
-        else:
-            self.stored_ra = self.ra
-            self.stored_de = self.de
-            self.stored_time = current_time
-            self.position_stored = True
+        # Compute the moon's rates and accelerations in (RA,DE) analytically.
+        (self.rate_ra, self.rate_de, self.accel_ra, self.accel_de) = self.rates_at_date(date)
 
-    def compute_libration(self):
+    def rates(self, date_time=None):
         """
-        Compute topocentric libration angles and the position angle of the moon's rotational axis.
-        
-        :return: -
+        Compute the speed and acceleration of the moon in (RA,DE) for a given time. In contrast to
+        "update", no other instance variables are changed.
+
+        :param date_time: local datetime object. If None, the current time is taken from the
+                          session clock.
+        :return: (rate_ra, rate_de, accel_ra, accel_de), rates in radians/sec., accelerations in
+                 radians/sec.**2
         """
 
-        # Astrometric libration angles and the selenographic co-longitude of the sun are provided
-        # by PyEphem.
-        self.astrometric_lib_lat = self.moon.libration_lat
-        self.astrometric_lib_long = self.moon.libration_long
-        self.colong = self.moon.colong
+        return self.rates_at_date(self.table_date(date_time))
+
+    def rates_at_date(self, date):
+        """
+        Evaluate the first and second time derivatives of the moon's (RA,DE) in the ephemeris
+        table. The table must cover the given time.
+
+        :param date: PyEphem date (UTC)
+        :return: (rate_ra, rate_de, accel_ra, accel_de), rates in radians/sec., accelerations in
+                 radians/sec.**2
+        """
+
+        # The table derivatives are per day. Convert them to seconds.
+        rates = self.table.evaluate(date, derivative=1) / 86400.
+        accelerations = self.table.evaluate(date, derivative=2) / 86400. ** 2
+        return (rates[self.MOON_RA], rates[self.MOON_DE], accelerations[self.MOON_RA],
+                accelerations[self.MOON_DE])
+
+    def update_batch(self, timestamps):
+        """
+        Compute the ephemeris quantities of "update" (including libration) for an array of times
+        at once. This is meant for planning (e.g. phase changes or the illumination of landmarks
+        during a night). The debug setting of fixed ephemeris time is not applied. Instance
+        variables (except the ephemeris table) are not changed.
+
+        If the times are not covered by the current ephemeris table, a new table is fitted which
+        covers all of them.
+
+        :param timestamps: Numpy array of POSIX time stamps (UTC seconds), or of numpy.datetime64
+                           values (UTC)
+        :return: dictionary of Numpy arrays (radians, radians/sec. for rates). The keys are the
+                 names of the corresponding MoonEphem instance variables.
+        """
+
+        dates = self.posix_to_ephem_date(timestamps)
+        first = dates.min()
+        last = dates.max()
+        if self.table is None or not (self.table.covers(first) and self.table.covers(last)):
+            start = first - self.configuration.ephemeris_table_lead_hours / 24.
+            self.fit_ephemeris_table_window(start, max(
+                last - start + self.configuration.ephemeris_table_lead_hours / 24.,
+                self.configuration.ephemeris_table_hours / 24.))
+
+        values = self.table.evaluate_array(dates)
+        rates = self.table.evaluate_array(dates, derivative=1) / 86400.
+        result = {}
+        result['ra'] = values[:, self.MOON_RA] % (2. * pi)
+        result['de'] = values[:, self.MOON_DE]
+        result['radius'] = values[:, self.MOON_RADIUS]
+        result['diameter'] = result['radius'] * 2.
+        result['moon_distance'] = values[:, self.MOON_DISTANCE]
+        result['sun_ra'] = values[:, self.SUN_RA] % (2. * pi)
+        result['sun_de'] = values[:, self.SUN_DE]
+        result['sun_distance'] = values[:, self.SUN_DISTANCE]
+        result['astrometric_lib_lat'] = values[:, self.ASTROMETRIC_LIB_LAT]
+        result['astrometric_lib_long'] = (values[:, self.ASTROMETRIC_LIB_LONG] + pi) % (
+                2. * pi) - pi
+        result['colong'] = values[:, self.COLONG] % (2. * pi)
+        result['topocentric_lib_lat'] = values[:, self.TOPOCENTRIC_LIB_LAT]
+        result['topocentric_lib_long'] = (values[:, self.TOPOCENTRIC_LIB_LONG] + pi) % (
+                2. * pi) - pi
+        result['pos_rot_north'] = (values[:, self.POS_ROT_NORTH] + pi) % (2. * pi) - pi
+        (result['elongation'], result['pos_angle_sun'], result['phase_angle']) = \
+            self.phase_geometry(result['ra'], result['de'], result['sun_ra'], result['sun_de'],
+                                result['moon_distance'], result['sun_distance'])
+        result['pos_angle_pole'] = result['pos_angle_sun'] + pi / 2.
+        result['rate_ra'] = rates[:, self.MOON_RA]
+        result['rate_de'] = rates[:, self.MOON_DE]
+        return result
+
+    def topocentric_libration(self, date, ra, de):
+        """
+        Compute topocentric libration angles and the position angle of the moon's rotational axis.
+
+        :param date: PyEphem date (UTC)
+        :param ra: topocentric right ascension of the moon (radians)
+        :param de: topocentric declination of the moon (radians)
+        :return: (libration in latitude, libration in longitude, position angle of the moon's
+                 rotational axis), all in radians
+        """
 
         # Compute topocentric libration values. For algorithmic details, refer to the user's guide.
         j2000 = ephem.Date(datetime.datetime(2000, 1, 1, 12, 0))
-        t = (ephem.Date(self.location_time.date) - j2000) / 36525.
+        t = (ephem.Date(date) - j2000) / 36525.
         epsilon = radians(23.439281 - 0.013002575 * t)
-        ma = ephem.Equatorial(self.ra, self.de, epoch=ephem.Date(self.location_time.date))
+        ma = ephem.Equatorial(ra, de, epoch=ephem.Date(date))
         me = ephem.Ecliptic(ma)
         cap_i = radians(1.54266)
         omega = radians(125.044555 - 1934.13626194 * t)
@@ -219,18 +553,18 @@ class MoonEphem:
         omega_prime = atan2(-sin(cap_i) * sin(omega) / sin(i), (
                 cos(cap_i) * sin(epsilon) - sin(cap_i) * cos(epsilon) * cos(omega)) / sin(i))
 
-        self.pos_rot_north = atan2(-sin(i) * cos(omega_prime - self.ra),
-                                   cos(self.de) * cos(i) - sin(self.de) * sin(i) * sin(
-                                       omega_prime - self.ra))
-        self.topocentric_lib_lat = asin(
+        pos_rot_north = atan2(-sin(i) * cos(omega_prime - ra),
+                              cos(de) * cos(i) - sin(de) * sin(i) * sin(omega_prime - ra))
+        topocentric_lib_lat = asin(
             -sin(cap_i) * cos(me.lat) * sin(me.lon - omega) - cos(cap_i) * sin(me.lat))
-        self.topocentric_lib_long = (atan2(
+        topocentric_lib_long = (atan2(
             cos(cap_i) * cos(me.lat) * sin(me.lon - omega) - sin(cap_i) * sin(me.lat),
             cos(me.lat) * cos(me.lon - omega)) - lm + omega) % (2. * pi)
-        if self.topocentric_lib_long > 1.:
-            self.topocentric_lib_long -= 2. * pi
-        elif self.topocentric_lib_long < -1.:
-            self.topocentric_lib_long += 2. * pi
+        if topocentric_lib_long > 1.:
+            topocentric_lib_long -= 2. * pi
+        elif topocentric_lib_long < -1.:
+            topocentric_lib_long += 2. * pi
+        return topocentric_lib_lat, topocentric_lib_long, pos_rot_north
 
 
 if __name__ == "__main__":
@@ -265,7 +599,6 @@ if __name__ == "__main__":
         date_time = datetime.datetime(2015, 10, 1 + i, 21, 55, 00)
         # date_time = datetime.datetime(2011, 6, 1 + i, 2, 0, 0)
         me = MoonEphem(c, date_time, debug=False)
-        me.compute_libration()
         end_time = date_time + datetime.timedelta(seconds=10)
 
         print('Time (UT): ', me.location_time.date)
@@ -295,4 +628,30 @@ if __name__ == "__main__":
         rate_ra = degrees((ra_end - ra_start) / length * 3600.) * 60.
         rate_de = degrees((de_end - de_start) / length * 3600.) * 60.  #
         print("rate_ra: ", rate_ra, ", rate_de: ", rate_de)
+        print("Analytic rates, rate_ra: ", degrees(me.rate_ra * 3600.) * 60., ", rate_de: ",
+              degrees(me.rate_de * 3600.) * 60., " (arc min. / hour)")
+        print("Accelerations, accel_ra: ", degrees(me.accel_ra * 3600. ** 2) * 60.,
+              ", accel_de: ", degrees(me.accel_de * 3600. ** 2) * 60., " (arc min. / hour**2)")
         print("")
+
+    # Batch computation for planning: Compute the phase over a whole night in one-minute steps,
+    # and compare the run time with individual updates.
+    date_time = datetime.datetime(2015, 10, 1, 21, 55, 00)
+    me = MoonEphem(c, date_time)
+    start_posix = (me.local_time_to_utc(date_time) - pytz.utc.localize(
+        datetime.datetime(1970, 1, 1))).total_seconds()
+    timestamps = start_posix + np.arange(0., 36000., 60.)
+    start = time.time()
+    batch = me.update_batch(timestamps)
+    batch_time = time.time() - start
+    start = time.time()
+    for seconds in np.arange(0., 36000., 60.):
+        me.update(date_time + datetime.timedelta(seconds=seconds))
+    loop_time = time.time() - start
+    print("Batch computation for " + str(len(timestamps)) + " time steps: " + str(
+        round(batch_time * 1000., 3)) + " ms, individual updates: " + str(
+        round(loop_time * 1000., 3)) + " ms")
+    print("Phase angle at begin: ", degrees(batch['phase_angle'][0]), ", at end: ",
+          degrees(batch['phase_angle'][-1]))
+    print("Deviation from individual update (RA, arc sec.): ",
+          degrees(abs(batch['ra'][-1] - me.ra)) * 3600.)
@@ -30,7 +30,9 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 import matplotlib
 matplotlib.use('qt5agg')
 import matplotlib.pyplot as plt
+import numpy as np
 
+from alignment_scheduler import AlignmentScheduler
 from compute_drift_rate import ComputeDriftRate
 from configuration import Configuration
 from configuration_editor import ConfigurationEditor
@@ -89,7 +91,7 @@ class MoonPanoramaMaker(QtWidgets.QMainWindow):
         # Initialize instance variables.
         self.tv = None
         self.max_alignment_error = None
-        self.max_seconds_between_autoaligns = None
+        self.alignment_scheduler = None
         self.camera_interrupted = None
         self.selected_tile_numbers = None
         self.selected_tile_numbers_string = None
@@ -190,6 +192,8 @@ class MoonPanoramaMaker(QtWidgets.QMainWindow):
         self.workflow.camera_initialized_signal.connect(self.initialize_tesselation)
         self.workflow.camera_failed_signal.connect(self.camera_connection_failed)
         self.workflow.tesselation_initialized_signal.connect(self.start_workflow)
+        self.workflow.tesselation_updated_signal.connect(self.tesselation_updated)
+        self.workflow.tiles_unprocessed_signal.connect(self.tiles_unprocessed)
         self.workflow.alignment_point_reached_signal.connect(self.alignment_point_reached)
         self.workflow.alignment_performed_signal.connect(self.alignment_performed)
         self.workflow.autoalignment_point_reached_signal.connect(self.autoalignment_point_reached)
@@ -317,6 +321,8 @@ class MoonPanoramaMaker(QtWidgets.QMainWindow):
         self.telescope_initialization_flag = True
         self.camera_initialization_flag = True
         self.new_tesselation_flag = True
+        # The current session is not to be resumed at the next program start.
+        self.workflow.journal.close_session()
 
         if self.configuration.protocol_level > 0:
             print("")
@@ -507,8 +513,14 @@ class MoonPanoramaMaker(QtWidgets.QMainWindow):
         # If a new tesselation is computed, display it in a new Matplotlib window.
         if self.new_tesselation_flag:
             self.tv = TileVisualization(self.configuration, self.workflow.tc)
-            # Initialize all tiles as unprocessed.
-            self.tv.mark_all_unprocessed()
+            # If the session has been resumed from the journal, show the tiles processed already.
+            # Otherwise initialize all tiles as unprocessed.
+            if self.workflow.session_resumed:
+                self.tv.mark_processed(
+                    list(np.flatnonzero(self.workflow.tc.tile_table['processed'])))
+                self.resume_session()
+            else:
+                self.tv.mark_all_unprocessed()
             # If the protocol is to be written to a file, also write the tile layout to a file in
             # the user's home directory.
             if self.configuration.conf.getboolean('Workflow', 'protocol to file'):
@@ -541,6 +553,28 @@ class MoonPanoramaMaker(QtWidgets.QMainWindow):
             self.ui.new_landmark_selection.setEnabled(True)
             self.select_new_landmark()
 
+    def resume_session(self):
+        """
+        The workflow thread has restored the state of a previous session from the session journal.
+        Enable the GUI buttons which are available with the restored landmark, alignment and focus
+        area. The camera orientation is assumed unchanged, so it does not have to be checked again.
+
+        :return: -
+        """
+
+        if self.workflow.al.landmark_offset_set:
+            self.ui.new_landmark_selection.setEnabled(True)
+            self.ui.show_landmark.setEnabled(True)
+            if not self.workflow.al.autoalign_initialized:
+                self.ui.alignment.setEnabled(True)
+        if self.workflow.al.is_aligned:
+            self.camera_rotated = True
+        if self.workflow.al.true_ra_focus is not None:
+            self.focus_area_set = True
+            self.ui.goto_focus_area.setEnabled(True)
+        self.set_text_browser("Session resumed from journal. Press 'U' to adapt the tile layout to "
+                              "the current moon phase.")
+
     def prompt_new_landmark_selection(self):
         """
         This method is invoked by pressing the GUI button "New Landmark Selection". Before doing
@@ -789,9 +823,12 @@ class MoonPanoramaMaker(QtWidgets.QMainWindow):
             self.max_alignment_error = (self.configuration.conf.getfloat("Alignment",
                                                                          "max alignment error")) \
                                        / 100.
-            # Initialize the maximum time between auto-aligns to the minimum acceptable value.
-            # The interval will be increased at next auto-align if the correction is very small.
-            self.max_seconds_between_autoaligns = self.min_autoalign_interval
+            # The scheduler decides when the next auto-alignment is required, based on the growth
+            # of the pointing uncertainty.
+            self.alignment_scheduler = AlignmentScheduler(self.configuration, self.workflow.al,
+                                                          self.min_autoalign_interval,
+                                                          self.max_autoalign_interval,
+                                                          self.max_alignment_error)
             if self.workflow.al.drift_dialog_enabled:
                 self.ui.configure_drift_correction.setEnabled(True)
             self.set_statusbar()
@@ -1106,9 +1143,10 @@ class MoonPanoramaMaker(QtWidgets.QMainWindow):
 
     def select_tile(self):
         """
-        Triggered by pressing the "Select Tile" GUI button. Open a GUI for selecting a tile index.
-        Then enable the "Move to Selected Tile" button which can be used to drive the mount to the
-        tile's position.
+        Triggered by pressing the "Select Tile" GUI button. If a tile has been picked by clicking
+        on it in the tile visualization window, select this tile. Otherwise open a GUI for
+        selecting a tile index. Then enable the "Move to Selected Tile" button which can be used
+        to drive the mount to the tile's position.
 
         :return: -
         """
@@ -1121,13 +1159,18 @@ class MoonPanoramaMaker(QtWidgets.QMainWindow):
                 self.tv.mark_unprocessed([self.workflow.active_tile_number])
             else:
                 self.tv.mark_processed([self.workflow.active_tile_number])
-        # Open the dialog for selecting a tile number. Class TileNumberInput (in this module, see
-        # below) extends the TileNumberInputDialog in module tile_number_input_dialog. Set the
-        # context to "workflow", so that on dialog closing the selected value will be stored in
-        # "active_tile_number" of the workflow object.
-        tni = TileNumberInput(len(self.workflow.tc.list_of_tiles_sorted) - 1,
-                              self.workflow.active_tile_number, self.workflow)
-        tni.exec_()
+        # If a tile has been picked with the mouse in the tile visualization window, select it
+        # directly.
+        if self.tv.picked_tile is not None:
+            self.workflow.active_tile_number = self.tv.get_selected_tile_numbers()[0]
+        # Otherwise open the dialog for selecting a tile number. Class TileNumberInput (in this
+        # module, see below) extends the TileNumberInputDialog in module tile_number_input_dialog.
+        # Set the context to "workflow", so that on dialog closing the selected value will be
+        # stored in "active_tile_number" of the workflow object.
+        else:
+            tni = TileNumberInput(len(self.workflow.tc.list_of_tiles_sorted) - 1,
+                                  self.workflow.active_tile_number, self.workflow)
+            tni.exec_()
         if self.configuration.protocol_level > 1:
             Miscellaneous.protocol(
                 "Tile number " + str(self.workflow.active_tile_number) + " was selected.")
@@ -1279,6 +1322,53 @@ class MoonPanoramaMaker(QtWidgets.QMainWindow):
         if self.configuration.protocol_level > 0:
             Miscellaneous.protocol("All tiles are marked as processed.")
 
+    def update_tesselation(self):
+        """
+        The user has pressed the "U" key: Adapt the tile layout to the current moon phase and
+        position angle. The computation is done in the workflow thread. Tiles which are covered by
+        processed tiles of the old layout are marked as processed in the new layout.
+
+        :return: -
+        """
+
+        self.set_text_browser("Updating the tile layout for the current moon phase.")
+        self.workflow.update_tesselation_flag = True
+
+    def tesselation_updated(self, tc):
+        """
+        Triggered by the workflow thread after the tile layout has been updated. Replace the
+        TileConstructor object of the workflow thread by the one with the new layout, and redraw
+        the tile visualization window (without re-creating it). Since this is done in the GUI
+        thread, the tile visualization never works on a layout which is being replaced.
+
+        :param tc: TileConstructor object with the new layout
+        :return: -
+        """
+
+        self.workflow.tc = tc
+        self.tv.refresh_layout(tc)
+        self.reset_active_tile()
+        if self.workflow.all_tiles_recorded:
+            self.set_text_browser("Tile layout updated, all tiles are covered already.")
+        else:
+            self.set_text_browser("Tile layout updated, continue with 'Start / continue "
+                                  "recording'.")
+        self.set_statusbar()
+
+    def tiles_unprocessed(self, index_list, active_tile_number):
+        """
+        Triggered by the workflow thread if tiles have to be recorded again (e.g. after an
+        inaccurate auto-alignment). Mark the tiles unprocessed in the tile visualization window,
+        and mark the active tile again.
+
+        :param index_list: list of tile indices
+        :param active_tile_number: index of the currently active tile
+        :return: -
+        """
+
+        self.tv.mark_unprocessed(index_list)
+        self.tv.mark_active(active_tile_number)
+
     def move_to_selected_tile(self):
         """
         Triggered by the GUI button "Move to Selected Tile". Mark the tile active in the tile
@@ -1488,6 +1578,12 @@ class MoonPanoramaMaker(QtWidgets.QMainWindow):
                     self.set_text_browser("")
                     self.gui_context = ""
 
+            # The "U" key adapts the tile layout to the current moon phase. This is not possible
+            # while the recording workflow is active.
+            elif event.key() == QtCore.Qt.Key_U:
+                if self.initialized and not self.key_status_saved:
+                    self.update_tesselation()
+
             # The arrow keys start moving the telescope in the direction indicated.
             elif event.key() == QtCore.Qt.Key_Down:
                 self.workflow.telescope.move_south()
@@ -1556,9 +1652,10 @@ class MoonPanoramaMaker(QtWidgets.QMainWindow):
         if self.autoalign_enabled:
             status_text += ", auto-align on"
         # Show drift rates in arc minutes per hour.
-        if self.workflow.al.is_drift_set:
-            drift_ra = degrees(self.workflow.al.drift_ra) * 216000.
-            drift_de = degrees(self.workflow.al.drift_de) * 216000.
+        drift = self.workflow.al.drift_rate()
+        if drift is not None:
+            drift_ra = degrees(drift[0]) * 216000.
+            drift_de = degrees(drift[1]) * 216000.
             status_text += (
                     ", drift rate: (" + '%4.2f' % drift_ra + "'/h, " + '%4.2f' % drift_de + "'/h)")
         # Tell if camera is properly oriented.
@@ -1610,6 +1707,8 @@ class MoonPanoramaMaker(QtWidgets.QMainWindow):
                 pass
             # Write the whole configuration back to disk.
             self.configuration.write_config()
+            # Regular program end: The session is not to be resumed at the next program start.
+            self.workflow.journal.close_session()
             # Stop the workflow thread. This will terminate the camera thread and close the protocol
             # file.
             self.workflow.exiting = True
@@ -0,0 +1,308 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (c) 2016 Rolf Hempel, rolf6419@gmx.de
+
+This file is part of the MoonPanoramaMaker tool (MPM).
+https://github.com/Rolf-Hempel/MoonPanoramaMaker
+
+MPM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with MPM.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import json
+import os
+from math import radians, pi
+
+import numpy as np
+
+from miscellaneous import Miscellaneous
+from session_clock import SessionClock
+
+
+class MountModel:
+    """
+    After every slew the telescope position is looked up. For some mounts it differs
+    systematically from the slew target. This class collects these slew residuals (slew target
+    minus position reached) together with the sky position and time, and fits a compact pointing
+    model of the mount to them. The model consists of the classical terms of an equatorial mount
+    (notation as in TPOINT):
+
+    IH, ID: index errors in hour angle and declination
+    CH:     collimation error (optical axis not perpendicular to the declination axis)
+    NP:     non-perpendicularity of the polar and declination axes
+    MA, ME: misalignment of the polar axis (left-right, up-down)
+    TF:     tube flexure
+
+    The model predicts the residual of a slew before it is performed, so that the slew target can
+    be corrected in advance. The residuals are stored per mount in a JSON file, so the model
+    improves from session to session. Since the mount may have been set up anew in the meantime
+    (e.g. a portable mount), older residuals are down-weighted in the fit, and very old ones are
+    dropped. The fit is regularized, so that a few residuals close together in the sky only
+    determine the dominant terms. If no recent residuals are available, the regularization
+    pulls the model terms towards zero.
+
+    """
+
+    # Names of the model terms, in the order of the parameter vector.
+    terms = ["IH", "ID", "CH", "NP", "MA", "ME", "TF"]
+
+    def __init__(self, configuration, mount_name):
+        """
+        Initialize the model for a given mount, and read the residuals stored in earlier
+        sessions.
+
+        :param configuration: object containing parameters set by the user
+        :param mount_name: name which identifies the mount (e.g. the driver name)
+        """
+
+        self.configuration = configuration
+        self.mount_name = mount_name
+        self.filename = configuration.mount_model_filename
+        self.longitude = radians(
+            configuration.conf.getfloat("Geographical Position", "longitude"))
+        self.latitude = radians(configuration.conf.getfloat("Geographical Position", "latitude"))
+
+        # Each residual is a dictionary with the time (POSIX seconds), hour angle and declination
+        # of the slew target, and the residuals in RA and DE (all angles in radians).
+        self.residuals = []
+        self.parameters = np.zeros(len(self.terms))
+        self.is_fitted = False
+        self.load()
+
+    @staticmethod
+    def local_sidereal_time(seconds, longitude):
+        """
+        Compute the local mean sidereal time.
+
+        :param seconds: time in POSIX seconds
+        :param longitude: geographical longitude (radians, east positive)
+        :return: local sidereal time (radians, between 0 and 2 pi)
+        """
+
+        # Days since J2000.0 (Julian date 2451545.0).
+        days = seconds / 86400. + 2440587.5 - 2451545.0
+        gmst_hours = 18.697374558 + 24.06570982441908 * days
+        return (radians(gmst_hours * 15.) + longitude) % (2. * pi)
+
+    def design_matrix(self, hour_angle, de):
+        """
+        Compute the contributions of all model terms to the residuals in RA and DE.
+
+        :param hour_angle: Numpy array with hour angles (radians)
+        :param de: Numpy array with declinations (radians)
+        :return: (matrix for RA residuals, matrix for DE residuals), each with one row per
+                 position and one column per model term
+        """
+
+        (sin_h, cos_h) = (np.sin(hour_angle), np.cos(hour_angle))
+        (sin_d, cos_d) = (np.sin(de), np.cos(de))
+        (sin_phi, cos_phi) = (np.sin(self.latitude), np.cos(self.latitude))
+        zero = np.zeros_like(hour_angle)
+        one = np.ones_like(hour_angle)
+        # Corrections in hour angle (TPOINT sign conventions) and declination.
+        delta_h = np.column_stack((-one, zero, -1. / cos_d, -sin_d / cos_d,
+                                   -cos_h * sin_d / cos_d, sin_h * sin_d / cos_d,
+                                   cos_phi * sin_h / cos_d))
+        delta_d = np.column_stack((zero, -one, zero, zero, sin_h, cos_h,
+                                   cos_phi * cos_h * sin_d - sin_phi * cos_d))
+        # The right ascension changes opposite to the hour angle.
+        return -delta_h, delta_d
+
+    def add_residual(self, seconds, ra, de, residual_ra, residual_de):
+        """
+        Store a new slew residual and refit the model. The residuals are written to the file
+        only at the end of the session (see method "save").
+
+        :param seconds: time of the slew (POSIX seconds)
+        :param ra: RA of the slew target (radians)
+        :param de: DE of the slew target (radians)
+        :param residual_ra: slew target minus position reached in RA (radians)
+        :param residual_de: slew target minus position reached in DE (radians)
+        :return: -
+        """
+
+        hour_angle = (self.local_sidereal_time(seconds, self.longitude) - ra) % (2. * pi)
+        self.residuals.append({'time': seconds, 'hour_angle': hour_angle, 'de': de,
+                               'residual_ra': residual_ra, 'residual_de': residual_de})
+        # Only keep the most recent residuals.
+        del self.residuals[:-self.configuration.mount_model_max_residuals]
+        self.expire(seconds)
+        self.fit(seconds)
+
+    def expire(self, seconds):
+        """
+        Remove residuals which are older than the maximum age.
+
+        :param seconds: current time (POSIX seconds)
+        :return: -
+        """
+
+        oldest = seconds - self.configuration.mount_model_max_age * 86400.
+        self.residuals = [residual for residual in self.residuals if residual['time'] >= oldest]
+
+    def weights(self, seconds):
+        """
+        Compute the weights of the stored residuals in the fit. The weight is halved with every
+        "mount_model_half_life" hours of age.
+
+        :param seconds: current time (POSIX seconds)
+        :return: Numpy array with one weight per residual
+        """
+
+        age = np.maximum(seconds - np.array([residual['time'] for residual in self.residuals]),
+                         0.)
+        return 0.5 ** (age / (self.configuration.mount_model_half_life * 3600.))
+
+    def fit(self, seconds):
+        """
+        Fit the model parameters to the stored residuals. The least squares problem is weighted
+        by the age of the residuals, and regularized with a prior on the size of the parameters
+        (ridge regression).
+
+        :param seconds: current time (POSIX seconds)
+        :return: -
+        """
+
+        if len(self.residuals) < self.configuration.mount_model_min_residuals:
+            self.parameters = np.zeros(len(self.terms))
+            self.is_fitted = False
+            return
+        hour_angle = np.array([residual['hour_angle'] for residual in self.residuals])
+        de = np.array([residual['de'] for residual in self.residuals])
+        (matrix_ra, matrix_de) = self.design_matrix(hour_angle, de)
+        matrix = np.vstack((matrix_ra, matrix_de))
+        rhs = np.concatenate(([residual['residual_ra'] for residual in self.residuals],
+                              [residual['residual_de'] for residual in self.residuals]))
+        # The same weight applies to the RA and DE residual of a slew.
+        weights = np.tile(self.weights(seconds), 2)
+        # Ratio of the residual variance and the prior variance of the parameters.
+        damping = (self.configuration.mount_model_residual_sigma / (
+                60. * self.configuration.mount_model_prior_sigma)) ** 2
+        self.parameters = np.linalg.solve(
+            np.dot(matrix.T * weights, matrix) + damping * np.eye(len(self.terms)),
+            np.dot(matrix.T * weights, rhs))
+        self.is_fitted = True
+        if self.configuration.protocol_level > 2:
+            Miscellaneous.protocol("Mount model fitted to " + str(
+                len(self.residuals)) + " slew residuals, terms (arc sec): " + ", ".join(
+                [term + ": " + str(round(np.degrees(parameter) * 3600., 1)) for
+                 (term, parameter) in zip(self.terms, self.parameters)]) + ".")
+
+    def predict(self, seconds, ra, de):
+        """
+        Predict the residual of a slew.
+
+        :param seconds: time of the slew (POSIX seconds)
+        :param ra: RA of the slew target (radians)
+        :param de: DE of the slew target (radians)
+        :return: (residual in RA, residual in DE), radians. (0., 0.) if the model is not fitted.
+        """
+
+        if not self.is_fitted:
+            return 0., 0.
+        hour_angle = np.array([self.local_sidereal_time(seconds, self.longitude) - ra])
+        (matrix_ra, matrix_de) = self.design_matrix(hour_angle, np.array([de]))
+        return float(np.dot(matrix_ra[0], self.parameters)), float(
+            np.dot(matrix_de[0], self.parameters))
+
+    def load(self):
+        """
+        Read the residuals for this mount from the model file, remove expired residuals and fit
+        the model.
+
+        :return: -
+        """
+
+        if not os.path.isfile(self.filename):
+            return
+        try:
+            with open(self.filename, 'r') as model_file:
+                models = json.load(model_file)
+            self.residuals = models.get(self.mount_name, {}).get('residuals', [])
+        except (OSError, ValueError, AttributeError):
+            # A damaged file is ignored. It will be overwritten with the next residual.
+            if self.configuration.protocol_level > 0:
+                Miscellaneous.protocol("Mount model file " + self.filename +
+                                       " cannot be read, starting without mount model.")
+            self.residuals = []
+        seconds = SessionClock.time()
+        self.expire(seconds)
+        self.fit(seconds)
+
+    def save(self):
+        """
+        Write the residuals for this mount to the model file. Models for other mounts in the file
+        are kept. This method is called once at the end of a session.
+
+        :return: -
+        """
+
+        models = {}
+        if os.path.isfile(self.filename):
+            try:
+                with open(self.filename, 'r') as model_file:
+                    models = json.load(model_file)
+            except (OSError, ValueError):
+                models = {}
+        models[self.mount_name] = {'residuals': self.residuals}
+        try:
+            with open(self.filename, 'w') as model_file:
+                json.dump(models, model_file)
+        except OSError:
+            if self.configuration.protocol_level > 0:
+                Miscellaneous.protocol("Mount model file " + self.filename + " cannot be written.")
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    import configuration
+
+    # Simulate a mount with typical pointing errors: Slew to random positions in the sky and
+    # measure the residuals. Compare the residuals without and with model-based correction of
+    # the slew target. The model file is written to a temporary directory.
+    c = configuration.Configuration()
+    c.mount_model_filename = os.path.join(tempfile.mkdtemp(), "mount_models.json")
+    rng = np.random.default_rng(3)
+    true_parameters = np.radians(np.array([120., -80., 40., -25., 60., 30., 15.]) / 3600.)
+    noise = radians(5. / 3600.)
+    model = MountModel(c, "Simulated mount")
+    start = SessionClock.time() - 40 * 120.
+    errors_uncorrected = []
+    errors_corrected = []
+    for index in range(40):
+        seconds = start + 120. * index
+        ra = rng.uniform(0., 2. * pi)
+        de = radians(rng.uniform(-30., 60.))
+        # Slew with target corrected by the model prediction. The mount misses the commanded
+        # position by the residual of the true model, plus noise.
+        (predicted_ra, predicted_de) = model.predict(seconds, ra, de)
+        (ra_command, de_command) = (ra + predicted_ra, de + predicted_de)
+        hour_angle = np.array([model.local_sidereal_time(seconds, model.longitude) - ra_command])
+        (matrix_ra, matrix_de) = model.design_matrix(hour_angle, np.array([de_command]))
+        residual = np.array([np.dot(matrix_ra[0], true_parameters),
+                             np.dot(matrix_de[0], true_parameters)]) + rng.normal(0., noise, 2)
+        # Error of the position reached (relative to the original target).
+        errors_corrected.append(np.array([predicted_ra, predicted_de]) - residual)
+        errors_uncorrected.append(residual)
+        model.add_residual(seconds, ra_command, de_command, residual[0], residual[1])
+
+    to_arcsec = np.degrees(1.) * 3600.
+    print("RMS slew error of the last 20 slews (arc sec), without model: " + str(np.round(
+        np.sqrt(np.mean(np.square(errors_uncorrected[20:]), axis=0)) * to_arcsec, 1)))
+    print("RMS slew error of the last 20 slews (arc sec), with model:    " + str(np.round(
+        np.sqrt(np.mean(np.square(errors_corrected[20:]), axis=0)) * to_arcsec, 1)))
+    print("Fitted terms (arc sec): " + str(np.round(np.degrees(model.parameters) * 3600., 1)))
+    model.save()
+    print("Residuals restored from file: " + str(len(MountModel(c, "Simulated mount").residuals)))
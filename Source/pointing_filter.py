@@ -0,0 +1,273 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (c) 2016 Rolf Hempel, rolf6419@gmx.de
+
+This file is part of the MoonPanoramaMaker tool (MPM).
+https://github.com/Rolf-Hempel/MoonPanoramaMaker
+
+MPM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with MPM.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+from math import radians, inf
+
+import numpy as np
+
+
+class PointingFilter:
+    """
+    This class tracks the pointing error of the telescope mount (telescope minus celestial
+    coordinates) with a Kalman filter. For both RA and DE the state consists of the current
+    correction and its drift rate. Between measurements the correction moves with the drift rate,
+    and both quantities perform a random walk (process noise). Each alignment is a measurement of
+    the correction, with an accuracy depending on the kind of alignment (manual or automatic).
+
+    Other than the last alignment plus a constant drift rate, the filter combines all
+    measurements, weighted by their accuracy and age. Its covariance gives the uncertainty of the
+    predicted correction at any time, and thus the time at which a new alignment is required.
+
+    The state is stored in an array with rows (correction, drift rate) and columns (RA, DE). The
+    covariance array contains a 2x2 matrix for each of the coordinates RA and DE. All angles are
+    in radians, times in seconds.
+
+    """
+
+    def __init__(self, configuration):
+        """
+        Initialize the filter without measurements.
+
+        :param configuration: object containing parameters set by the user
+        """
+
+        self.configuration = configuration
+        self.time = None
+        self.state = None
+        self.covariance = None
+        self.reset()
+
+    def reset(self):
+        """
+        Forget all measurements.
+
+        :return: -
+        """
+
+        # Time of the last measurement, None as long as there is no measurement.
+        self.time = None
+        self.state = np.zeros((2, 2))
+        self.covariance = np.zeros((2, 2, 2))
+
+    def is_initialized(self):
+        """
+        Check if at least one measurement has been made.
+
+        :return: True, if the filter state is defined.
+        """
+
+        return self.time is not None
+
+    def transition(self, time_diff):
+        """
+        Compute the state transition matrix and the process noise covariance for a time step.
+
+        :param time_diff: length of the time step (seconds)
+        :return: (transition matrix, process noise covariance), both 2x2 Numpy arrays
+        """
+
+        # Spectral densities of the random walks in correction and drift rate (radians**2 per
+        # second and radians**2 per second**3).
+        noise_correction = radians(1. / 3600.) ** 2 * \
+            self.configuration.pointing_filter_correction_noise
+        noise_drift = radians(1. / 3600.) ** 2 * self.configuration.pointing_filter_drift_noise
+        transition_matrix = np.array([[1., time_diff], [0., 1.]])
+        process_noise = noise_drift * np.array(
+            [[time_diff ** 3 / 3., time_diff ** 2 / 2.], [time_diff ** 2 / 2., time_diff]])
+        process_noise[0, 0] += noise_correction * time_diff
+        return transition_matrix, process_noise
+
+    def predict(self, time_seconds):
+        """
+        Predict the filter state at a given time. The filter itself is not changed.
+
+        :param time_seconds: time for which the state is to be predicted (seconds)
+        :return: (state, covariance) Numpy arrays as described in the class documentation
+        """
+
+        if not self.is_initialized():
+            raise RuntimeError("Pointing filter used before the first measurement.")
+        time_diff = max(time_seconds - self.time, 0.)
+        (transition_matrix, process_noise) = self.transition(time_diff)
+        state = np.dot(transition_matrix, self.state)
+        # The same transition applies to the covariance matrices of RA and DE.
+        covariance = np.matmul(np.matmul(transition_matrix, self.covariance),
+                               transition_matrix.T) + process_noise
+        return state, covariance
+
+    def update(self, time_seconds, ra_correction, de_correction, sigma):
+        """
+        Incorporate a new measurement of the pointing correction.
+
+        :param time_seconds: time of the measurement (seconds)
+        :param ra_correction: measured correction in RA (radians)
+        :param de_correction: measured correction in DE (radians)
+        :param sigma: standard deviation of the measurement error (radians)
+        :return: innovation, i.e. measurement minus predicted correction (Numpy array with
+                 entries for RA and DE). For the first measurement the innovation is zero.
+        """
+
+        measurement = np.array([ra_correction, de_correction])
+        if not self.is_initialized():
+            # The first measurement defines the correction. Nothing is known about the drift rate
+            # yet, except for its typical size.
+            self.state = np.array([measurement, [0., 0.]])
+            self.covariance = np.zeros((2, 2, 2))
+            self.covariance[:, 0, 0] = sigma ** 2
+            self.covariance[:, 1, 1] = radians(
+                self.configuration.pointing_filter_initial_drift_sigma / 3600.) ** 2
+            self.time = time_seconds
+            return np.zeros(2)
+
+        (state, covariance) = self.predict(time_seconds)
+        innovation = measurement - state[0]
+        # Only the correction is measured (observation matrix (1, 0)). Innovation variance and
+        # Kalman gain for RA and DE.
+        innovation_variance = covariance[:, 0, 0] + sigma ** 2
+        gain = covariance[:, :, 0] / innovation_variance[:, np.newaxis]
+        self.state = state + gain.T * innovation
+        self.covariance = covariance - gain[:, :, np.newaxis] * covariance[:, np.newaxis, 0, :]
+        self.time = max(time_seconds, self.time)
+        return innovation
+
+    def add_uncertainty(self, ra_variance, de_variance):
+        """
+        Increase the uncertainty of the current correction, e.g. after an event which may have
+        disturbed the pointing of the mount.
+
+        :param ra_variance: additional variance of the correction in RA (radians**2)
+        :param de_variance: additional variance of the correction in DE (radians**2)
+        :return: -
+        """
+
+        if self.is_initialized():
+            self.covariance[0, 0, 0] += ra_variance
+            self.covariance[1, 0, 0] += de_variance
+
+    def correction(self, time_seconds, use_drift=True):
+        """
+        Predict the pointing correction at a given time.
+
+        :param time_seconds: time (seconds)
+        :param use_drift: if False, the drift rate is not applied after the last measurement
+        :return: (correction in RA, correction in DE), radians
+        """
+
+        if use_drift:
+            (state, covariance) = self.predict(time_seconds)
+            return float(state[0, 0]), float(state[0, 1])
+        return float(self.state[0, 0]), float(self.state[0, 1])
+
+    def drift_rate(self):
+        """
+        Get the drift rate estimated by the filter.
+
+        :return: (drift rate in RA, drift rate in DE), radians per second
+        """
+
+        return float(self.state[1, 0]), float(self.state[1, 1])
+
+    def correction_error(self, time_seconds):
+        """
+        Compute the standard deviation of the predicted correction at a given time.
+
+        :param time_seconds: time (seconds)
+        :return: (standard deviation in RA, standard deviation in DE), radians
+        """
+
+        (state, covariance) = self.predict(time_seconds)
+        return float(np.sqrt(covariance[0, 0, 0])), float(np.sqrt(covariance[1, 0, 0]))
+
+    def seconds_until_uncertainty(self, time_seconds, limit):
+        """
+        Compute how long the predicted correction stays more accurate than a given limit. The
+        variance of the predicted correction grows with time as a cubic polynomial.
+
+        :param time_seconds: start time (seconds)
+        :param limit: limit for the standard deviation of the correction (radians)
+        :return: time (seconds) from "time_seconds" until the standard deviation in RA or DE
+                 exceeds the limit. 0. if it is already exceeded, inf if it never is.
+        """
+
+        (state, covariance) = self.predict(time_seconds)
+        noise_correction = radians(1. / 3600.) ** 2 * \
+            self.configuration.pointing_filter_correction_noise
+        noise_drift = radians(1. / 3600.) ** 2 * self.configuration.pointing_filter_drift_noise
+        seconds = inf
+        for axis in range(2):
+            (p_00, p_01, p_11) = (covariance[axis, 0, 0], covariance[axis, 0, 1],
+                                  covariance[axis, 1, 1])
+            if p_00 >= limit ** 2:
+                return 0.
+            # Variance after dt seconds: p_00 + (2 p_01 + q_c) dt + p_11 dt**2 + q_d dt**3 / 3.
+            roots = np.roots([noise_drift / 3., p_11, 2. * p_01 + noise_correction,
+                              p_00 - limit ** 2])
+            positive = roots[(np.abs(roots.imag) < 1.e-9 * np.abs(roots)) & (roots.real > 0.)]
+            if len(positive):
+                seconds = min(seconds, float(positive.real.min()))
+        return seconds
+
+
+if __name__ == "__main__":
+    from math import degrees
+
+    import configuration
+
+    # Simulate alignments every ten minutes (with one manual alignment at the beginning) for a
+    # mount with a slowly changing drift rate. Compare the prediction error of the filter just
+    # before each alignment with the old method (last correction plus two-point drift rate).
+    c = configuration.Configuration()
+    rng = np.random.default_rng(2)
+    pointing_filter = PointingFilter(c)
+    sigma_manual = radians(c.pointing_filter_manual_sigma / 3600.)
+    sigma_auto = radians(c.pointing_filter_auto_sigma / 3600.)
+    to_arcsec = degrees(1.) * 3600.
+
+    true_correction = np.zeros(2)
+    true_drift = np.array([radians(0.5 / 60.) / 3600., radians(-0.3 / 60.) / 3600.])
+    points = []
+    errors_filter = []
+    errors_old = []
+    for index in range(18):
+        time_seconds = 600. * index
+        if index:
+            true_correction += true_drift * 600.
+            true_drift += rng.normal(0., radians(0.02 / 3600.) / 3600., 2) * 600.
+        sigma = sigma_manual if index == 0 else sigma_auto
+        measurement = true_correction + rng.normal(0., sigma, 2)
+        if index > 1:
+            # Prediction errors just before this alignment.
+            errors_filter.append(
+                np.array(pointing_filter.correction(time_seconds)) - true_correction)
+            drift_old = (points[-1] - points[0]) / (600. * (len(points) - 1))
+            errors_old.append(points[-1] + drift_old * 600. - true_correction)
+        pointing_filter.update(time_seconds, measurement[0], measurement[1], sigma)
+        points.append(measurement)
+
+    print("RMS prediction error (arc sec), Kalman filter: " + str(
+        np.round(np.sqrt(np.mean(np.square(errors_filter), axis=0)) * to_arcsec, 2)))
+    print("RMS prediction error (arc sec), last alignment + drift: " + str(
+        np.round(np.sqrt(np.mean(np.square(errors_old), axis=0)) * to_arcsec, 2)))
+    print("Predicted error after 10 minutes (arc sec): " + str(
+        np.round(np.array(pointing_filter.correction_error(time_seconds + 600.)) * to_arcsec, 2)))
+    print("Seconds until the error exceeds 5 arc sec: " + str(round(
+        pointing_filter.seconds_until_uncertainty(time_seconds, radians(5. / 3600.)), 1)))
@@ -0,0 +1,127 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (c) 2016 Rolf Hempel, rolf6419@gmx.de
+
+This file is part of the MoonPanoramaMaker tool (MPM).
+https://github.com/Rolf-Hempel/MoonPanoramaMaker
+
+MPM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with MPM.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import time
+from datetime import datetime, timezone
+
+
+class SessionClock:
+    """
+    This class provides the single time base for all modules (alignment, drift computation,
+    telescope guiding, ephemeris). Absolute time stamps (method "time" and the conversions based
+    on it) are read from the system clock, so they follow adjustments of the clock (e.g. by NTP)
+    and stay correct after the computer has been suspended. Time intervals within a session
+    (method "elapsed") are measured with a monotonic high-resolution counter instead, which is
+    accurate to fractions of a millisecond and does not jump when the system clock is adjusted.
+
+    All methods are static, so the clock can be used without creating an object.
+
+    """
+
+    # Reading of the monotonic counter when the module was imported.
+    anchor_monotonic = time.perf_counter()
+
+    @staticmethod
+    def elapsed():
+        """
+        Look up the monotonic time since the module was imported. Use this for measuring time
+        intervals only. The counter may stop while the computer is suspended.
+
+        :return: elapsed time (seconds, with fractional part)
+        """
+
+        return time.perf_counter() - SessionClock.anchor_monotonic
+
+    @staticmethod
+    def time():
+        """
+        Look up the current time in consecutive seconds (UTC, POSIX epoch), including the
+        fractional part. Use this for absolute time stamps (ephemeris, alignment points, journal
+        and mount model records).
+
+        :return: current time (seconds)
+        """
+
+        return time.time()
+
+    @staticmethod
+    def now(seconds=None):
+        """
+        Translate a session clock time into a local datetime object (without time zone info, as
+        returned by datetime.now()).
+
+        :param seconds: time in POSIX seconds. If None, the current time is used.
+        :return: local datetime object
+        """
+
+        if seconds is None:
+            seconds = SessionClock.time()
+        return datetime.fromtimestamp(seconds)
+
+    @staticmethod
+    def utc_now(seconds=None):
+        """
+        Translate a session clock time into a UTC datetime object (without time zone info).
+
+        :param seconds: time in POSIX seconds. If None, the current time is used.
+        :return: UTC datetime object
+        """
+
+        if seconds is None:
+            seconds = SessionClock.time()
+        return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None)
+
+    @staticmethod
+    def ephem_date(seconds=None):
+        """
+        Translate a session clock time into a PyEphem date (days since 1899-12-31 12:00 UT).
+
+        :param seconds: time in POSIX seconds. If None, the current time is used.
+        :return: PyEphem date (float)
+        """
+
+        if seconds is None:
+            seconds = SessionClock.time()
+        return seconds / 86400. + 25567.5
+
+    @staticmethod
+    def seconds(date_time):
+        """
+        Translate a local datetime object into POSIX seconds, including the fractional part.
+
+        :param date_time: local datetime object
+        :return: time in POSIX seconds
+        """
+
+        return date_time.timestamp()
+
+
+if __name__ == "__main__":
+    # Compare the session clock with the system clock, and measure its resolution.
+    print("Session clock (UTC): ", SessionClock.utc_now(), ", system clock (UTC): ",
+          datetime.now(timezone.utc))
+    print("Session clock (local): ", SessionClock.now(), ", system clock (local): ",
+          datetime.now())
+    start = SessionClock.elapsed()
+    time.sleep(0.25)
+    print("Elapsed time for a sleep of 0.25 seconds: ", SessionClock.elapsed() - start)
+    print("PyEphem date: ", SessionClock.ephem_date())
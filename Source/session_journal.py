@@ -0,0 +1,366 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (c) 2016 Rolf Hempel, rolf6419@gmx.de
+
+This file is part of the MoonPanoramaMaker tool (MPM).
+https://github.com/Rolf-Hempel/MoonPanoramaMaker
+
+MPM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with MPM.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import json
+import os
+
+from miscellaneous import Miscellaneous
+from session_clock import SessionClock
+
+
+class SessionJournal:
+    """
+    The SessionJournal keeps a crash-safe record of the state of an observing session. Each state
+    transition (new tesselation, tiles marked processed / unprocessed, landmark selection,
+    alignment points, drift and focus area settings) is appended to a journal file as a single
+    line in JSON format. Every record is flushed to disk immediately. The journal is never
+    rewritten, so a crash can at most lose the record which was being written.
+
+    After a crash, the session state is rebuilt by replaying the journal. If the program is ended
+    normally (or restarted by the user), a "closed" record is written, and the session is not
+    resumed at the next program start.
+
+    """
+
+    def __init__(self, configuration):
+        """
+        Initialize the journal. The journal file is not opened before the first record is written.
+
+        :param configuration: object containing parameters set by the user
+        """
+
+        self.configuration = configuration
+        self.filename = configuration.journal_filename
+        self.journal_file = None
+
+    def start_session(self, de_center, m_diameter, phase_angle, pos_angle, number_tiles):
+        """
+        Begin a new journal for a new tesselation. A previous journal is discarded.
+
+        :param de_center: declination of the moon's center (radians)
+        :param m_diameter: diameter of the moon (radians)
+        :param phase_angle: phase angle of the sunlit moon phase
+        :param pos_angle: position angle of the sunlit phase (radians)
+        :param number_tiles: number of tiles in the tesselation
+        :return: -
+        """
+
+        self.close()
+        self.journal_file = open(self.filename, 'w')
+        self.record_layout(de_center, m_diameter, phase_angle, pos_angle, number_tiles,
+                           event="session")
+
+    def continue_session(self):
+        """
+        Re-open the journal of a resumed session. New records are appended. If the program
+        crashed while writing a record, the incomplete last line is removed first. Otherwise the
+        next record would be appended to it, and both would be lost at the next resume.
+
+        :return: -
+        """
+
+        self.close()
+        with open(self.filename, 'r+b') as file:
+            content = file.read()
+            file.truncate(content.rfind(b"\n") + 1)
+        self.journal_file = open(self.filename, 'a')
+        self.write({'event': "resumed"})
+
+    def close_session(self):
+        """
+        Mark the session as regularly closed, so it is not resumed at the next program start.
+
+        :return: -
+        """
+
+        self.write({'event': "closed"})
+        self.close()
+
+    def close(self):
+        """
+        Close the journal file.
+
+        :return: -
+        """
+
+        if self.journal_file is not None:
+            self.journal_file.close()
+            self.journal_file = None
+
+    def write(self, record):
+        """
+        Append a record to the journal and force it to disk. If no session is active, nothing is
+        written.
+
+        :param record: dictionary with the "event" name and its data
+        :return: -
+        """
+
+        if self.journal_file is None:
+            return
+        record['time'] = SessionClock.time()
+        try:
+            self.journal_file.write(json.dumps(record) + "\n")
+            self.journal_file.flush()
+            os.fsync(self.journal_file.fileno())
+        except (OSError, ValueError) as e:
+            # A failing journal must not stop the observation.
+            if self.configuration.protocol_level > 0:
+                Miscellaneous.protocol("Error in writing the session journal: " + str(e))
+
+    def record_layout(self, de_center, m_diameter, phase_angle, pos_angle, number_tiles,
+                      event="layout"):
+        """
+        Record the parameters of a tesselation. With these parameters the TileConstructor
+        reproduces the same tile layout.
+
+        :param de_center: declination of the moon's center (radians)
+        :param m_diameter: diameter of the moon (radians)
+        :param phase_angle: phase angle of the sunlit moon phase
+        :param pos_angle: position angle of the sunlit phase (radians)
+        :param number_tiles: number of tiles in the tesselation
+        :param event: "session" for a new session, "layout" for an updated layout
+        :return: -
+        """
+
+        self.write({'event': event, 'de_center': de_center, 'm_diameter': m_diameter,
+                    'phase_angle': phase_angle, 'pos_angle': pos_angle,
+                    'number_tiles': number_tiles})
+
+    def record_tiles(self, index_list, processed):
+        """
+        Record a change of the "processed" flag of tiles.
+
+        :param index_list: list of tile indices
+        :param processed: new value of the flag
+        :return: -
+        """
+
+        self.write({'event': "tiles", 'indices': [int(index) for index in index_list],
+                    'processed': bool(processed)})
+
+    def record_all_tiles(self, processed):
+        """
+        Record that all tiles have been marked processed or unprocessed.
+
+        :param processed: new value of the flag
+        :return: -
+        """
+
+        self.write({'event': "all_tiles", 'processed': bool(processed)})
+
+    def record_landmark(self, name, ra_offset, de_offset):
+        """
+        Record the selection of the alignment landmark.
+
+        :param name: name of the landmark
+        :param ra_offset: offset in RA of the landmark from the moon center (radians)
+        :param de_offset: offset in DE of the landmark from the moon center (radians)
+        :return: -
+        """
+
+        self.write({'event': "landmark", 'name': name, 'ra_offset': ra_offset,
+                    'de_offset': de_offset})
+
+    def record_alignment_point(self, alignment_point):
+        """
+        Record a new alignment point.
+
+        :param alignment_point: dictionary as stored in Alignment.alignment_points (time, RA/DE
+                                correction, and whether the alignment was manual)
+        :return: -
+        """
+
+        self.write({'event': "alignment", 'point': alignment_point})
+
+    def record_drift(self, drift_disabled, default_first_drift, default_last_drift, first_index,
+                     last_index):
+        """
+        Record the settings for the drift computation.
+
+        :param drift_disabled: True, if drift correction is switched off
+        :param default_first_drift: True, if the first alignment point is used
+        :param default_last_drift: True, if the last alignment point is used
+        :param first_index: index of the first alignment point used
+        :param last_index: index of the last alignment point used
+        :return: -
+        """
+
+        self.write({'event': "drift", 'drift_disabled': drift_disabled,
+                    'default_first_drift': default_first_drift,
+                    'default_last_drift': default_last_drift, 'first_index': first_index,
+                    'last_index': last_index})
+
+    def record_focus_area(self, true_ra, true_de, ra_offset, de_offset):
+        """
+        Record the location of the focus area.
+
+        :param true_ra: RA of the focus area (radians)
+        :param true_de: DE of the focus area (radians)
+        :param ra_offset: offset in RA from the moon center (None if focusing on a star)
+        :param de_offset: offset in DE from the moon center (None if focusing on a star)
+        :return: -
+        """
+
+        self.write({'event': "focus_area", 'true_ra': true_ra, 'true_de': true_de,
+                    'ra_offset': ra_offset, 'de_offset': de_offset})
+
+    def read_session(self):
+        """
+        Replay the journal file and rebuild the state of the last session.
+
+        :return: dictionary with the session state, or None if there is no session to be
+                 resumed (no journal, session closed regularly, or too old).
+        """
+
+        try:
+            with open(self.filename, 'r') as journal_file:
+                lines = journal_file.readlines()
+        except OSError:
+            return None
+
+        state = None
+        for line_number, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line may have been truncated by a crash. Skip it.
+                if self.configuration.protocol_level > 0 and line_number < len(lines) - 1:
+                    Miscellaneous.protocol("Corrupt line " + str(
+                        line_number + 1) + " in session journal skipped.")
+                continue
+            event = record['event']
+            if event == "session":
+                state = {'processed': set(), 'landmark': None, 'alignment_points': [],
+                         'drift': None, 'focus_area': None}
+            elif state is None:
+                continue
+            if event in ("session", "layout"):
+                state['layout'] = (record['de_center'], record['m_diameter'],
+                                   record['phase_angle'], record['pos_angle'])
+                state['number_tiles'] = record['number_tiles']
+                state['processed'] = set()
+            elif event == "tiles":
+                if record['processed']:
+                    state['processed'].update(record['indices'])
+                else:
+                    state['processed'].difference_update(record['indices'])
+            elif event == "all_tiles":
+                if record['processed']:
+                    state['processed'] = set(range(state['number_tiles']))
+                else:
+                    state['processed'] = set()
+            elif event == "landmark":
+                state['landmark'] = record
+            elif event == "alignment":
+                state['alignment_points'].append(record['point'])
+            elif event == "drift":
+                state['drift'] = record
+            elif event == "focus_area":
+                state['focus_area'] = record
+            elif event == "closed":
+                state = None
+                continue
+            state['time'] = record['time']
+
+        # Do not resume sessions which are too old.
+        if state is None or SessionClock.time() - state['time'] > \
+                self.configuration.journal_resume_hours * 3600.:
+            return None
+        return state
+
+    @staticmethod
+    def restore_alignment(al, state):
+        """
+        Restore the landmark, the alignment points, the drift settings and the focus area of a
+        resumed session in the alignment object. Auto-alignment is not restored, because it needs
+        a reference image taken by the camera.
+
+        :param al: Alignment object
+        :param state: session state, as returned by method "read_session"
+        :return: -
+        """
+
+        if state['landmark'] is not None:
+            al.ls.selected_landmark = state['landmark']['name']
+            al.ls.landmark_selected = True
+            al.ra_offset_landmark = state['landmark']['ra_offset']
+            al.de_offset_landmark = state['landmark']['de_offset']
+            al.landmark_offset_set = True
+
+        al.alignment_points = state['alignment_points']
+        if al.alignment_points:
+            last_point = al.alignment_points[-1]
+            al.alignment_time = last_point['time_seconds']
+            al.ra_correction = last_point['ra_correction']
+            al.de_correction = last_point['de_correction']
+            al.is_aligned = True
+            al.drift_dialog_enabled = len(al.alignment_points) > 1
+            al.rebuild_pointing_filter()
+
+        if state['drift'] is not None:
+            al.drift_disabled = state['drift']['drift_disabled']
+            al.default_first_drift = state['drift']['default_first_drift']
+            al.default_last_drift = state['drift']['default_last_drift']
+            al.first_index = state['drift']['first_index']
+            al.last_index = state['drift']['last_index']
+            if len(al.alignment_points) > 1:
+                al.compute_drift_rate()
+
+        if state['focus_area'] is not None:
+            al.true_ra_focus = state['focus_area']['true_ra']
+            al.true_de_focus = state['focus_area']['true_de']
+            al.ra_offset_focus_area = state['focus_area']['ra_offset']
+            al.de_offset_focus_area = state['focus_area']['de_offset']
+
+
+if __name__ == "__main__":
+    import configuration
+
+    # Write a short journal, simulate a crash in the middle of the last record, and read it back.
+    c = configuration.Configuration()
+    c.journal_filename = os.path.join(c.home, "MoonPanoramaMaker_test.journal")
+    journal = SessionJournal(c)
+    journal.start_session(0.1, 0.009, 1.2, 0.5, 30)
+    journal.record_landmark("Copernicus", 0.001, -0.0005)
+    journal.record_alignment_point({'time_string': "22:10:05", 'time_seconds': SessionClock.time(),
+                                    'ra_correction': 0.0002, 'de_correction': -0.0001,
+                                    'manual': True})
+    journal.record_tiles(range(5), True)
+    journal.record_tiles([3], False)
+    journal.close()
+    with open(c.journal_filename, 'a') as file:
+        file.write('{"event": "tiles", "indi')
+
+    state = SessionJournal(c).read_session()
+    print("Layout: ", state['layout'], ", tiles: ", state['number_tiles'])
+    print("Processed tiles: ", sorted(state['processed']))
+    print("Landmark: ", state['landmark']['name'], ", alignment points: ",
+          len(state['alignment_points']))
+
+    # Resume the session after the crash. The incomplete record must not swallow new records.
+    journal = SessionJournal(c)
+    journal.continue_session()
+    journal.record_tiles([7], True)
+    journal.close()
+    print("Processed tiles after resume: ", sorted(SessionJournal(c).read_session()['processed']))
+    os.remove(c.journal_filename)
@@ -0,0 +1,395 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (c) 2016 Rolf Hempel, rolf6419@gmx.de
+
+This file is part of the MoonPanoramaMaker tool (MPM).
+https://github.com/Rolf-Hempel/MoonPanoramaMaker
+
+MPM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with MPM.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+from math import radians
+
+import numpy as np
+
+import configuration
+from alignment_scheduler import AlignmentScheduler
+from miscellaneous import Miscellaneous
+
+
+class SimulatedAlignment:
+    """
+    Stand-in for the Alignment object, as far as it is used by the AlignmentScheduler. It keeps
+    the time of the last alignment on the simulated time axis. The pointing filter is not
+    simulated, so the scheduler always uses its adaptive alignment interval.
+
+    """
+
+    def __init__(self):
+        """
+        Start with an alignment at time zero.
+        """
+
+        # The scheduler multiplies the maximum alignment error with this angle. Without a
+        # pointing filter the result is not used.
+        self.shift_angle = 1.
+        self.alignment_time = 0.
+        self.current_time = 0.
+
+    def seconds_since_last_alignment(self):
+        """
+        Compute the simulated time since the last alignment.
+
+        :return: time in seconds
+        """
+
+        return self.current_time - self.alignment_time
+
+    def seconds_until_alignment_needed(self, max_error):
+        """
+        The pointing filter is not simulated.
+
+        :param max_error: maximum acceptable standard deviation of the correction (radians)
+        :return: None (no prediction available)
+        """
+
+        return None
+
+
+class SessionSimulator:
+    """
+    The SessionSimulator class predicts the timeline of a panorama recording session without any
+    hardware. It replays the recording loop of the Workflow class as a sequence of discrete
+    events: slews to tiles, still images for chain alignments, video exposures, and
+    auto-alignments. As in the workflow, an AlignmentScheduler decides at each tile boundary if
+    an alignment is due. If a still image of a neighboring tile is available, the alignment is
+    done as a chain alignment at the next tile, otherwise at the landmark. If the alignment error
+    is larger than allowed, all tiles recorded since the previous alignment are repeated.
+
+    The simulation differs from a real session in the following points: The pointing filter is
+    not simulated, so the scheduler adapts its alignment interval only (as with the pointing
+    filter disabled). Chain alignments always succeed. The wait for the telescope image to settle
+    is assumed to take a constant time.
+
+    The result is a per-tile timeline and the total session duration. Together with the time
+    window in which the moon is high enough in the sky, this can be used to check if a panorama
+    can be completed, and to compare different configurations.
+
+    """
+
+    def __init__(self, configuration, tc, alignment_error=None):
+        """
+        Read out the timing parameters from the configuration object.
+
+        :param configuration: object containing parameters set by the user
+        :param tc: TileConstructor object with the tile layout to be simulated
+        :param alignment_error: function which for the time (seconds) since the previous alignment
+                                returns the alignment error relative to the maximum allowed error.
+                                If None, a constant relative error (as specified in the
+                                configuration) is assumed.
+        """
+
+        self.configuration = configuration
+        self.tc = tc
+        if alignment_error is None:
+            self.alignment_error = lambda seconds: configuration.simulation_relative_alignment_error
+        else:
+            self.alignment_error = alignment_error
+
+        # Mount characteristics. The slew overhead includes the look-ups until the mount is
+        # stationary.
+        self.slew_speed = radians(configuration.simulation_slew_speed)
+        self.slew_overhead = configuration.simulation_slew_overhead
+        # Before a still image is taken, the workflow waits until the telescope image has settled.
+        # Without settle detection the fixed "wait interval" of the telescope interface is used.
+        if configuration.settle_detection_enabled:
+            self.settle_time = configuration.simulation_settle_time
+        else:
+            interface_type = configuration.conf.get("Telescope", "interface type")
+            self.settle_time = configuration.conf.getfloat(interface_type, "wait interval")
+
+        # Camera characteristics: Time for all videos of one tile.
+        repetition_count = configuration.conf.getint("Camera", "repetition count")
+        self.trigger_delay = configuration.conf.getfloat("Workflow", "camera trigger delay")
+        self.tile_exposure_time = repetition_count * configuration.simulation_exposure_time + (
+                repetition_count - 1) * configuration.camera_time_between_multiple_exposures
+        self.still_image_time = configuration.simulation_still_image_time
+
+        # Auto-alignment parameters, as read by the GUI after auto-alignment initialization.
+        self.min_autoalign_interval = configuration.conf.getfloat("Alignment",
+                                                                  "min autoalign interval")
+        self.max_autoalign_interval = configuration.conf.getfloat("Alignment",
+                                                                  "max autoalign interval")
+        self.max_alignment_error = configuration.conf.getfloat("Alignment",
+                                                               "max alignment error") / 100.
+        # Still images are kept for chain alignments (see method "chain_alignment_enabled" of
+        # class Alignment).
+        self.chain_alignment_enabled = configuration.chain_alignment_enabled and not \
+            configuration.camera_debug
+
+        # Results of the last simulation.
+        self.timeline = []
+        self.total_duration = None
+        self.number_of_alignments = None
+        self.number_of_chain_alignments = None
+        self.number_of_repeated_tiles = None
+
+    def slew(self, position_from, position_to):
+        """
+        Compute the time for a slew between two positions.
+
+        :param position_from: (delta_ra, delta_de) offset of the start position from moon center
+        :param position_to: (delta_ra, delta_de) offset of the target position from moon center
+        :return: time (seconds) until the mount is stationary at the target position
+        """
+
+        return Miscellaneous.slew_time(position_to[0] - position_from[0],
+                                       position_to[1] - position_from[1], self.slew_speed,
+                                       self.slew_overhead)
+
+    def chain_alignment_possible(self, tile_index, tile_references, chain_links):
+        """
+        Check if an alignment before a tile can be done as a chain alignment (see method
+        "chain_alignment_possible" of class Alignment).
+
+        :param tile_index: index of the tile in "tc.list_of_tiles_sorted"
+        :param tile_references: set of tile indices with a still image
+        :param chain_links: number of chain alignments since the last landmark alignment
+        :return: True, if a chain alignment is possible
+        """
+
+        if not self.chain_alignment_enabled or \
+                chain_links >= self.configuration.chain_alignment_max_links:
+            return False
+        tile = self.tc.list_of_tiles_sorted[tile_index]
+        neighbors = self.tc.tiles_in_box(tile['x_left'], tile['x_right'], tile['y_bottom'],
+                                         tile['y_top'], mode="intersecting")
+        return any([index != tile_index and index in tile_references for index in neighbors])
+
+    def simulate(self, landmark_offset=(0., 0.)):
+        """
+        Simulate the recording of all tiles, starting right after the initialization of
+        auto-alignment at the landmark.
+
+        :param landmark_offset: (delta_ra, delta_de) offset of the alignment landmark from the
+                                moon center (radians)
+        :return: total session duration (seconds)
+        """
+
+        number_tiles = len(self.tc.list_of_tiles_sorted)
+        processed = [False] * number_tiles
+        self.timeline = []
+        self.number_of_alignments = 0
+        self.number_of_chain_alignments = 0
+        self.number_of_repeated_tiles = 0
+
+        # The session starts at the landmark, with a fresh alignment.
+        al = SimulatedAlignment()
+        scheduler = AlignmentScheduler(self.configuration, al, self.min_autoalign_interval,
+                                       self.max_autoalign_interval, self.max_alignment_error)
+        position = landmark_offset
+        tile_indices_since_last_autoalign = []
+        tile_references = set()
+        chain_links = 0
+        active_tile_number = 0
+
+        while True:
+            # Find the next unprocessed tile, starting at the active tile (as in method
+            # "find_next_unprocessed_tile" of class TileConstructor).
+            indices = list(range(active_tile_number, number_tiles)) + list(
+                range(active_tile_number))
+            unprocessed = [index for index in indices if not processed[index]]
+            if not unprocessed:
+                break
+            active_tile_number = unprocessed[0]
+            # If alignments fail all the time, tiles are repeated forever. Give up in this case.
+            if self.number_of_alignments > 10 * (number_tiles + 1):
+                raise RuntimeError("Session simulation does not terminate, alignment errors too "
+                                   "large.")
+            tile = self.tc.list_of_tiles_sorted[active_tile_number]
+            tile_position = (tile['delta_ra_center'], tile['delta_de_center'])
+            chain_aligned = False
+
+            # Let the scheduler decide if an auto-alignment is due before the next tile. If
+            # possible, align on a still image of a neighboring tile, otherwise on the landmark.
+            if scheduler.alignment_due():
+                start_time = al.current_time
+                if self.chain_alignment_possible(active_tile_number, tile_references,
+                                                 chain_links):
+                    alignment_position = tile_position
+                    chain_aligned = True
+                    chain_links += 1
+                    self.number_of_chain_alignments += 1
+                else:
+                    alignment_position = landmark_offset
+                    chain_links = 0
+                al.current_time += self.slew(position, alignment_position) + \
+                    self.settle_time + self.still_image_time
+                position = alignment_position
+                relative_alignment_error = self.alignment_error(
+                    al.seconds_since_last_alignment())
+                al.alignment_time = al.current_time
+                self.number_of_alignments += 1
+                self.timeline.append({'event': "alignment", 'tile_index': None,
+                                      'start': start_time, 'end': al.current_time,
+                                      'chain': chain_aligned,
+                                      'relative_error': relative_alignment_error})
+                # Alignment error too large: Repeat tiles since the last alignment.
+                if scheduler.record_alignment(relative_alignment_error *
+                                              self.max_alignment_error) and \
+                        tile_indices_since_last_autoalign:
+                    for index in tile_indices_since_last_autoalign:
+                        processed[index] = False
+                    tile_references.difference_update(tile_indices_since_last_autoalign)
+                    self.number_of_repeated_tiles += len(tile_indices_since_last_autoalign)
+                    active_tile_number = min(tile_indices_since_last_autoalign)
+                    tile_indices_since_last_autoalign = []
+                    continue
+                tile_indices_since_last_autoalign = []
+
+            # Slew to the tile. Unless the tile has just been chain-aligned, take a still image
+            # for chain alignments at its neighbors. Then wait for the camera trigger delay and
+            # record the video(s).
+            scheduler.tile_started(al.current_time)
+            start_time = al.current_time
+            slew_time = self.slew(position, tile_position)
+            al.current_time += slew_time
+            if self.chain_alignment_enabled and not chain_aligned:
+                al.current_time += self.settle_time + self.still_image_time
+            if self.chain_alignment_enabled:
+                tile_references.add(active_tile_number)
+            al.current_time += self.trigger_delay + self.tile_exposure_time
+            position = tile_position
+            processed[active_tile_number] = True
+            tile_indices_since_last_autoalign.append(active_tile_number)
+            self.timeline.append({'event': "tile", 'tile_index': active_tile_number,
+                                  'start': start_time, 'end': al.current_time,
+                                  'slew_time': slew_time})
+
+        self.total_duration = al.current_time
+        if self.configuration.protocol_level > 1:
+            Miscellaneous.protocol("Session simulation: " + str(number_tiles) + " tiles, " + str(
+                self.number_of_alignments) + " auto-alignments (" + str(
+                self.number_of_chain_alignments) + " chain alignments), " + str(
+                self.number_of_repeated_tiles) + " repeated tiles, total duration: " + str(
+                round(self.total_duration / 60., 1)) + " minutes.")
+        return self.total_duration
+
+    @staticmethod
+    def moon_altitudes(me, timestamps):
+        """
+        Compute the altitude of the moon above the horizon for an array of times.
+
+        :param me: MoonEphem object (defines the observer location)
+        :param timestamps: Numpy array of POSIX time stamps (UTC seconds)
+        :return: Numpy array of moon altitudes (radians)
+        """
+
+        batch = me.update_batch(timestamps)
+        # Greenwich mean sidereal time (radians) for the Julian dates of the time stamps.
+        julian_date = np.asarray(timestamps, dtype=float) / 86400. + 2440587.5
+        gmst = np.radians(280.46061837 + 360.98564736629 * (julian_date - 2451545.))
+        hour_angle = gmst + float(me.location_time.lon) - batch['ra']
+        latitude = float(me.location_time.lat)
+        return np.arcsin(np.sin(latitude) * np.sin(batch['de']) +
+                         np.cos(latitude) * np.cos(batch['de']) * np.cos(hour_angle))
+
+    def observation_window(self, me, start_seconds, hours=12., step=60.):
+        """
+        Find the time window after a given start time during which the moon stays above the
+        minimum altitude.
+
+        :param me: MoonEphem object (defines the observer location)
+        :param start_seconds: begin of the search (POSIX UTC seconds)
+        :param hours: length of the search interval (hours)
+        :param step: time resolution (seconds)
+        :return: (begin, end) of the first window in POSIX UTC seconds, or None if the moon does
+                 not rise high enough in the search interval
+        """
+
+        timestamps = start_seconds + np.arange(0., hours * 3600., step)
+        visible = self.moon_altitudes(me, timestamps) > radians(
+            self.configuration.simulation_minimum_altitude)
+        if not visible.any():
+            return None
+        first = int(np.argmax(visible))
+        # End of the window: first time step after "first" where the moon is too low.
+        below = np.nonzero(~visible[first:])[0]
+        if len(below):
+            last = first + below[0] - 1
+        else:
+            last = len(timestamps) - 1
+        return timestamps[first], timestamps[last]
+
+    def fits_into_window(self, me, start_seconds):
+        """
+        Check if the simulated session, started at a given time, can be completed before the moon
+        sinks below the minimum altitude.
+
+        :param me: MoonEphem object (defines the observer location)
+        :param start_seconds: planned session start (POSIX UTC seconds)
+        :return: True, if the session can be completed, otherwise False
+        """
+
+        if self.total_duration is None:
+            self.simulate()
+        window = self.observation_window(me, start_seconds)
+        if window is None:
+            return False
+        return window[0] <= start_seconds and start_seconds + self.total_duration <= window[1]
+
+
+if __name__ == "__main__":
+    import datetime
+    from moon_ephem import MoonEphem
+    from tile_constructor import TileConstructor
+
+    c = configuration.Configuration()
+    date_time = datetime.datetime(2017, 10, 15, 5, 30, 0)
+    me = MoonEphem(c, date_time)
+    start_seconds = (me.local_time_to_utc(date_time) - datetime.datetime(
+        1970, 1, 1, tzinfo=datetime.timezone.utc)).total_seconds()
+
+    # Compare the session durations with "limb first" switched on and off.
+    for limb_first in ["True", "False"]:
+        c.conf.set("Workflow", "limb first", limb_first)
+        tc = TileConstructor(c, me.de, me.diameter, me.phase_angle, me.pos_angle_pole)
+        simulator = SessionSimulator(c, tc)
+        duration = simulator.simulate()
+        print("Limb first: " + limb_first + ", tiles: " + str(
+            len(tc.list_of_tiles_sorted)) + ", alignments: " + str(
+            simulator.number_of_alignments) + ", duration: " + str(
+            round(duration / 60., 1)) + " minutes, total slew time: " + str(
+            round(sum([event['slew_time'] for event in simulator.timeline if
+                       event['event'] == "tile"]), 1)) + " seconds.")
+
+    window = simulator.observation_window(me, start_seconds)
+    if window is None:
+        print("The moon does not rise above the minimum altitude.")
+    else:
+        print("Moon above " + str(c.simulation_minimum_altitude) + " degrees for " + str(
+            round((window[1] - window[0]) / 3600., 2)) + " hours, session fits: " + str(
+            simulator.fits_into_window(me, start_seconds)))
+
+    # Simulate alignment errors growing with time since the last alignment.
+    simulator = SessionSimulator(c, tc, alignment_error=lambda seconds: seconds / 200.)
+    simulator.simulate()
+    print("With growing alignment errors: alignments: " + str(
+        simulator.number_of_alignments) + ", chain alignments: " + str(
+        simulator.number_of_chain_alignments) + ", repeated tiles: " + str(
+        simulator.number_of_repeated_tiles) + ", duration: " + str(
+        round(simulator.total_duration / 60., 1)) + " minutes.")
+    for event in simulator.timeline[:10]:
+        print(event)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (c) 2016 Rolf Hempel, rolf6419@gmx.de
+
+This file is part of the MoonPanoramaMaker tool (MPM).
+https://github.com/Rolf-Hempel/MoonPanoramaMaker
+
+MPM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with MPM.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+from math import radians
+
+import numpy as np
+
+from miscellaneous import Miscellaneous
+from session_clock import SessionClock
+
+
+class SettleDetector:
+    """
+    After a slew the telescope image keeps moving for a while (mount vibrations, backlash). Rather
+    than waiting for a fixed time, this class captures quick still images with strong compression
+    and measures the shift between consecutive frames by phase correlation. The telescope is
+    considered settled as soon as a given number of consecutive shifts stay below a threshold. If
+    this does not happen within a time-out, the wait is ended anyway.
+
+    """
+
+    def __init__(self, configuration, camera_socket, pixel_angle, compression_factor):
+        """
+        Initialize the settle detector.
+
+        :param configuration: object containing parameters set by the user
+        :param camera_socket: the socket_client object used by the camera
+        :param pixel_angle: angle corresponding to a single camera pixel (radians)
+        :param compression_factor: compression factor of the still images used for
+                                   auto-alignment. The settle frames are compressed further.
+        """
+
+        self.configuration = configuration
+        self.camera_socket = camera_socket
+        # The camera interface accepts compression factors with two digits only.
+        self.compression_factor = max(min(int(
+            compression_factor * configuration.settle_extra_compression), 99), 1)
+        # Threshold for the frame shift, in pixels of the compressed frames.
+        self.threshold = radians(configuration.settle_shift_threshold / 3600.) / (
+                pixel_angle * self.compression_factor)
+
+    def capture(self):
+        """
+        Capture a compressed still image, and prepare it for phase correlation (subtract the
+        mean, apply a Hann window to suppress edge effects) and compute its Fourier transform.
+
+        :return: (Fourier transform of the frame, shape of the frame)
+        """
+
+        try:
+            (image_array, width, height, dynamic) = self.camera_socket.acquire_still_image(
+                self.compression_factor)
+        except:
+            raise RuntimeError("Acquisition of settle frame failed.")
+        frame = image_array.astype(np.float64)
+        frame -= frame.mean()
+        window = np.outer(np.hanning(frame.shape[0]), np.hanning(frame.shape[1]))
+        return np.fft.rfft2(frame * window), frame.shape
+
+    @staticmethod
+    def frame_shift(spectrum_1, spectrum_2, shape):
+        """
+        Compute the translation between two frames by phase correlation. The peak position is
+        refined to sub-pixel accuracy by fitting a parabola through the peak and its neighbors.
+
+        :param spectrum_1: Fourier transform of the first frame
+        :param spectrum_2: Fourier transform of the second frame
+        :param shape: shape of the frames (pixels in y, pixels in x)
+        :return: (shift in y, shift in x) in pixels
+        """
+
+        cross_power = spectrum_2 * np.conj(spectrum_1)
+        cross_power /= np.maximum(np.abs(cross_power), 1.e-12)
+        correlation = np.fft.irfft2(cross_power, s=shape)
+        peak = np.unravel_index(np.argmax(correlation), shape)
+        shift = []
+        for axis in range(2):
+            index = list(peak)
+            values = []
+            for offset in (-1, 0, 1):
+                index[axis] = (peak[axis] + offset) % shape[axis]
+                values.append(correlation[tuple(index)])
+            denominator = values[0] - 2. * values[1] + values[2]
+            fraction = 0.5 * (values[0] - values[2]) / denominator if denominator else 0.
+            # Shifts beyond half the frame size are negative shifts (cyclic correlation).
+            position = peak[axis] + fraction
+            if position > shape[axis] / 2.:
+                position -= shape[axis]
+            shift.append(position)
+        return shift[0], shift[1]
+
+    def wait(self):
+        """
+        Capture frames until the telescope is settled or the time-out is reached. Each frame is
+        compared with the first frame of the current run of stable frames, so that a slow
+        creep or the turning point of an oscillation is not mistaken for a settled telescope.
+
+        :return: True, if the telescope has settled, False if the time-out was reached. If a
+                 frame cannot be captured, a RuntimeError is raised.
+        """
+
+        start = SessionClock.elapsed()
+        (reference_spectrum, shape) = self.capture()
+        stable_frames = 0
+        shifts = []
+        while SessionClock.elapsed() - start < self.configuration.settle_timeout:
+            (spectrum, shape) = self.capture()
+            (shift_y, shift_x) = self.frame_shift(reference_spectrum, spectrum, shape)
+            shift = float(np.hypot(shift_x, shift_y))
+            shifts.append(round(shift, 1))
+            if shift <= self.threshold:
+                stable_frames += 1
+                if stable_frames >= self.configuration.settle_stable_frames:
+                    if self.configuration.protocol_level > 2:
+                        Miscellaneous.protocol("Telescope settled after " + str(
+                            round(SessionClock.elapsed() - start, 1)) +
+                            " seconds, frame shifts (pixels): " + str(shifts) + ".")
+                    return True
+            else:
+                # The image is still moving. Start a new run with the current frame as reference.
+                stable_frames = 0
+                reference_spectrum = spectrum
+        if self.configuration.protocol_level > 0:
+            Miscellaneous.protocol("Warning: Telescope not settled after " + str(
+                self.configuration.settle_timeout) + " seconds, frame shifts (pixels): " + str(
+                shifts) + ".")
+        return False
+
+
+if __name__ == "__main__":
+    import time
+    from math import exp, cos
+
+    import configuration
+
+    class SimulatedCamera:
+        """
+        Simulated camera: A random texture which oscillates with decaying amplitude after a slew.
+        """
+
+        def __init__(self):
+            rng = np.random.default_rng(4)
+            texture = rng.normal(0., 1., (240, 320))
+            # Smooth the texture to get features larger than a pixel.
+            spectrum = np.fft.fft2(texture) * np.exp(-np.add.outer(
+                np.fft.fftfreq(240) ** 2, np.fft.fftfreq(320) ** 2) * 400.)
+            self.spectrum = spectrum
+            self.start = time.time()
+
+        @staticmethod
+        def amplitude(elapsed):
+            return 20. * exp(-elapsed)
+
+        def acquire_still_image(self, compression_factor):
+            # Damped oscillation of the image: 20 pixels amplitude, period 2 seconds, decay time
+            # 1 second.
+            elapsed = time.time() - self.start
+            shift = self.amplitude(elapsed) * cos(np.pi * elapsed)
+            phase = np.exp(-2j * np.pi * np.fft.fftfreq(320) * shift)[np.newaxis, :]
+            image = np.real(np.fft.ifft2(self.spectrum * phase))
+            image = ((image - image.min()) / (image.max() - image.min()) * 255.).astype(np.uint8)
+            # Transfer time of a compressed still image.
+            time.sleep(0.1)
+            return image, image.shape[1], image.shape[0], 1
+
+    c = configuration.Configuration()
+    c.protocol_level = 3
+    # One simulated pixel corresponds to one arc second.
+    detector = SettleDetector(c, SimulatedCamera(), radians(1. / 3600.),
+                              1. / c.settle_extra_compression)
+    print("Threshold (pixels): " + str(round(detector.threshold, 2)))
+    start = time.time()
+    settled = detector.wait()
+    print("Settled: " + str(settled) + ", waiting time: " + str(
+        round(time.time() - start, 2)) + " seconds, remaining oscillation amplitude: " + str(
+        round(SimulatedCamera.amplitude(time.time() - start), 2)) + " pixels.")
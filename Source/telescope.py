@@ -34,14 +34,16 @@ INDI thread has acknowledged completion. Others are non-blocking.
 
 import threading
 import time
-from datetime import datetime
 from enum import IntEnum
 from math import degrees, radians, pi
 
 import numpy
 from exceptions import TelescopeException, ASCOMImportException, ASCOMConnectException, \
     ASCOMPropertyException, INDIImportException, INDIConnectException, INDIPropertyException
+from instruction_queue import Instruction, InstructionQueue
 from miscellaneous import Miscellaneous
+from mount_model import MountModel
+from session_clock import SessionClock
 
 
 class OperateTelescopeASCOM(threading.Thread):
@@ -68,53 +70,14 @@ class OperateTelescopeASCOM(threading.Thread):
         self.initialized = False
         self.initialization_error = ""
 
-        # Initialize an empty instruction queue.
-        self.instructions = []
-
-        # Define instruction types (as dictionaries). Every instruction has a "name" field
-        self.slew_to = {}
-        self.slew_to['name'] = "slew to"
-
-        self.lookup_tel_position = {}
-        self.lookup_tel_position['name'] = "lookup tel position"
-
-        self.calibrate = {}
-        self.calibrate['name'] = "calibrate"
-
-        self.start_guiding = {}
-        self.start_guiding['name'] = "start guiding"
-
-        self.continue_guiding = {}
-        self.continue_guiding['name'] = "continue guiding"
-
-        self.stop_guiding = {}
-        self.stop_guiding['name'] = "stop guiding"
-
-        self.start_moving_north = {}
-        self.start_moving_north['name'] = "start moving north"
-        self.stop_moving_north = {}
-        self.stop_moving_north['name'] = "stop moving north"
-
-        self.start_moving_south = {}
-        self.start_moving_south['name'] = "start moving south"
-        self.stop_moving_south = {}
-        self.stop_moving_south['name'] = "stop moving south"
-
-        self.start_moving_east = {}
-        self.start_moving_east['name'] = "start moving east"
-        self.stop_moving_east = {}
-        self.stop_moving_east['name'] = "stop moving east"
-
-        self.start_moving_west = {}
-        self.start_moving_west['name'] = "start moving west"
-        self.stop_moving_west = {}
-        self.stop_moving_west['name'] = "stop moving west"
-
-        self.pulse_correction = {}
-        self.pulse_correction['name'] = "pulse correction"
-
-        self.terminate = {}
-        self.terminate['name'] = "terminate"
+        # Initialize an empty instruction queue. Instructions are "Instruction" objects, created
+        # by the methods of class "Telescope". Their names are: "slew to", "lookup tel position",
+        # "calibrate", "start guiding", "continue guiding", "stop guiding", "start moving <dir>",
+        # "stop moving <dir>" (<dir> = north, south, east, west), "pulse correction", "terminate".
+        self.instructions = InstructionQueue()
+        # This event is set when the driver initialization is finished, either successfully or
+        # with an error.
+        self.initialization_finished = threading.Event()
 
         # Initialize default directions for the ASCOM instruction "PulseGuide"
         self.direction_north = 0
@@ -254,6 +217,7 @@ class OperateTelescopeASCOM(threading.Thread):
             # Save the error message to be looked up by high-level telescope thread.
             self.initialization_error = "Pythoncom module could not be imported. " \
                                         "Is this a Windows system?"
+            self.initialization_finished.set()
             if self.configuration.protocol_level > 0:
                 Miscellaneous.protocol("Ending OperateTelescopeASCOM thread.")
             return
@@ -271,6 +235,7 @@ class OperateTelescopeASCOM(threading.Thread):
         except Exception as e:
             # Save the error message to be looked up by high-level telescope thread.
             self.initialization_error = str(e)
+            self.initialization_finished.set()
             # Clean up the low-level telescope thread and exit.
             pythoncom.CoUninitialize()
             if self.configuration.protocol_level > 0:
@@ -281,219 +246,216 @@ class OperateTelescopeASCOM(threading.Thread):
         if self.configuration.protocol_level > 0:
             Miscellaneous.protocol("OperateTelescopeASCOM: telescope driver is working properly.")
         self.initialized = True
+        self.initialization_finished.set()
 
-        # Serve the instruction queue, until the "terminate" instruction is encountered.
+        # Serve the instruction queue, until the "terminate" instruction is encountered. The "get"
+        # method blocks until the next instruction is due.
         while True:
-            if len(self.instructions) > 0:
-                # Get the next instruction from the queue, look up its type (name), and execute it.
-                instruction = self.instructions.pop()
-
-                # Slew the telescope to a given (RA, DE) position.
-                if instruction['name'] == "slew to":
-                    if self.configuration.protocol_level > 1:
-                        Miscellaneous.protocol("ASCOM: Slewing telescope to RA " + str(
-                            round(instruction['rect'] * 15., 5)) + ", DE " + str(
-                            round(instruction['decl'], 5)) + " (degrees).")
-                    # Instruct the ASCOM driver to execute the SlewToCoordinates instruction.
-                    # Please note that coordinates are in hours (RA) and degrees (DE).
-                    self.tel.SlewToCoordinates(instruction['rect'], instruction['decl'])
-
-                # Wait until the mount is standing still, then look up the current mount position.
-                elif instruction['name'] == "lookup tel position":
-                    # Initialize (rect, decl) with impossible coordinates, and iteration count to 0.
-                    rect = 25.
-                    decl = 91.
-                    iter_count = 0
-                    # Idle loop until changes in RA,DE are smaller than specified threshold.
-                    while (abs(self.tel.RightAscension - rect) > self.configuration.conf.getfloat(
-                            "ASCOM", "telescope lookup precision") / 54000. or abs(
-                        self.tel.Declination - decl) > self.configuration.conf.getfloat(
-                            "ASCOM", "telescope lookup precision") / 3600.):
-                        rect = self.tel.RightAscension
-                        decl = self.tel.Declination
-                        iter_count += 1
-                        time.sleep(self.configuration.conf.getfloat("ASCOM", "wait interval"))
-                    # Stationary state reached, copy measured position (in radians) into dict.
-                    instruction['ra'] = radians(rect * 15.)
-                    instruction['de'] = radians(decl)
-                    # Signal that the instruction is finished.
-                    instruction['finished'] = True
-                    if self.configuration.protocol_level > 2:
-                        Miscellaneous.protocol(
-                            "OperateTelescopeASCOM: Position looked-up, RA " + str(
-                                round(rect * 15., 5)) + ", DE " + str(
-                                round(decl, 5)) + " (degrees), iterations: " + str(
-                                iter_count) + ".")
-
-                # Find out which ASCOM directions correspond to directions in the sky.
-                elif instruction['name'] == "calibrate":
-                    # Look up the current RA position of the mount.
-                    ra_begin = self.tel.RightAscension
-                    # Look up the specified length of the test movements in RA, DE.
-                    calibrate_pulse_length = instruction['calibrate_pulse_length']
-                    # Issue an ASCOM "move east" instruction and wait a short time.
-                    self.tel.PulseGuide(2, calibrate_pulse_length)
-                    time.sleep(calibrate_pulse_length / 500.)
-                    # Look up resulting mount position in the sky.
-                    ra_end = self.tel.RightAscension
-                    # The end point was west of the initial point. Flip the RA directions.
-                    if ra_end < ra_begin:
-                        self.direction_east = 3
-                        self.direction_west = 2
-                    # Do the same in declination.
-                    de_begin = self.tel.Declination
-                    self.tel.PulseGuide(0, calibrate_pulse_length)
-                    time.sleep(calibrate_pulse_length / 500.)
-                    de_end = self.tel.Declination
-                    if de_end < de_begin:
-                        self.direction_north = 1
-                        self.direction_south = 0
-                    # Now the direction variables correspond to true coordinates in the sky.
-                    instruction['finished'] = True
-
-                # Start guiding the telescope with given rates in RA, DE. Guiding will continue
-                # (even if other instructions are handled in the meantime) until a "stop guiding"
-                # instruction is found in the queue.
-                elif instruction['name'] == "start guiding":
-                    # Look up the specified guide rates.
-                    rate_ra = instruction['rate_ra']
-                    rate_de = instruction['rate_de']
-                    # Define the start point: time and position (RA,DE).
-                    start_time = time.mktime(datetime.now().timetuple())
-                    start_ra = radians(self.tel.RightAscension * 15.)
-                    start_de = radians(self.tel.Declination)
-                    # Set guiding directions in RA, DE.
-                    if numpy.sign(rate_ra) > 0:
-                        direction_ra = self.direction_east
-                    else:
-                        direction_ra = self.direction_west
-                    if numpy.sign(rate_de) > 0:
-                        direction_de = self.direction_north
-                    else:
-                        direction_de = self.direction_south
-                    # The actual guiding is done in a chain of "continue_guiding" instructions.
-                    continue_guiding_instruction = self.continue_guiding
-                    # Insert the first instruction into the queue.
-                    self.instructions.insert(0, continue_guiding_instruction)
-
-                # This instruction checks if the telescope is ahead or behind the moving target.
-                # If it is behind, an ASCOM PulseGuide instruction of specified length is issued.
-                # Otherwise nothing is done. The assumption is that many more instructions are
-                # issued than PulseGuides are necessary. Therefore, it cannot happen that the
-                # telescope lags behind permanently.
-                elif instruction['name'] == "continue guiding":
-                    # Look up the time and current pointing of the telescope.
-                    current_time = time.mktime(datetime.now().timetuple())
-                    current_ra = radians(self.tel.RightAscension * 15.)
-                    current_de = radians(self.tel.Declination)
-                    # Compute where the telescope should be aimed at this time.
-                    target_ra = start_ra + rate_ra * (current_time - start_time)
-                    target_de = start_de + rate_de * (current_time - start_time)
-                    # The telescope has been moved too little in RA. Issue a PulseGuide.
-                    if abs(target_ra - start_ra) > abs(current_ra - start_ra):
-                        if self.configuration.protocol_level > 2:
-                            Miscellaneous.protocol("OperateTelescopeASCOM: Pulse guide in RA.")
-                        self.tel.PulseGuide(direction_ra, int(
-                            self.configuration.conf.getfloat("ASCOM", "guiding interval") * 1000.))
-                    # The telescope has been moved too little in DE. Issue a PulseGuide.
-                    if abs(target_de - start_de) > abs(current_de - start_de):
-                        if self.configuration.protocol_level > 2:
-                            Miscellaneous.protocol("OperateTelescopeASCOM: Pulse guide in DE.")
-                        self.tel.PulseGuide(direction_de, int(
-                            self.configuration.conf.getfloat("ASCOM", "guiding interval") * 1000.))
-                    # Re-insert this instruction into the queue.
-                    self.instructions.insert(0, instruction)
-                    time.sleep(self.configuration.conf.getfloat("ASCOM", "guiding interval"))
-
-                # Stop guiding by removing all instructions of type "continue guiding" from the
-                # queue.
-                elif instruction['name'] == "stop guiding":
-                    self.remove_instruction(self.continue_guiding)
-                    instruction['finished'] = True
-
-                # These instructions are used when the user presses one of the arrow keys.
-                elif instruction['name'] == "start moving north":
-                    # Issue a PulseGuide in the specified direction.
-                    self.tel.PulseGuide(self.direction_north,
-                                        int(self.configuration.polling_interval * 1000.))
-                    # Re-insert this instruction into the queue, and wait a short time.
-                    self.instructions.insert(0, instruction)
-                    time.sleep(self.configuration.polling_interval)
-
-                # This instruction is used when the "arrow up" key is released.
-                elif instruction['name'] == "stop moving north":
-                    # Remove all "start moving north" instructions from the queue.
-                    self.remove_instruction(self.start_moving_north)
-                    instruction['finished'] = True
-
-                # The following instructions are analog to the two above. They handle the three
-                # other coordinate directions.
-                elif instruction['name'] == "start moving south":
-                    self.tel.PulseGuide(self.direction_south,
-                                        int(self.configuration.polling_interval * 1000.))
-                    self.instructions.insert(0, instruction)
-                    time.sleep(self.configuration.polling_interval)
-
-                elif instruction['name'] == "stop moving south":
-                    self.remove_instruction(self.start_moving_south)
-                    instruction['finished'] = True
-
-                elif instruction['name'] == "start moving east":
-                    self.tel.PulseGuide(self.direction_east,
-                                        int(self.configuration.polling_interval * 1000.))
-                    self.instructions.insert(0, instruction)
-                    time.sleep(self.configuration.polling_interval)
-
-                elif instruction['name'] == "stop moving east":
-                    self.remove_instruction(self.start_moving_east)
-                    instruction['finished'] = True
-
-                elif instruction['name'] == "start moving west":
-                    self.tel.PulseGuide(self.direction_west,
-                                        int(self.configuration.polling_interval * 1000.))
-                    self.instructions.insert(0, instruction)
-                    time.sleep(self.configuration.polling_interval)
-
-                elif instruction['name'] == "stop moving west":
-                    self.remove_instruction(self.start_moving_west)
-                    instruction['finished'] = True
-
-                # Issue an ASCOM PulseGuide instruction with given direction and length.
-                elif instruction['name'] == "pulse correction":
-                    # If a "calibrate" instruction was executed, correct the ASCOM direction values
-                    # (0,1,2,3) to reflect the real motion of the telescope.
-                    direction = [self.direction_north, self.direction_south, self.direction_east,
-                                 self.direction_west][instruction['direction']]
-                    # The pulse_length is counted in milliseconds.
-                    pulse_length = instruction['pulse_length']
-                    # Perform the ASCOM PulseGuide instruction.
-                    self.tel.PulseGuide(direction, pulse_length)
-                    instruction['finished'] = True
-
-                # If the "terminate" instruction is encountered, exit the loop
-                elif instruction['name'] == "terminate":
-                    break
-            # If no instruction is in the queue, wait a short time.
-            else:
-                time.sleep(self.configuration.polling_interval)
+            instruction = self.instructions.get()
+            # If the "terminate" instruction is encountered, exit the loop
+            if instruction.name == "terminate":
+                break
+            try:
+                self.execute(instruction)
+            except Exception as e:
+                if self.configuration.protocol_level > 0:
+                    Miscellaneous.protocol("OperateTelescopeASCOM: Instruction '" +
+                                           instruction.name + "' failed: " + str(e))
+                # Nobody waits for a repeating instruction (guiding, moving with arrow keys).
+                # Try again after the usual delay, so that a transient error does not end it.
+                # Otherwise hand the error to the thread waiting for the instruction. In both
+                # cases keep serving the queue.
+                delay = self.repeat_delay(instruction)
+                if delay is not None:
+                    self.instructions.put(instruction, delay=delay)
+                else:
+                    instruction.fail(TelescopeException(
+                        "ASCOM: Instruction '" + instruction.name + "' failed: " + str(e)))
 
         # See comment at the beginning of this method.
         pythoncom.CoUninitialize()
         if self.configuration.protocol_level > 0:
             Miscellaneous.protocol("Ending OperateTelescopeASCOM thread.")
 
-    def remove_instruction(self, instruction):
+    def repeat_delay(self, instruction):
         """
-        Remove all instructions of type "instruction" from the queue.
+        Repeating instructions re-insert themselves into the queue after execution. Look up the
+        delay after which such an instruction is executed again.
 
-        :param instruction: instruction object
+        :param instruction: Instruction object
+        :return: delay (seconds), or None if the instruction is not repeated
+        """
+
+        if instruction.name == "continue guiding":
+            return self.configuration.conf.getfloat("ASCOM", "guiding interval")
+        elif instruction.name.startswith("start moving "):
+            return self.configuration.polling_interval
+        return None
+
+    def execute(self, instruction):
+        """
+        Execute an instruction taken from the queue.
+
+        :param instruction: Instruction object
         :return: -
         """
 
-        # Loop over the entire instruction queue and remove instructions of given type.
-        for inst in self.instructions:
-            if instruction['name'] == inst['name']:
-                self.instructions.remove(inst)
+        # Slew the telescope to a given (RA, DE) position.
+        if instruction.name == "slew to":
+            if self.configuration.protocol_level > 1:
+                Miscellaneous.protocol("ASCOM: Slewing telescope to RA " + str(
+                    round(instruction['rect'] * 15., 5)) + ", DE " + str(
+                    round(instruction['decl'], 5)) + " (degrees).")
+            # Instruct the ASCOM driver to execute the SlewToCoordinates instruction.
+            # Please note that coordinates are in hours (RA) and degrees (DE).
+            self.tel.SlewToCoordinates(instruction['rect'], instruction['decl'])
+            instruction.finish()
+
+        # Wait until the mount is standing still, then look up the current mount position.
+        elif instruction.name == "lookup tel position":
+            # Initialize (rect, decl) with impossible coordinates, and iteration count to 0.
+            rect = 25.
+            decl = 91.
+            iter_count = 0
+            # Idle loop until changes in RA,DE are smaller than specified threshold.
+            while (abs(self.tel.RightAscension - rect) > self.configuration.conf.getfloat(
+                    "ASCOM", "telescope lookup precision") / 54000. or abs(
+                self.tel.Declination - decl) > self.configuration.conf.getfloat(
+                    "ASCOM", "telescope lookup precision") / 3600.):
+                rect = self.tel.RightAscension
+                decl = self.tel.Declination
+                iter_count += 1
+                time.sleep(self.configuration.conf.getfloat("ASCOM", "wait interval"))
+            if self.configuration.protocol_level > 2:
+                Miscellaneous.protocol(
+                    "OperateTelescopeASCOM: Position looked-up, RA " + str(
+                        round(rect * 15., 5)) + ", DE " + str(
+                        round(decl, 5)) + " (degrees), iterations: " + str(
+                        iter_count) + ".")
+            # Stationary state reached, return the measured position (in radians).
+            instruction.finish((radians(rect * 15.), radians(decl)))
+
+        # Find out which ASCOM directions correspond to directions in the sky.
+        elif instruction.name == "calibrate":
+            # Look up the current RA position of the mount.
+            ra_begin = self.tel.RightAscension
+            # Look up the specified length of the test movements in RA, DE.
+            calibrate_pulse_length = instruction['calibrate_pulse_length']
+            # Issue an ASCOM "move east" instruction and wait a short time.
+            self.tel.PulseGuide(2, calibrate_pulse_length)
+            time.sleep(calibrate_pulse_length / 500.)
+            # Look up resulting mount position in the sky.
+            ra_end = self.tel.RightAscension
+            # The end point was west of the initial point. Flip the RA directions.
+            if ra_end < ra_begin:
+                self.direction_east = 3
+                self.direction_west = 2
+            # Do the same in declination.
+            de_begin = self.tel.Declination
+            self.tel.PulseGuide(0, calibrate_pulse_length)
+            time.sleep(calibrate_pulse_length / 500.)
+            de_end = self.tel.Declination
+            if de_end < de_begin:
+                self.direction_north = 1
+                self.direction_south = 0
+            # Now the direction variables correspond to true coordinates in the sky.
+            instruction.finish()
+
+        # Start guiding the telescope with given rates in RA, DE. Guiding will continue
+        # (even if other instructions are handled in the meantime) until a "stop guiding"
+        # instruction is found in the queue.
+        elif instruction.name == "start guiding":
+            # Set guiding directions in RA, DE.
+            if numpy.sign(instruction['rate_ra']) > 0:
+                direction_ra = self.direction_east
+            else:
+                direction_ra = self.direction_west
+            if numpy.sign(instruction['rate_de']) > 0:
+                direction_de = self.direction_north
+            else:
+                direction_de = self.direction_south
+            # The actual guiding is done by a "continue guiding" instruction which re-inserts
+            # itself into the queue. It carries the guide rates and accelerations, and the start
+            # point: time and position (RA,DE).
+            self.instructions.put(Instruction(
+                "continue guiding", rate_ra=instruction['rate_ra'],
+                rate_de=instruction['rate_de'], accel_ra=instruction['accel_ra'],
+                accel_de=instruction['accel_de'], start_time=SessionClock.elapsed(),
+                start_ra=radians(self.tel.RightAscension * 15.),
+                start_de=radians(self.tel.Declination), direction_ra=direction_ra,
+                direction_de=direction_de))
+            instruction.finish()
+
+        # This instruction checks if the telescope is ahead or behind the moving target.
+        # If it is behind, an ASCOM PulseGuide instruction of specified length is issued.
+        # Otherwise nothing is done. The assumption is that many more instructions are
+        # issued than PulseGuides are necessary. Therefore, it cannot happen that the
+        # telescope lags behind permanently.
+        elif instruction.name == "continue guiding":
+            # Look up the time and current pointing of the telescope.
+            current_time = SessionClock.elapsed()
+            current_ra = radians(self.tel.RightAscension * 15.)
+            current_de = radians(self.tel.Declination)
+            # Compute where the telescope should be aimed at this time.
+            # Include the change of the moon's speed (second order term).
+            elapsed_time = current_time - instruction['start_time']
+            start_ra = instruction['start_ra']
+            start_de = instruction['start_de']
+            target_ra = start_ra + (instruction['rate_ra'] + 0.5 * instruction[
+                'accel_ra'] * elapsed_time) * elapsed_time
+            target_de = start_de + (instruction['rate_de'] + 0.5 * instruction[
+                'accel_de'] * elapsed_time) * elapsed_time
+            # The telescope has been moved too little in RA. Issue a PulseGuide.
+            if abs(target_ra - start_ra) > abs(current_ra - start_ra):
+                if self.configuration.protocol_level > 2:
+                    Miscellaneous.protocol("OperateTelescopeASCOM: Pulse guide in RA.")
+                self.tel.PulseGuide(instruction['direction_ra'], int(
+                    self.configuration.conf.getfloat("ASCOM", "guiding interval") * 1000.))
+            # The telescope has been moved too little in DE. Issue a PulseGuide.
+            if abs(target_de - start_de) > abs(current_de - start_de):
+                if self.configuration.protocol_level > 2:
+                    Miscellaneous.protocol("OperateTelescopeASCOM: Pulse guide in DE.")
+                self.tel.PulseGuide(instruction['direction_de'], int(
+                    self.configuration.conf.getfloat("ASCOM", "guiding interval") * 1000.))
+            # Re-insert this instruction into the queue, to be executed after the guiding
+            # interval. Other instructions are served in the meantime.
+            self.instructions.put(instruction, delay=self.repeat_delay(instruction))
+
+        # Stop guiding by cancelling the "continue guiding" instruction in the queue.
+        elif instruction.name == "stop guiding":
+            self.instructions.cancel("continue guiding")
+            instruction.finish()
+
+        # These instructions are used when the user presses one of the arrow keys. Issue a
+        # PulseGuide in the specified direction. Re-insert the instruction into the queue, to be
+        # executed again after a short time.
+        elif instruction.name.startswith("start moving "):
+            direction = {"north": self.direction_north, "south": self.direction_south,
+                         "east": self.direction_east, "west": self.direction_west}[
+                instruction.name[len("start moving "):]]
+            self.tel.PulseGuide(direction, int(self.configuration.polling_interval * 1000.))
+            self.instructions.put(instruction, delay=self.repeat_delay(instruction))
+
+        # These instructions are used when the arrow key is released. Cancel the corresponding
+        # "start moving" instruction in the queue.
+        elif instruction.name.startswith("stop moving "):
+            self.instructions.cancel("start" + instruction.name[len("stop"):])
+            instruction.finish()
+
+        # Issue an ASCOM PulseGuide instruction with given direction and length.
+        elif instruction.name == "pulse correction":
+            # If a "calibrate" instruction was executed, correct the ASCOM direction values
+            # (0,1,2,3) to reflect the real motion of the telescope.
+            direction = [self.direction_north, self.direction_south, self.direction_east,
+                         self.direction_west][instruction['direction']]
+            # The pulse_length is counted in milliseconds.
+            pulse_length = instruction['pulse_length']
+            # Perform the ASCOM PulseGuide instruction.
+            self.tel.PulseGuide(direction, pulse_length)
+            instruction.finish()
+
+        else:
+            raise TelescopeException("Unknown instruction '" + instruction.name + "'.")
 
 
 class interfaceType(IntEnum):
@@ -543,53 +505,14 @@ class OperateTelescopeINDI(threading.Thread):
         self.initialization_error = ""
         self.instruction_error = ""
 
-        # Initialize an empty instruction queue.
-        self.instructions = []
-
-        # Define instruction types (as dictionaries). Every instruction has a "name" field
-        self.slew_to = {}
-        self.slew_to['name'] = "slew to"
-
-        self.lookup_tel_position = {}
-        self.lookup_tel_position['name'] = "lookup tel position"
-
-        self.calibrate = {}
-        self.calibrate['name'] = "calibrate"
-
-        self.start_guiding = {}
-        self.start_guiding['name'] = "start guiding"
-
-        self.continue_guiding = {}
-        self.continue_guiding['name'] = "continue guiding"
-
-        self.stop_guiding = {}
-        self.stop_guiding['name'] = "stop guiding"
-
-        self.start_moving_north = {}
-        self.start_moving_north['name'] = "start moving north"
-        self.stop_moving_north = {}
-        self.stop_moving_north['name'] = "stop moving north"
-
-        self.start_moving_south = {}
-        self.start_moving_south['name'] = "start moving south"
-        self.stop_moving_south = {}
-        self.stop_moving_south['name'] = "stop moving south"
-
-        self.start_moving_east = {}
-        self.start_moving_east['name'] = "start moving east"
-        self.stop_moving_east = {}
-        self.stop_moving_east['name'] = "stop moving east"
-
-        self.start_moving_west = {}
-        self.start_moving_west['name'] = "start moving west"
-        self.stop_moving_west = {}
-        self.stop_moving_west['name'] = "stop moving west"
-
-        self.pulse_correction = {}
-        self.pulse_correction['name'] = "pulse correction"
-
-        self.terminate = {}
-        self.terminate['name'] = "terminate"
+        # Initialize an empty instruction queue. Instructions are "Instruction" objects, created
+        # by the methods of class "Telescope". Their names are: "slew to", "lookup tel position",
+        # "calibrate", "start guiding", "continue guiding", "stop guiding", "start moving <dir>",
+        # "stop moving <dir>" (<dir> = north, south, east, west), "pulse correction", "terminate".
+        self.instructions = InstructionQueue()
+        # This event is set when the driver initialization is finished, either successfully or
+        # with an error.
+        self.initialization_finished = threading.Event()
 
         # Initialize default directions for the "PulseGuide" instructions
         self.direction_north = 0
@@ -608,9 +531,32 @@ class OperateTelescopeINDI(threading.Thread):
         self.telescope_guideNS = None
         self.telescope_guideWE = None
 
+        # Maximum time (seconds) to wait for an INDI property during connection setup.
+        self.time_out = self.configuration.polling_time_out_count * \
+            self.configuration.polling_interval
+        # Update count of the last telescope position update received before the most recent
+        # slew (-1: no update received yet).
+        self.slew_update_count = -1
+
         if self.configuration.protocol_level > 0:
             Miscellaneous.protocol("OperateTelescopeINDI thread initialized.")
 
+    def get_property(self, property_name, get_function):
+        """
+        Wait until a property of the telescope device is defined by the INDI server, then get the
+        property vector.
+
+        :param property_name: name of the property
+        :param get_function: device method which returns the property vector, e.g.
+                             "self.device_telescope.getNumber"
+        :return: property vector, or None if it is not defined within the time-out
+        """
+
+        if self.indiclnt.wait_for_property(self.device_telescope.getDeviceName(), property_name,
+                                           self.time_out):
+            return get_function(property_name)
+        return None
+
     def connect_and_test_telescope(self):
         """
         Access the telescope driver via the INDI server, connect to it, and find out if it supports
@@ -642,23 +588,18 @@ class OperateTelescopeINDI(threading.Thread):
                 "No INDI server running on " + self.indiclnt.getHost() + ":" + str(
                     self.indiclnt.getPort()) + ".")
 
-        # Get the list of available devices.
-        for iteration in range(self.configuration.polling_time_out_count):
-            time.sleep(self.configuration.polling_interval)
-            if len(self.device_list) > 0:
-                break
-        if len(self.device_list) == 0:
+        # Get the list of available devices. The INDI client wakes up this thread as soon as
+        # the first device is announced.
+        if not self.indiclnt.wait_for(lambda: len(self.device_list) > 0, self.time_out):
             raise INDIConnectException("INDI: Unable to get the device list.")
 
         # Look for a device which implements the TELESCOPE_INTERFACE. Exit the
         # loop when the first such driver is found.
         self.device_telescope = None
-        for device in self.device_list:
-            driver_info = device.getText("DRIVER_INFO")
-            for iteration in range(self.configuration.polling_time_out_count):
-                time.sleep(self.configuration.polling_interval)
-                if driver_info:
-                    break
+        for device in list(self.device_list):
+            driver_info = None
+            if self.indiclnt.wait_for_property(device.getDeviceName(), "DRIVER_INFO",
+                                               self.time_out):
                 driver_info = device.getText("DRIVER_INFO")
             if not driver_info:
                 raise INDIConnectException("INDI: Unable to get driver info.")
@@ -675,11 +616,7 @@ class OperateTelescopeINDI(threading.Thread):
             raise INDIConnectException("INDI: Unable to find a driver of type 'telescope'.")
 
         # Wait for the CONNECTION property be defined for telescope.
-        for iteration in range(self.configuration.polling_time_out_count):
-            time.sleep(self.configuration.polling_interval)
-            self.telescope_connect = self.device_telescope.getSwitch("CONNECTION")
-            if self.telescope_connect:
-                break
+        self.telescope_connect = self.get_property("CONNECTION", self.device_telescope.getSwitch)
         if not self.telescope_connect:
             raise INDIConnectException("INDI: Unable to get the telescope connection switch.")
 
@@ -693,20 +630,14 @@ class OperateTelescopeINDI(threading.Thread):
             self.telescope_connect[1].s = PyIndi.ISS_OFF  # the "DISCONNECT" switch
             self.indiclnt.sendNewSwitch(self.telescope_connect)  # send this new value to the device
 
-        # Wait for the CONNECTION property be defined for telescope.
-        for iteration in range(self.configuration.polling_time_out_count):
-            time.sleep(self.configuration.polling_interval)
-            if self.device_telescope.isConnected():
-                break
-        if not self.device_telescope.isConnected():
+        # Wait for the telescope device to be connected. Every update of the CONNECTION switch
+        # wakes up this thread.
+        if not self.indiclnt.wait_for(self.device_telescope.isConnected, self.time_out):
             raise INDIConnectException("INDI: Unable to connect with the telescope.")
 
         # Get the RA/DE coordinate object.
-        for iteration in range(self.configuration.polling_time_out_count):
-            self.telescope_radec = self.device_telescope.getNumber("EQUATORIAL_EOD_COORD")
-            time.sleep(self.configuration.polling_interval)
-            if self.telescope_radec:
-                break
+        self.telescope_radec = self.get_property("EQUATORIAL_EOD_COORD",
+                                                 self.device_telescope.getNumber)
         if not self.telescope_radec:
             raise INDIConnectException("INDI: Unable to get the RA/DE coordinate object.")
         if self.configuration.protocol_level > 2:
@@ -715,18 +646,12 @@ class OperateTelescopeINDI(threading.Thread):
                 round(self.telescope_radec[1].value, 5)) + " (degrees).")
 
         # Get pulse guide objects.
-        for iteration in range(self.configuration.polling_time_out_count):
-            self.telescope_guideNS = self.device_telescope.getNumber("TELESCOPE_TIMED_GUIDE_NS")
-            time.sleep(self.configuration.polling_interval)
-            if self.telescope_guideNS:
-                break
+        self.telescope_guideNS = self.get_property("TELESCOPE_TIMED_GUIDE_NS",
+                                                   self.device_telescope.getNumber)
         if not self.telescope_guideNS:
             raise INDIConnectException("INDI: Unable to get the guideNS object.")
-        for iteration in range(self.configuration.polling_time_out_count):
-            self.telescope_guideWE = self.device_telescope.getNumber("TELESCOPE_TIMED_GUIDE_WE")
-            time.sleep(self.configuration.polling_interval)
-            if self.telescope_guideWE:
-                break
+        self.telescope_guideWE = self.get_property("TELESCOPE_TIMED_GUIDE_WE",
+                                                   self.device_telescope.getNumber)
         if not self.telescope_guideWE:
             raise INDIConnectException("INDI: Unable to get the guideWE object.")
 
@@ -741,11 +666,8 @@ class OperateTelescopeINDI(threading.Thread):
         import PyIndi
         # We want to set the ON_COORD_SET switch to engage tracking after goto. "device.getSwitch"
         # is a helper to retrieve a property vector.
-        for iteration in range(self.configuration.polling_time_out_count):
-            self.telescope_on_coord_set = self.device_telescope.getSwitch("ON_COORD_SET")
-            if self.telescope_on_coord_set:
-                break
-            time.sleep(self.configuration.polling_interval)
+        self.telescope_on_coord_set = self.get_property("ON_COORD_SET",
+                                                        self.device_telescope.getSwitch)
         if not self.telescope_on_coord_set:
             raise INDIPropertyException("INDI: Unable to get the 'ON_COORD_SET' switch.")
 
@@ -775,10 +697,9 @@ class OperateTelescopeINDI(threading.Thread):
         pulse_guide_speed_index = self.configuration.conf.getint("INDI", "pulse guide speed index")
         pulse_guide_speed = ['SLEW_GUIDE', 'SLEW_CENTERING', 'SLEW_FIND', 'SLEW_MAX'][
             pulse_guide_speed_index]
-        prate = self.device_telescope.getSwitch("TELESCOPE_SLEW_RATE")
-        while not prate or type(prate) != PyIndi.ISwitchVectorProperty:
-            prate = self.device_telescope.getSwitch("TELESCOPE_SLEW_RATE")
-            time.sleep(0.2)
+        prate = self.get_property("TELESCOPE_SLEW_RATE", self.device_telescope.getSwitch)
+        if not prate or type(prate) != PyIndi.ISwitchVectorProperty:
+            raise INDIPropertyException("INDI: Unable to get the 'TELESCOPE_SLEW_RATE' switch.")
         if len(prate) < 1:  # no slew rate
             if self.configuration.protocol_level > 0:
                 Miscellaneous.protocol(
@@ -823,6 +744,7 @@ class OperateTelescopeINDI(threading.Thread):
         except Exception as e:
             # Save the error message to be looked up by high-level telescope thread.
             self.initialization_error = str(e)
+            self.initialization_finished.set()
             # Clean up the low-level telescope thread and exit.
             if self.configuration.protocol_level > 0:
                 Miscellaneous.protocol("Ending OperateTelescopeINDI thread.")
@@ -832,277 +754,31 @@ class OperateTelescopeINDI(threading.Thread):
         if self.configuration.protocol_level > 0:
             Miscellaneous.protocol("OperateTelescopeINDI: telescope driver is working properly.")
         self.initialized = True
+        self.initialization_finished.set()
 
-        # Serve the instruction queue, until the "terminate" instruction is encountered.
+        # Serve the instruction queue, until the "terminate" instruction is encountered. The "get"
+        # method blocks until the next instruction is due.
         while True:
-            if len(self.instructions) > 0:
-                # Get the next instruction from the queue, look up its type (name), and execute it.
-                instruction = self.instructions.pop()
-
-                # Slew the telescope to a given (RA, DE) position.
-                if instruction['name'] == "slew to":
-                    if self.configuration.protocol_level > 1:
-                        Miscellaneous.protocol(
-                            "OperateTelescopeINDI: Slewing telescope to: RA " + str(
-                                round(instruction['rect'] * 15., 5)) + ", DE " + str(
-                                round(instruction['decl'], 5)) + " (degrees).")
-                    # Instruct the INDI driver to execute the SlewToCoordinates instruction.
-                    # Please note that coordinates are in hours (RA) and degrees (DE).
-                    self.telescope_radec[0].value = instruction['rect']
-                    self.telescope_radec[1].value = instruction['decl']
-                    self.indiclnt.sendNewNumber(self.telescope_radec)
-
-                # Wait until the mount is standing still, then look up the current mount position.
-                elif instruction['name'] == "lookup tel position":
-                    # Initialize (rect, decl) with impossible coordinates, and iteration count to 0.
-                    rect = 25.
-                    decl = 91.
-                    iter_count = 0
-                    # Idle loop until changes in RA,DE are smaller than specified threshold.
-                    while (abs(self.telescope_radec[
-                                   0].value - rect) > self.configuration.conf.getfloat("INDI",
-                            "telescope lookup precision") / 54000. or abs(
-                        self.telescope_radec[1].value - decl) > self.configuration.conf.getfloat(
-                        "INDI", "telescope lookup precision") / 3600.):
-                        rect = self.telescope_radec[0].value
-                        decl = self.telescope_radec[1].value
-                        iter_count += 1
-                        time.sleep(self.configuration.conf.getfloat("INDI", "wait interval"))
-
-                    # Stationary state reached, copy measured position (in radians) into dict.
-                    instruction['ra'] = radians(self.telescope_radec[0].value * 15)
-                    instruction['de'] = radians(self.telescope_radec[1].value)
-                    if self.configuration.protocol_level > 2:
-                        Miscellaneous.protocol(
-                            "OperateTelescopeINDI: Position looked-up: RA " + str(
-                                round(self.telescope_radec[0].value * 15., 5)) + ", DE " + str(
-                                round(self.telescope_radec[1].value,
-                                      5)) + " (degrees), iterations: " + str(iter_count) + ".")
-                    # Signal that the instruction is finished.
-                    instruction['finished'] = True
-
-                # Find out which INDI directions correspond to directions in the sky.
-                elif instruction['name'] == "calibrate":
-                    # Look up the current RA position of the mount.
-                    ra_begin = self.telescope_radec[0].value * 15.
-                    # Look up the specified length of the test movements in RA, DE.
-                    calibrate_pulse_length = instruction['calibrate_pulse_length']
-                    # Issue an INDI "move east" instruction and wait a short time.
-                    self.telescope_guideWE[0].value = 0
-                    self.telescope_guideWE[1].value = calibrate_pulse_length
-                    self.indiclnt.sendNewNumber(self.telescope_guideWE)
-                    time.sleep(calibrate_pulse_length / 500.)
-                    # Look up resulting mount position (RA) in the sky.
-                    ra_end = self.telescope_radec[0].value * 15.
-
-                    # The end point was west of the initial point. Flip the RA directions.
-                    if ra_end < ra_begin:
-                        self.direction_east = 3
-                        self.direction_west = 2
-                    # Do the same in declination.
-                    de_begin = self.telescope_radec[1].value
-                    # Issue an INDI "move north" instruction and wait a short time.
-                    self.telescope_guideNS[0].value = calibrate_pulse_length
-                    self.telescope_guideNS[1].value = 0
-                    self.indiclnt.sendNewNumber(self.telescope_guideNS)
-                    time.sleep(calibrate_pulse_length / 500.)
-                    # Look up resulting mount position (DE) in the sky.
-                    de_end = self.telescope_radec[1].value
-                    if de_end < de_begin:
-                        self.direction_north = 1
-                        self.direction_south = 0
-                    # Now the direction variables correspond to true coordinates in the sky.
-                    instruction['finished'] = True
-
-                # Start guiding the telescope with given rates in RA, DE. Guiding will continue
-                # (even if other instructions are handled in the meantime) until a "stop guiding"
-                # instruction is found in the queue.
-                elif instruction['name'] == "start guiding":
-                    # Look up the specified guide rates.
-                    rate_ra = instruction['rate_ra']
-                    rate_de = instruction['rate_de']
-                    # Define the start point: time and position (RA,DE).
-                    start_time = time.mktime(datetime.now().timetuple())
-                    start_ra = radians(self.telescope_radec[0].value * 15.)
-                    start_de = radians(self.telescope_radec[1].value)
-                    # Set guiding directions in RA, DE.
-                    if numpy.sign(rate_ra) > 0:
-                        direction_ra = self.direction_east
-                    else:
-                        direction_ra = self.direction_west
-                    if numpy.sign(rate_de) > 0:
-                        direction_de = self.direction_north
-                    else:
-                        direction_de = self.direction_south
-                    # The actual guiding is done in a chain of "continue_guiding" instructions.
-                    continue_guiding_instruction = self.continue_guiding
-                    # Insert the first instruction into the queue.
-                    self.instructions.insert(0, continue_guiding_instruction)
-
-                # This instruction checks if the telescope is ahead or behind the moving target.
-                # If it is behind, an INDI PulseGuide instruction of specified length is issued.
-                # Otherwise nothing is done. The assumption is that many more instructions are
-                # issued than PulseGuides are necessary. Therefore, it cannot happen that the
-                # telescope lags behind permanently.
-                elif instruction['name'] == "continue guiding":
-                    # Look up the time and current pointing of the telescope.
-                    current_time = time.mktime(datetime.now().timetuple())
-                    current_ra = radians(self.telescope_radec[0].value * 15.)
-                    current_de = radians(self.telescope_radec[1].value)
-                    # Compute where the telescope should be aimed at this time.
-                    target_ra = start_ra + rate_ra * (current_time - start_time)
-                    target_de = start_de + rate_de * (current_time - start_time)
-
-                    # The telescope has been moved too little in RA. Issue a PulseGuide.
-                    if abs(target_ra - start_ra) > abs(current_ra - start_ra):
-                        if self.configuration.protocol_level > 2:
-                            Miscellaneous.protocol("OperateTelescopeINDI: Pulse guide in RA.")
-                        if direction_ra == 2:
-                            self.telescope_guideWE[0].value = 0
-                            self.telescope_guideWE[1].value = int(
-                                self.configuration.conf.getfloat("INDI",
-                                                                 "guiding interval") * 1000.)
-                        else:
-                            self.telescope_guideWE[0].value = int(
-                                self.configuration.conf.getfloat("INDI",
-                                                                 "guiding interval") * 1000.)
-                            self.telescope_guideWE[1].value = 0
-                        self.indiclnt.sendNewNumber(self.telescope_guideWE)
-
-                    # The telescope has been moved too little in DE. Issue a PulseGuide.
-                    if abs(target_de - start_de) > abs(current_de - start_de):
-                        if self.configuration.protocol_level > 2:
-                            Miscellaneous.protocol("OperateTelescopeINDI: Pulse guide in DE.")
-                        if direction_de == 1:
-                            self.telescope_guideNS[0].value = 0
-                            self.telescope_guideNS[1].value = int(
-                                self.configuration.conf.getfloat("INDI",
-                                                                 "guiding interval") * 1000.)
-                        else:
-                            self.telescope_guideNS[0].value = int(
-                                self.configuration.conf.getfloat("INDI",
-                                                                 "guiding interval") * 1000.)
-                            self.telescope_guideNS[1].value = 0
-                        self.indiclnt.sendNewNumber(self.telescope_guideNS)
-
-                    # Re-insert this instruction into the queue.
-                    self.instructions.insert(0, instruction)
-                    time.sleep(self.configuration.conf.getfloat("INDI", "guiding interval"))
-
-                # Stop guiding by removing all instructions of type "continue guiding" from the
-                # queue.
-                elif instruction['name'] == "stop guiding":
-                    self.remove_instruction(self.continue_guiding)
-                    instruction['finished'] = True
-
-                # These instructions are used when the user presses one of the arrow keys.
-                elif instruction['name'] == "start moving north":
-                    # Issue a PulseGuide in the specified direction.
-                    if self.direction_north == 0:
-                        self.telescope_guideNS[
-                            0].value = self.configuration.polling_interval * 1000.
-                        self.telescope_guideNS[1].value = 0.
-                    else:
-                        self.telescope_guideNS[0].value = 0.
-                        self.telescope_guideNS[
-                            1].value = self.configuration.polling_interval * 1000.
-                    self.indiclnt.sendNewNumber(self.telescope_guideNS)
-                    # Re-insert this instruction into the queue, and wait a short time.
-                    self.instructions.insert(0, instruction)
-                    time.sleep(self.configuration.polling_interval)
-
-                # This instruction is used when the "arrow up" key is released.
-                elif instruction['name'] == "stop moving north":
-                    # Remove all "start moving north" instructions from the queue.
-                    self.remove_instruction(self.start_moving_north)
-                    instruction['finished'] = True
-
-                # The following instructions are analog to the two above. They handle the three
-                # other coordinate directions.
-                elif instruction['name'] == "start moving south":
-                    if self.direction_south == 1:
-                        self.telescope_guideNS[0].value = 0.
-                        self.telescope_guideNS[
-                            1].value = self.configuration.polling_interval * 1000.
-                    else:
-                        self.telescope_guideNS[
-                            0].value = self.configuration.polling_interval * 1000.
-                        self.telescope_guideNS[1].value = 0.
-                    self.indiclnt.sendNewNumber(self.telescope_guideNS)
-                    self.instructions.insert(0, instruction)
-                    time.sleep(self.configuration.polling_interval)
-
-                elif instruction['name'] == "stop moving south":
-                    self.remove_instruction(self.start_moving_south)
-                    instruction['finished'] = True
-
-                elif instruction['name'] == "start moving east":
-                    if self.direction_east == 2:
-                        self.telescope_guideWE[0].value = 0.
-                        self.telescope_guideWE[
-                            1].value = self.configuration.polling_interval * 1000.
-                    else:
-                        self.telescope_guideWE[
-                            0].value = self.configuration.polling_interval * 1000.
-                        self.telescope_guideWE[1].value = 0.
-                    self.indiclnt.sendNewNumber(self.telescope_guideWE)
-                    self.instructions.insert(0, instruction)
-                    time.sleep(self.configuration.polling_interval)
-
-                elif instruction['name'] == "stop moving east":
-                    self.remove_instruction(self.start_moving_east)
-                    instruction['finished'] = True
-
-                elif instruction['name'] == "start moving west":
-                    if self.direction_west == 3:
-                        self.telescope_guideWE[
-                            0].value = self.configuration.polling_interval * 1000.
-                        self.telescope_guideWE[1].value = 0.
-                    else:
-                        self.telescope_guideWE[0].value = 0.
-                        self.telescope_guideWE[
-                            1].value = self.configuration.polling_interval * 1000.
-                    self.indiclnt.sendNewNumber(self.telescope_guideWE)
-                    self.instructions.insert(0, instruction)
-                    time.sleep(self.configuration.polling_interval)
-
-                elif instruction['name'] == "stop moving west":
-                    self.remove_instruction(self.start_moving_west)
-                    instruction['finished'] = True
-
-                # Issue an PulseGuide instruction with given direction and length.
-                elif instruction['name'] == "pulse correction":
-                    # If a "calibrate" instruction was executed, correct the ASCOM direction values
-                    # (0,1,2,3) to reflect the real motion of the telescope.
-                    direction = [self.direction_north, self.direction_south, self.direction_east,
-                                 self.direction_west][instruction['direction']]
-                    # The pulse_length is counted in milliseconds.
-                    pulse_length = instruction['pulse_length']
-                    # Perform the ASCOM PulseGuide instruction.
-                    if direction == 0:
-                        self.telescope_guideNS[0].value = pulse_length
-                        self.telescope_guideNS[1].value = 0
-                        self.indiclnt.sendNewNumber(self.telescope_guideNS)
-                    elif direction == 1:
-                        self.telescope_guideNS[0].value = 0
-                        self.telescope_guideNS[1].value = pulse_length
-                        self.indiclnt.sendNewNumber(self.telescope_guideNS)
-                    elif direction == 2:
-                        self.telescope_guideWE[0].value = 0
-                        self.telescope_guideWE[1].value = pulse_length
-                        self.indiclnt.sendNewNumber(self.telescope_guideWE)
-                    elif direction == 3:
-                        self.telescope_guideWE[0].value = pulse_length
-                        self.telescope_guideWE[1].value = 0
-                        self.indiclnt.sendNewNumber(self.telescope_guideWE)
-                    instruction['finished'] = True
-
-                # If the "terminate" instruction is encountered, exit the loop
-                elif instruction['name'] == "terminate":
-                    break
-            # If no instruction is in the queue, wait a short time.
-            else:
-                time.sleep(self.configuration.polling_interval)
+            instruction = self.instructions.get()
+            # If the "terminate" instruction is encountered, exit the loop
+            if instruction.name == "terminate":
+                break
+            try:
+                self.execute(instruction)
+            except Exception as e:
+                if self.configuration.protocol_level > 0:
+                    Miscellaneous.protocol("OperateTelescopeINDI: Instruction '" +
+                                           instruction.name + "' failed: " + str(e))
+                # Nobody waits for a repeating instruction (guiding, moving with arrow keys).
+                # Try again after the usual delay, so that a transient error does not end it.
+                # Otherwise hand the error to the thread waiting for the instruction. In both
+                # cases keep serving the queue.
+                delay = self.repeat_delay(instruction)
+                if delay is not None:
+                    self.instructions.put(instruction, delay=delay)
+                else:
+                    instruction.fail(TelescopeException(
+                        "INDI: Instruction '" + instruction.name + "' failed: " + str(e)))
 
         # Terminate the main loop (after executing the "terminate" instruction).
         # Disconnect all INDI devices and the server from the INDI client first.
@@ -1116,18 +792,239 @@ class OperateTelescopeINDI(threading.Thread):
         if self.configuration.protocol_level > 0:
             Miscellaneous.protocol("Ending OperateTelescopeINDI thread.")
 
-    def remove_instruction(self, instruction):
+    def pulse_guide(self, direction, pulse_length):
         """
-        Remove all instructions of type "instruction" from the queue.
+        Issue a PulseGuide instruction. The directions are numbered as in ASCOM. If a "calibrate"
+        instruction was executed, the direction values have been corrected for the real motion of
+        the telescope already.
 
-        :param instruction: instruction object
+        :param direction: one of 0, 1 ,2, 3 for north, south, east, west
+        :param pulse_length: length (in milliseconds)
         :return: -
         """
 
-        # Loop over the entire instruction queue and remove instructions of given type.
-        for inst in self.instructions:
-            if instruction['name'] == inst['name']:
-                self.instructions.remove(inst)
+        if direction < 2:
+            # North (0) and south (1) are the first and second element of the NS vector.
+            self.telescope_guideNS[direction].value = pulse_length
+            self.telescope_guideNS[1 - direction].value = 0
+            self.indiclnt.sendNewNumber(self.telescope_guideNS)
+        else:
+            # West (3) and east (2) are the first and second element of the WE vector.
+            self.telescope_guideWE[3 - direction].value = pulse_length
+            self.telescope_guideWE[direction - 2].value = 0
+            self.indiclnt.sendNewNumber(self.telescope_guideWE)
+
+    def repeat_delay(self, instruction):
+        """
+        Repeating instructions re-insert themselves into the queue after execution. Look up the
+        delay after which such an instruction is executed again.
+
+        :param instruction: Instruction object
+        :return: delay (seconds), or None if the instruction is not repeated
+        """
+
+        if instruction.name == "continue guiding":
+            return self.configuration.conf.getfloat("INDI", "guiding interval")
+        elif instruction.name.startswith("start moving "):
+            return self.configuration.polling_interval
+        return None
+
+    def execute(self, instruction):
+        """
+        Execute an instruction taken from the queue.
+
+        :param instruction: Instruction object
+        :return: -
+        """
+
+        # Slew the telescope to a given (RA, DE) position.
+        if instruction.name == "slew to":
+            if self.configuration.protocol_level > 1:
+                Miscellaneous.protocol(
+                    "OperateTelescopeINDI: Slewing telescope to: RA " + str(
+                        round(instruction['rect'] * 15., 5)) + ", DE " + str(
+                        round(instruction['decl'], 5)) + " (degrees).")
+            # Instruct the INDI driver to execute the SlewToCoordinates instruction.
+            # Please note that coordinates are in hours (RA) and degrees (DE).
+            self.telescope_radec[0].value = instruction['rect']
+            self.telescope_radec[1].value = instruction['decl']
+            # Remember the last position update received before the slew. Position look-ups
+            # only accept updates sent after the slew has started.
+            entry = self.indiclnt.lookup_property(self.device_telescope.getDeviceName(),
+                                                  "EQUATORIAL_EOD_COORD")
+            self.slew_update_count = entry['count'] if entry is not None else -1
+            self.indiclnt.sendNewNumber(self.telescope_radec)
+            instruction.finish()
+
+        # Wait until the mount is standing still, then look up the current mount position.
+        elif instruction.name == "lookup tel position":
+            device_name = self.device_telescope.getDeviceName()
+            wait_interval = self.configuration.conf.getfloat("INDI", "wait interval")
+            precision = self.configuration.conf.getfloat("INDI", "telescope lookup precision")
+            # The position updates are sent by the driver while the mount is moving. Start with
+            # the last update received before the most recent slew.
+            count = self.slew_update_count
+            values = None
+            iter_count = 0
+            # Wake up on every position update until the mount is standing still.
+            while True:
+                iter_count += 1
+                entry = self.indiclnt.wait_for_update(device_name, "EQUATORIAL_EOD_COORD", count,
+                                                      wait_interval)
+                if entry is None:
+                    # No update within the wait interval. If the driver does not report a motion,
+                    # the mount is standing still. If no update has been seen since the slew, use
+                    # the last position stored in the cache.
+                    entry = self.indiclnt.lookup_property(device_name, "EQUATORIAL_EOD_COORD")
+                    if entry is not None and not entry['busy'] and entry['values'] is not None:
+                        values = entry['values']
+                        break
+                    continue
+                # The mount is standing still if the driver does not report a motion, and the
+                # position did not change since the previous update by more than the precision.
+                if values is not None and not entry['busy'] and \
+                        abs(entry['values'][0] - values[0]) <= precision / 54000. and \
+                        abs(entry['values'][1] - values[1]) <= precision / 3600.:
+                    values = entry['values']
+                    break
+                values = entry['values']
+                count = entry['count']
+            # Further look-ups without a new slew start from the current update.
+            self.slew_update_count = entry['count']
+
+            if self.configuration.protocol_level > 2:
+                Miscellaneous.protocol(
+                    "OperateTelescopeINDI: Position looked-up: RA " + str(
+                        round(values[0] * 15., 5)) + ", DE " + str(
+                        round(values[1], 5)) + " (degrees), iterations: " + str(
+                        iter_count) + ".")
+            # Stationary state reached, return the measured position (in radians).
+            instruction.finish((radians(values[0] * 15), radians(values[1])))
+
+        # Find out which INDI directions correspond to directions in the sky.
+        elif instruction.name == "calibrate":
+            # Look up the current RA position of the mount.
+            ra_begin = self.telescope_radec[0].value * 15.
+            # Look up the specified length of the test movements in RA, DE.
+            calibrate_pulse_length = instruction['calibrate_pulse_length']
+            # Issue an INDI "move east" instruction and wait a short time.
+            self.pulse_guide(2, calibrate_pulse_length)
+            time.sleep(calibrate_pulse_length / 500.)
+            # Look up resulting mount position (RA) in the sky.
+            ra_end = self.telescope_radec[0].value * 15.
+
+            # The end point was west of the initial point. Flip the RA directions.
+            if ra_end < ra_begin:
+                self.direction_east = 3
+                self.direction_west = 2
+            # Do the same in declination.
+            de_begin = self.telescope_radec[1].value
+            # Issue an INDI "move north" instruction and wait a short time.
+            self.pulse_guide(0, calibrate_pulse_length)
+            time.sleep(calibrate_pulse_length / 500.)
+            # Look up resulting mount position (DE) in the sky.
+            de_end = self.telescope_radec[1].value
+            if de_end < de_begin:
+                self.direction_north = 1
+                self.direction_south = 0
+            # Now the direction variables correspond to true coordinates in the sky.
+            instruction.finish()
+
+        # Start guiding the telescope with given rates in RA, DE. Guiding will continue
+        # (even if other instructions are handled in the meantime) until a "stop guiding"
+        # instruction is found in the queue.
+        elif instruction.name == "start guiding":
+            # Set guiding directions in RA, DE.
+            if numpy.sign(instruction['rate_ra']) > 0:
+                direction_ra = self.direction_east
+            else:
+                direction_ra = self.direction_west
+            if numpy.sign(instruction['rate_de']) > 0:
+                direction_de = self.direction_north
+            else:
+                direction_de = self.direction_south
+            # The actual guiding is done by a "continue guiding" instruction which re-inserts
+            # itself into the queue. It carries the guide rates and accelerations, and the start
+            # point: time and position (RA,DE).
+            self.instructions.put(Instruction(
+                "continue guiding", rate_ra=instruction['rate_ra'],
+                rate_de=instruction['rate_de'], accel_ra=instruction['accel_ra'],
+                accel_de=instruction['accel_de'], start_time=SessionClock.elapsed(),
+                start_ra=radians(self.telescope_radec[0].value * 15.),
+                start_de=radians(self.telescope_radec[1].value), direction_ra=direction_ra,
+                direction_de=direction_de))
+            instruction.finish()
+
+        # This instruction checks if the telescope is ahead or behind the moving target.
+        # If it is behind, an INDI PulseGuide instruction of specified length is issued.
+        # Otherwise nothing is done. The assumption is that many more instructions are
+        # issued than PulseGuides are necessary. Therefore, it cannot happen that the
+        # telescope lags behind permanently.
+        elif instruction.name == "continue guiding":
+            # Look up the time and current pointing of the telescope.
+            current_time = SessionClock.elapsed()
+            current_ra = radians(self.telescope_radec[0].value * 15.)
+            current_de = radians(self.telescope_radec[1].value)
+            # Compute where the telescope should be aimed at this time.
+            # Include the change of the moon's speed (second order term).
+            elapsed_time = current_time - instruction['start_time']
+            start_ra = instruction['start_ra']
+            start_de = instruction['start_de']
+            target_ra = start_ra + (instruction['rate_ra'] + 0.5 * instruction[
+                'accel_ra'] * elapsed_time) * elapsed_time
+            target_de = start_de + (instruction['rate_de'] + 0.5 * instruction[
+                'accel_de'] * elapsed_time) * elapsed_time
+            guiding_interval = self.configuration.conf.getfloat("INDI", "guiding interval")
+
+            # The telescope has been moved too little in RA. Issue a PulseGuide.
+            if abs(target_ra - start_ra) > abs(current_ra - start_ra):
+                if self.configuration.protocol_level > 2:
+                    Miscellaneous.protocol("OperateTelescopeINDI: Pulse guide in RA.")
+                self.pulse_guide(instruction['direction_ra'], int(guiding_interval * 1000.))
+
+            # The telescope has been moved too little in DE. Issue a PulseGuide.
+            if abs(target_de - start_de) > abs(current_de - start_de):
+                if self.configuration.protocol_level > 2:
+                    Miscellaneous.protocol("OperateTelescopeINDI: Pulse guide in DE.")
+                self.pulse_guide(instruction['direction_de'], int(guiding_interval * 1000.))
+
+            # Re-insert this instruction into the queue, to be executed after the guiding
+            # interval. Other instructions are served in the meantime.
+            self.instructions.put(instruction, delay=self.repeat_delay(instruction))
+
+        # Stop guiding by cancelling the "continue guiding" instruction in the queue.
+        elif instruction.name == "stop guiding":
+            self.instructions.cancel("continue guiding")
+            instruction.finish()
+
+        # These instructions are used when the user presses one of the arrow keys. Issue a
+        # PulseGuide in the specified direction. Re-insert the instruction into the queue, to be
+        # executed again after a short time.
+        elif instruction.name.startswith("start moving "):
+            direction = {"north": self.direction_north, "south": self.direction_south,
+                         "east": self.direction_east, "west": self.direction_west}[
+                instruction.name[len("start moving "):]]
+            self.pulse_guide(direction, self.configuration.polling_interval * 1000.)
+            self.instructions.put(instruction, delay=self.repeat_delay(instruction))
+
+        # These instructions are used when the arrow key is released. Cancel the corresponding
+        # "start moving" instruction in the queue.
+        elif instruction.name.startswith("stop moving "):
+            self.instructions.cancel("start" + instruction.name[len("stop"):])
+            instruction.finish()
+
+        # Issue an PulseGuide instruction with given direction and length.
+        elif instruction.name == "pulse correction":
+            # If a "calibrate" instruction was executed, correct the ASCOM direction values
+            # (0,1,2,3) to reflect the real motion of the telescope.
+            direction = [self.direction_north, self.direction_south, self.direction_east,
+                         self.direction_west][instruction['direction']]
+            # The pulse_length is counted in milliseconds.
+            self.pulse_guide(direction, instruction['pulse_length'])
+            instruction.finish()
+
+        else:
+            raise TelescopeException("Unknown instruction '" + instruction.name + "'.")
 
 
 class Telescope:
@@ -1158,15 +1055,12 @@ class Telescope:
 
         self.optel.start()
 
-        # Wait for the low-level thread to be initialized. Meanwhile check for error messages.
-        for iteration in range(4 * self.configuration.polling_time_out_count):
-            # An error occurred in low-level initialization. Raise an exception.
-            if self.optel.initialization_error != "":
-                raise TelescopeException(self.optel.initialization_error)
-            if self.optel.initialized:
-                # The low-level interface was initialized successfully. Exit the loop.
-                break
-            time.sleep(self.configuration.polling_interval)
+        # Wait for the low-level thread to be initialized.
+        self.optel.initialization_finished.wait(
+            4 * self.configuration.polling_time_out_count * self.configuration.polling_interval)
+        # An error occurred in low-level initialization. Raise an exception.
+        if self.optel.initialization_error != "":
+            raise TelescopeException(self.optel.initialization_error)
         if not self.optel.initialized:
             raise TelescopeException("Timeout in connecting to telescope driver.")
 
@@ -1177,6 +1071,38 @@ class Telescope:
         self.readout_correction_de = 0.
         self.guiding_active = False
 
+        # The residuals of all slews are collected in a pointing model of the mount. It is stored
+        # per mount across sessions.
+        self.mount_model = MountModel(self.configuration, self.mount_name())
+
+    def request(self, instruction, wait=True):
+        """
+        Put an instruction into the queue of the OperateTelescope thread. Optionally, block until
+        the instruction is executed. If this takes longer than "telescope_instruction_timeout"
+        seconds, or if the execution fails, a TelescopeException is raised.
+
+        :param instruction: Instruction object
+        :param wait: if True, wait for the instruction to be executed
+        :return: result of the instruction (None if wait=False)
+        """
+
+        self.optel.instructions.put(instruction)
+        if wait:
+            return instruction.wait(self.configuration.telescope_instruction_timeout)
+        return None
+
+    def mount_name(self):
+        """
+        Identify the mount for the persistent storage of its pointing model.
+
+        :return: interface type and driver (ASCOM) or device (INDI) name
+        """
+
+        interface_type = self.configuration.conf.get("Telescope", "interface type")
+        if interface_type == "ASCOM":
+            return "ASCOM " + self.configuration.conf.get("ASCOM", "telescope driver")
+        return "INDI " + self.optel.device_telescope.getDeviceName()
+
     def calibrate(self):
         """
         Check if movements in RA,DE are mirror-reversed. Directions will be corrected in future
@@ -1188,15 +1114,10 @@ class Telescope:
         if self.configuration.protocol_level > 2:
             Miscellaneous.protocol("Calibrating guiding direction, time interval (ms): " + str(
                 self.configuration.calibrate_pulse_length) + ".")
-        # Choose the instruction, and set the pulse length.
-        calibrate_instruction = self.optel.calibrate
-        calibrate_instruction['calibrate_pulse_length'] = self.configuration.calibrate_pulse_length
-        # Initialize the "finished" field to False, and insert the instruction into the queue.
-        calibrate_instruction['finished'] = False
-        self.optel.instructions.insert(0, calibrate_instruction)
-        # Idle loop until the calibration is finished. Write out the results.
-        while not calibrate_instruction['finished']:
-            time.sleep(self.configuration.polling_interval)
+        # Create the instruction with the pulse length, and wait until the calibration is
+        # finished. Write out the results.
+        self.request(Instruction(
+            "calibrate", calibrate_pulse_length=self.configuration.calibrate_pulse_length))
         if self.configuration.protocol_level > 2:
             if self.optel.direction_east == 2:
                 Miscellaneous.protocol("Direction for corrections in RA: normal.")
@@ -1210,21 +1131,26 @@ class Telescope:
     def slew_to(self, ra, de):
         """
         Move the telescope to a given position (ra, de) in the sky. This method blocks until the
-        position is reached.
+        position is reached. If the mount pointing model is enabled, the slew target is corrected
+        by the residual predicted by the model.
 
         :param ra: Target right ascension (radians)
         :param de: Target declination (radians)
         :return: -
         """
 
+        slew_time = SessionClock.time()
+        if self.configuration.mount_model_enabled:
+            (predicted_ra, predicted_de) = self.mount_model.predict(slew_time, ra, de)
+        else:
+            (predicted_ra, predicted_de) = (0., 0.)
+        (ra_command, de_command) = (ra + predicted_ra, de + predicted_de)
+
         # Convert coordinates into hours and degrees, fill parameters into instruction fields and
         # put the instruction into the queue. Make sure the RA value is between 0 and 24 hours.
-        rect = (degrees(ra) / 15.) % 24.
-        decl = degrees(de)
-        slew_to_instruction = self.optel.slew_to
-        slew_to_instruction['rect'] = rect
-        slew_to_instruction['decl'] = decl
-        self.optel.instructions.insert(0, slew_to_instruction)
+        rect = (degrees(ra_command) / 15.) % 24.
+        decl = degrees(de_command)
+        self.request(Instruction("slew to", rect=rect, decl=decl))
         # Look up the position where the telescope went.
         (rect_lookup, decl_lookup) = self.lookup_tel_position_uncorrected()
         # For some mounts there is a systematic difference between target and the position
@@ -1232,6 +1158,10 @@ class Telescope:
         # Bring the RA correction as close to zero as possible (full circle ambiguity).
         self.readout_correction_ra = (ra - rect_lookup + pi) % (2. * pi) - pi
         self.readout_correction_de = de - decl_lookup
+        # Store the residual of the slew (relative to the commanded position) in the mount model.
+        self.mount_model.add_residual(slew_time, ra_command, de_command,
+                                      (ra_command - rect_lookup + pi) % (2. * pi) - pi,
+                                      de_command - decl_lookup)
         # Write the corrections to the protocol file.
         if self.configuration.protocol_level > 2:
             Miscellaneous.protocol("New coordinate read-out correction computed (deg.): RA: " + str(
@@ -1247,12 +1177,7 @@ class Telescope:
         :return: (RA, DE) where the telescope is currently pointing (coordinates in radians).
         """
 
-        lookup_tel_position_instruction = self.optel.lookup_tel_position
-        lookup_tel_position_instruction['finished'] = False
-        self.optel.instructions.insert(0, lookup_tel_position_instruction)
-        while not lookup_tel_position_instruction['finished']:
-            time.sleep(self.configuration.polling_interval)
-        return lookup_tel_position_instruction['ra'], lookup_tel_position_instruction['de']
+        return self.request(Instruction("lookup tel position"))
 
     def lookup_tel_position(self):
         """
@@ -1269,27 +1194,25 @@ class Telescope:
         return (tel_ra_uncorrected + self.readout_correction_ra,
                 tel_de_uncorrected + self.readout_correction_de)
 
-    def start_guiding(self, rate_ra, rate_de):
+    def start_guiding(self, rate_ra, rate_de, accel_ra=0., accel_de=0.):
         """
         Start guiding a moving target with given rates in (RA, DE). This method does not block.
 
         :param rate_ra: speed of the object in right ascension (in radians/sec.)
         :param rate_de: speed of the object in declination (in radians/sec.)
+        :param accel_ra: acceleration of the object in right ascension (in radians/sec.**2)
+        :param accel_de: acceleration of the object in declination (in radians/sec.**2)
         :return: -
         """
 
-        # Fill the guiding rates into the instruction fields.
-        start_guiding_instruction = self.optel.start_guiding
-        start_guiding_instruction['rate_ra'] = rate_ra
-        start_guiding_instruction['rate_de'] = rate_de
         if self.configuration.protocol_level > 2:
             Miscellaneous.protocol("Start guiding, Rate(RA): " + str(
-                round(degrees(start_guiding_instruction['rate_ra']) * 216000.,
-                      3)) + ", Rate(DE): " + str(
-                round(degrees(start_guiding_instruction['rate_de']) * 216000.,
-                      3)) + " (arc min. / hour).")
-        # Insert the instruction into the queue.
-        self.optel.instructions.insert(0, start_guiding_instruction)
+                round(degrees(rate_ra) * 216000., 3)) + ", Rate(DE): " + str(
+                round(degrees(rate_de) * 216000., 3)) + " (arc min. / hour).")
+        # Fill the guiding rates and accelerations into the instruction fields, and insert the
+        # instruction into the queue.
+        self.request(Instruction("start guiding", rate_ra=rate_ra, rate_de=rate_de,
+                                 accel_ra=accel_ra, accel_de=accel_de), wait=False)
         # Set the "guiding_active" flag to True.
         self.guiding_active = True
 
@@ -1304,11 +1227,7 @@ class Telescope:
         if self.configuration.protocol_level > 2:
             Miscellaneous.protocol("Stop guiding.")
         # Insert the instruction into the low-level queue and wait until it is finished.
-        stop_guiding_instruction = self.optel.stop_guiding
-        stop_guiding_instruction['finished'] = False
-        self.optel.instructions.insert(0, stop_guiding_instruction)
-        while not stop_guiding_instruction['finished']:
-            time.sleep(self.configuration.polling_interval)
+        self.request(Instruction("stop guiding"))
         # Reset the "guiding_active" flag.
         self.guiding_active = False
 
@@ -1320,7 +1239,7 @@ class Telescope:
         :return: -
         """
 
-        self.optel.instructions.insert(0, self.optel.start_moving_north)
+        self.request(Instruction("start moving north"), wait=False)
 
     def stop_move_north(self):
         """
@@ -1329,12 +1248,8 @@ class Telescope:
         :return: -
         """
 
-        stop_moving_north_instruction = self.optel.stop_moving_north
-        stop_moving_north_instruction['finished'] = False
-        # self.optel.instructions.insert(0, stop_moving_north_instruction)
-        self.optel.instructions.append(stop_moving_north_instruction)
-        while not stop_moving_north_instruction['finished']:
-            time.sleep(self.configuration.polling_interval)
+        # The instruction is executed before all other instructions waiting in the queue.
+        self.request(Instruction("stop moving north", priority=Instruction.PRIORITY_URGENT))
 
     def move_south(self):
         """
@@ -1344,7 +1259,7 @@ class Telescope:
         :return: -
         """
 
-        self.optel.instructions.insert(0, self.optel.start_moving_south)
+        self.request(Instruction("start moving south"), wait=False)
 
     def stop_move_south(self):
         """
@@ -1353,12 +1268,8 @@ class Telescope:
         :return: -
         """
 
-        stop_moving_south_instruction = self.optel.stop_moving_south
-        stop_moving_south_instruction['finished'] = False
-        # self.optel.instructions.insert(0, stop_moving_south_instruction)
-        self.optel.instructions.append(stop_moving_south_instruction)
-        while not stop_moving_south_instruction['finished']:
-            time.sleep(self.configuration.polling_interval)
+        # The instruction is executed before all other instructions waiting in the queue.
+        self.request(Instruction("stop moving south", priority=Instruction.PRIORITY_URGENT))
 
     def move_east(self):
         """
@@ -1368,7 +1279,7 @@ class Telescope:
         :return: -
         """
 
-        self.optel.instructions.insert(0, self.optel.start_moving_east)
+        self.request(Instruction("start moving east"), wait=False)
 
     def stop_move_east(self):
         """
@@ -1377,12 +1288,8 @@ class Telescope:
         :return: -
         """
 
-        stop_moving_east_instruction = self.optel.stop_moving_east
-        stop_moving_east_instruction['finished'] = False
-        # self.optel.instructions.insert(0, stop_moving_east_instruction)
-        self.optel.instructions.append(stop_moving_east_instruction)
-        while not stop_moving_east_instruction['finished']:
-            time.sleep(self.configuration.polling_interval)
+        # The instruction is executed before all other instructions waiting in the queue.
+        self.request(Instruction("stop moving east", priority=Instruction.PRIORITY_URGENT))
 
     def move_west(self):
         """
@@ -1392,7 +1299,7 @@ class Telescope:
         :return: -
         """
 
-        self.optel.instructions.insert(0, self.optel.start_moving_west)
+        self.request(Instruction("start moving west"), wait=False)
 
     def stop_move_west(self):
         """
@@ -1401,12 +1308,8 @@ class Telescope:
         :return: -
         """
 
-        stop_moving_west_instruction = self.optel.stop_moving_west
-        stop_moving_west_instruction['finished'] = False
-        # self.optel.instructions.insert(0, stop_moving_west_instruction)
-        self.optel.instructions.append(stop_moving_west_instruction)
-        while not stop_moving_west_instruction['finished']:
-            time.sleep(self.configuration.polling_interval)
+        # The instruction is executed before all other instructions waiting in the queue.
+        self.request(Instruction("stop moving west", priority=Instruction.PRIORITY_URGENT))
 
     def pulse_correction(self, direction, pulse_length):
         """
@@ -1419,13 +1322,8 @@ class Telescope:
         :return: -
         """
 
-        pulse_correction_instruction = self.optel.pulse_correction
-        pulse_correction_instruction['direction'] = direction
-        pulse_correction_instruction['pulse_length'] = pulse_length
-        pulse_correction_instruction['finished'] = False
-        self.optel.instructions.append(pulse_correction_instruction)
-        while not pulse_correction_instruction['finished']:
-            time.sleep(self.configuration.polling_interval)
+        self.request(Instruction("pulse correction", priority=Instruction.PRIORITY_URGENT,
+                                 direction=direction, pulse_length=pulse_length))
 
     def terminate(self):
         """
@@ -1438,8 +1336,10 @@ class Telescope:
         if self.configuration.protocol_level > 0:
             Miscellaneous.protocol("High-level telescope interface: "
                                    "Terminating OperateTelescope thread.")
-        self.optel.instructions.insert(0, self.optel.terminate)
+        self.request(Instruction("terminate"), wait=False)
         self.optel.join()
+        # Store the slew residuals of this session for the mount model.
+        self.mount_model.save()
         if self.configuration.protocol_level > 0:
             Miscellaneous.protocol("High-level telescope interface: "
                                    "OperateTelescope thread terminated.")
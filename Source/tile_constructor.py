@@ -20,12 +20,50 @@ along with MPM.  If not, see <http://www.gnu.org/licenses/>.
 
 """
 
-from math import ceil, sqrt, cos, atan
+import copy
+from math import ceil, sqrt, cos, sin, atan, radians
+
+import numpy as np
 
 import configuration
 from miscellaneous import Miscellaneous
 
 
+class Tile:
+    """
+    A Tile object is a lightweight view of one entry in the tile table of the TileConstructor
+    (a Numpy structured array). For compatibility with code written for the former dictionary
+    representation, the fields are accessed by name, e.g. tile['x_center']. Changes of the
+    "processed" flag are passed on to the TileConstructor, so that its index of unprocessed tiles
+    stays consistent.
+
+    """
+
+    __slots__ = ('table', 'index', 'tc')
+
+    def __init__(self, table, index, tc=None):
+        """
+        Create a view of a tile table entry.
+
+        :param table: Numpy structured array with all tiles
+        :param index: index of this tile in the table
+        :param tc: TileConstructor object which owns the table
+        """
+
+        self.table = table
+        self.index = index
+        self.tc = tc
+
+    def __getitem__(self, key):
+        return self.table[key][self.index]
+
+    def __setitem__(self, key, value):
+        if key == 'processed' and self.tc is not None:
+            self.tc.set_processed([self.index], value)
+        else:
+            self.table[key][self.index] = value
+
+
 class TileConstructor:
     """
     This class compute the optimal coverage of the sunlit part of the moon with video "tiles". A
@@ -35,10 +73,23 @@ class TileConstructor:
     The tile construction is done in a "normalized" orientation where the connection line between
     the horns of the sunlit phase is vertical and the sunlit limb points towards the right. Please
     note that in this orientation a waning phase is standing south up.
+
+    The geometry of all tiles is stored in a Numpy structured array ("tile_table") in the order
+    in which they are recorded. The lists "lists_of_tiles" (by rows or columns, depending on the
+    tesselation strategy) and "list_of_tiles_sorted" contain Tile objects which give access to
+    single table entries.
     
     """
 
-    def __init__(self, configuration, de_center, m_diameter, phase_angle, pos_angle):
+    # Data type of the tile table entries.
+    tile_dtype = np.dtype([('row_index', np.int32), ('column_index', np.int32),
+                           ('column_total', np.int32), ('x_left', np.float64),
+                           ('x_right', np.float64), ('y_top', np.float64),
+                           ('y_bottom', np.float64), ('x_center', np.float64),
+                           ('y_center', np.float64), ('delta_ra_center', np.float64),
+                           ('delta_de_center', np.float64), ('processed', np.bool_)])
+
+    def __init__(self, configuration, de_center, m_diameter, phase_angle, pos_angle, me=None):
         """
         Read out parameters from the configuration object and compute the optimal tile coverage.
         
@@ -48,13 +99,13 @@ class TileConstructor:
         :param phase_angle: phase angle of the sunlit moon phase (0. for New Moon, Pi for Full Moon)
         :param pos_angle: angle (radians) between North and the "North Pole" of the sunlit phase,
         counted counterclockwise
+        :param me: MoonEphem object with libration info. It is only needed if the tesselation is
+                   restricted to a box in selenographic coordinates.
         """
 
-        # Allocate instance variables used in Tile Visualization later.
-        self.m_diameter = m_diameter
-        self.phase_angle = phase_angle
-
         # Configuration data
+        self.configuration = configuration
+        self.me = me
         pixel_size = (configuration.conf.getfloat("Camera", "pixel size"))
         focal_length = (configuration.conf.getfloat("Telescope", "focal length"))
         im_h_pixel = configuration.conf.getint("Camera", "pixel vertical")
@@ -67,123 +118,674 @@ class TileConstructor:
         self.im_h = float(im_h_pixel) * atan(pixel_size / focal_length)
         self.im_w = float(im_w_pixel) * atan(pixel_size / focal_length)
         self.ol_outer = float(ol_outer_pixel) * atan(pixel_size / focal_length)
-        ol_inner_min = float(ol_inner_min_pixel) * atan(pixel_size / focal_length)
+        self.ol_inner_min = float(ol_inner_min_pixel) * atan(pixel_size / focal_length)
+
+        # If a SessionJournal object is registered, all changes of tile states are recorded.
+        self.journal = None
+
+        # Footprints of all tiles recorded in earlier layouts of the session. Each footprint is a
+        # tuple (tile table, position angle, moon diameter) of a previous layout.
+        self.recorded_footprints = []
+        # Indices of tiles which are marked processed because they are covered by recorded
+        # footprints, not because they have been recorded themselves.
+        self.inherited_tiles = set()
+
+        # Compute the tile layout for the given moon phase.
+        self.compute_layout(de_center, m_diameter, phase_angle, pos_angle)
+
+    def compute_layout(self, de_center, m_diameter, phase_angle, pos_angle):
+        """
+        Compute the optimal tile coverage for a given moon phase. All tiles are marked unprocessed.
+
+        :param de_center: declination of the moon's center (radians)
+        :param m_diameter: diameter of the moon (radians)
+        :param phase_angle: phase angle of the sunlit moon phase (0. for New Moon, Pi for Full Moon)
+        :param pos_angle: angle (radians) between North and the "North Pole" of the sunlit phase,
+        counted counterclockwise
+        :return: -
+        """
+
+        # Allocate instance variables used in Tile Visualization and for layout updates later.
+        self.de_center = de_center
+        self.m_diameter = m_diameter
+        self.phase_angle = phase_angle
+        self.pos_angle = pos_angle
 
         # Auxiliary parameters used by the "rotate" method in module miscellaneous
         flip_x = 1.
         flip_y = 1.
         scale_factor = 1.
 
-        # Compute the minimum number of tile rows needed to fulfill overlap requirements.
-        n_rows = (m_diameter + 2. * self.ol_outer - ol_inner_min) / (self.im_h - ol_inner_min)
-        # Round up to next integer.
-        n_rows_corrected = int(ceil(n_rows))
-        # Increase the vertical tile overlap such that the external margin width is as specified.
-        if n_rows_corrected > 1:
-            self.ol_inner_v = (n_rows_corrected * self.im_h - m_diameter - 2. * self.ol_outer) / (
-                    n_rows_corrected - 1.)
-        # Only one row of tiles (very unlikely though)
+        # Compute the geometry of the rows (or columns) of tiles with the selected strategy.
+        strategy = self.configuration.tesselation_strategy
+        if strategy == "rectangular":
+            (self.layout_type, strips) = ("rows", self.row_strips(*self.stack_parameters(
+                m_diameter, self.im_h)))
+        elif strategy == "columns":
+            (self.layout_type, strips) = ("columns", self.column_strips(*self.stack_parameters(
+                m_diameter / 2. - min(0., m_diameter / 2. * cos(phase_angle)), self.im_w),
+                margin=self.ol_outer))
+        elif strategy == "optimized":
+            (self.layout_type, strips) = self.optimized_strips()
         else:
-            self.ol_inner_v = ol_inner_min
+            raise RuntimeError("Unknown tesselation strategy: " + str(strategy))
 
-        # Initialize the tile structure: All tiles in one row form a list. These lists are collected
-        # in "lists_of_tiles".
+        # Enter the geometry of all tiles into the table, strip by strip. For a row layout,
+        # "row_index" is the row and "column_index" the position in the row (counted from the
+        # sunlit limb). For a column layout, "column_index" is the column (counted from the sunlit
+        # limb), and "row_index" the position in the column (counted from the top).
+        table = np.zeros(sum([strip[3] for strip in strips]), dtype=self.tile_dtype)
         self.lists_of_tiles = []
-        # Initialize the maximum number of tiles in a row.
-        max_cols = 0
+        first = 0
+        for i, (start, end, extent, n_tiles, overlap) in enumerate(strips):
+            strip = table[first:first + n_tiles]
+            positions = np.arange(n_tiles)
+            if self.layout_type == "rows":
+                strip['row_index'] = i
+                strip['column_index'] = positions
+                strip['column_total'] = n_tiles
+                strip['x_right'] = extent + self.ol_outer - positions * (self.im_w - overlap)
+                strip['y_top'] = start
+                strip['y_bottom'] = end
+            else:
+                strip['row_index'] = positions
+                strip['column_index'] = i
+                strip['column_total'] = len(strips)
+                strip['x_right'] = start
+                strip['y_top'] = extent + self.ol_outer - positions * (self.im_h - overlap)
+                strip['y_bottom'] = strip['y_top'] - self.im_h
+            self.lists_of_tiles.append([Tile(table, index) for index in
+                                        range(first, first + n_tiles)])
+            first += n_tiles
+        table['x_left'] = table['x_right'] - self.im_w
+        table['x_center'] = (table['x_right'] + table['x_left']) / 2.
+        table['y_center'] = (table['y_top'] + table['y_bottom']) / 2.
+        # Rotate the (x,y) coordinates of all tiles at once to get displacements in (RA,DE)
+        # relative to the moon center. Note the approximate correction of the RA displacement
+        # because of the moon's declination.
+        [table['delta_ra_center'], table['delta_de_center']] = (
+            Miscellaneous.rotate(pos_angle, de_center, scale_factor, flip_x, flip_y,
+                                 table['x_center'], table['y_center']))
+
+        # Sample points in all tiles. They are used to restrict the layout to a region of the
+        # sunlit phase, and to find the distance of tiles from the terminator.
+        region = self.configuration.tesselation_region
+        if region != "full" or self.configuration.tesselation_terminator_priority:
+            (x, y) = self.sample_points(table, self.configuration.tesselation_region_samples)
+            sunlit = self.sunlit_points(x, y)
+
+        # Put all tiles in a sequential order. If the terminator has priority, tiles are grouped
+        # in bands of one tile width by their distance from the terminator. The bands are recorded
+        # from top to bottom, starting at the terminator.
+        if self.configuration.tesselation_terminator_priority:
+            distance = np.where(sunlit, self.terminator_distance(x, y), np.inf).min(axis=1)
+            # Tiles in the external margin which do not contain sunlit sample points.
+            dark = np.isinf(distance)
+            distance[dark] = np.maximum(self.terminator_distance(table['x_center'][dark],
+                                                                 table['y_center'][dark]), 0.)
+            bands = (distance / (self.im_w - self.ol_inner_min)).astype(int)
+            tiles = [tile for strip in self.lists_of_tiles for tile in strip]
+            columns = [sorted([tile for tile in tiles if bands[tile.index] == band],
+                              key=lambda tile: -tile['y_top']) for band in range(bands.max() + 1)]
+        # Otherwise the numbering goes through columns of tiles, always from top to bottom.
+        # Depending on parameter "limb first", the process starts at the sunlit limb or at the
+        # terminator. Each column is stored as a list of tiles.
+        elif self.layout_type == "rows":
+            max_cols = max([len(row) for row in self.lists_of_tiles])
+            columns = []
+            for j in range(max_cols):
+                column = []
+                for row in self.lists_of_tiles:
+                    # Not in all rows there are "max_cols" tiles.
+                    if j < len(row):
+                        column.append(row[len(row) - j - 1])
+                columns.append(column)
+            # Start at the sunlit limb.
+            if self.limb_first:
+                columns.reverse()
+        # In a column layout the columns are ordered from the sunlit limb to the terminator.
+        else:
+            columns = list(self.lists_of_tiles)
+            if not self.limb_first:
+                columns.reverse()
+
+        # If the layout is restricted to a region of the sunlit phase, only keep tiles which
+        # contain sunlit sample points in that region.
+        if region != "full":
+            keep = np.any(sunlit & self.in_region(x, y), axis=1)
+            columns = [[tile for tile in column if keep[tile.index]] for column in columns]
+            columns = [column for column in columns if column]
+            self.lists_of_tiles = [[tile for tile in strip if keep[tile.index]] for strip in
+                                   self.lists_of_tiles]
+            self.lists_of_tiles = [strip for strip in self.lists_of_tiles if strip]
+            if self.configuration.protocol_level > 1:
+                Miscellaneous.protocol("Tesselation restricted to region '" + region + "': " + str(
+                    np.count_nonzero(keep)) + " of " + str(len(table)) + " tiles.")
+
+        # If the path optimization is switched on, traverse the columns alternately downwards and
+        # upwards (serpentine order), and improve the path further with a 2-opt heuristic.
+        if self.configuration.tile_path_optimization:
+            self.list_of_tiles_sorted = []
+            column_ranks = []
+            for rank, column in enumerate(columns):
+                if rank % 2:
+                    column = column[::-1]
+                self.list_of_tiles_sorted += column
+                column_ranks += [rank] * len(column)
+            self.list_of_tiles_sorted = self.optimize_path(self.list_of_tiles_sorted, column_ranks)
+        else:
+            self.list_of_tiles_sorted = [tile for column in columns for tile in column]
+
+        # Store the table in recording order, and let the Tile objects point to their new
+        # locations. The Tile objects in "lists_of_tiles" are the same objects.
+        self.tile_table = table[[tile.index for tile in self.list_of_tiles_sorted]]
+        for tile_number, tile in enumerate(self.list_of_tiles_sorted):
+            tile.table = self.tile_table
+            tile.index = tile_number
+            tile.tc = self
+
+        # Bounding boxes of all tiles as a contiguous (n, 4) array (x_left, y_bottom, x_right,
+        # y_top) for fast spatial queries (see methods "tiles_in_box" and "tile_at").
+        self.tile_bounds = np.column_stack((self.tile_table['x_left'], self.tile_table['y_bottom'],
+                                            self.tile_table['x_right'], self.tile_table['y_top']))
+
+        # The indices of unprocessed tiles are kept in a bit set (a Python integer): Bit i is set
+        # if tile i is unprocessed. Initially, all tiles are unprocessed.
+        self.unprocessed_bits = (1 << len(self.tile_table)) - 1
+        self.inherited_tiles = set()
+
+        # Compute the (RA,DE) offsets from moon center for the midpoint on the sunlit limb. The
+        # coordinates of this point are (m_radius, 0.) in the (x,y) coordinate system. Rotate into
+        # (RA,DE) system.
+        [self.delta_ra_limb_center, self.delta_de_limb_center] = (
+            Miscellaneous.rotate(pos_angle, de_center, scale_factor, flip_x, flip_y,
+                                 m_diameter / 2., 0.))
+
+    def stack_parameters(self, extent, size):
+        """
+        Compute the minimum number of tiles in a stack (row or column) which covers an interval,
+        including the external margin on both sides. The overlap between tiles is increased such
+        that the external margin is as specified.
+
+        :param extent: length of the interval (radians)
+        :param size: tile size in the direction of the stack (radians)
+        :return: (number of tiles, overlap between tiles)
+        """
+
+        # Compute the minimum number of tiles and round up to the next integer.
+        n_tiles = int(ceil((extent + 2. * self.ol_outer - self.ol_inner_min) / (
+                size - self.ol_inner_min)))
+        # If there is more than one tile: Increase the overlap.
+        if n_tiles > 1:
+            overlap = (n_tiles * size - extent - 2. * self.ol_outer) / (n_tiles - 1.)
+        else:
+            overlap = self.ol_inner_min
+        return n_tiles, overlap
 
-        # Construct each row of tiles. The origin of the (x,y) coordinate system is at the moon
-        # center, x pointing right, y up. x and y are in radians.
-        m_radius = m_diameter / 2.
-        for i in range(n_rows_corrected):
+    def row_strips(self, n_rows, ol_inner_v, shift=0., margin=0.):
+        """
+        Compute the geometry of a layout with horizontal rows of tiles. Each row spans the x
+        interval covered by the sunlit phase between its top and bottom. The origin of the (x,y)
+        coordinate system is at the moon center, x pointing right, y up. x and y are in radians.
+
+        :param n_rows: number of rows
+        :param ol_inner_v: vertical overlap between rows
+        :param shift: upward shift of the rows (0. if the external margin at the top is as
+                      specified)
+        :param margin: widening of the y interval of a row for which its x interval is computed.
+                       With margin=ol_outer the external margin around sunlit points close to
+                       the neighboring rows is covered for arbitrary row positions.
+        :return: list of rows, each given as (y_top, y_bottom, x_max, number of tiles, horizontal
+                 overlap between tiles)
+        """
+
+        rows = []
+        m_radius = self.m_diameter / 2.
+        for i in range(n_rows):
             # Compute the y coordinates for the top and bottom of the row.
-            y_top = m_radius + self.ol_outer - i * (self.im_h - self.ol_inner_v)
+            y_top = m_radius + self.ol_outer + shift - i * (self.im_h - ol_inner_v)
             y_bottom = y_top - self.im_h
-            # Compute the x coordinates where the moon limb crosses the top and bottom of the row.
-            x_limb_top = sqrt(m_radius ** 2 - min(y_top ** 2, m_radius ** 2))
-            x_limb_bottom = sqrt(m_radius ** 2 - min(y_bottom ** 2, m_radius ** 2))
+            # Compute the x coordinates where the moon limb crosses the top and bottom of the
+            # (widened) row.
+            x_limb_top = sqrt(m_radius ** 2 - min((y_top + margin) ** 2, m_radius ** 2))
+            x_limb_bottom = sqrt(m_radius ** 2 - min((y_bottom - margin) ** 2, m_radius ** 2))
             # The row of tiles does not contain the x axis. The sunlit phase attains its maximum
             # and minimum x values at the top or bottom.
-            if y_top * y_bottom > 0.:
+            if (y_top + margin) * (y_bottom - margin) > 0.:
                 x_max = max(x_limb_top, x_limb_bottom)
-                x_min = min(x_limb_top * cos(phase_angle), x_limb_bottom * cos(phase_angle))
+                x_min = min(x_limb_top * cos(self.phase_angle),
+                            x_limb_bottom * cos(self.phase_angle))
             # The row of tiles straddles the x axis: the maximal x value of the phase is the
             # moon's radius.
             else:
                 x_max = m_radius
                 # Terminator left of y axix: the easy case.
-                if cos(phase_angle) < 0.:
-                    x_min = m_radius * cos(phase_angle)
+                if cos(self.phase_angle) < 0.:
+                    x_min = m_radius * cos(self.phase_angle)
                 # Terminator to the right of y axis: The minimum x value is attained either at the
                 # top or bottom.
                 else:
-                    x_min = min(x_limb_top * cos(phase_angle), x_limb_bottom * cos(phase_angle))
-
-            # Construct the row of tiles. It must span the x interval [x_min, x_max].
-            row_of_tiles = []
-            # As above for the y coordinate, compute the minimum number of tiles and round up.
-            n_cols = (x_max - x_min + 2. * self.ol_outer - ol_inner_min) / (
-                        self.im_w - ol_inner_min)
-            n_cols_corrected = int(ceil(n_cols))
-            # Update the maximal number of tiles in a row.
-            max_cols = max(max_cols, n_cols_corrected)
-            # If there is more than one tile in the row: Increase the horizontal tile overlap in
-            # this row so that the outer margin is as specified.
-            if n_cols_corrected > 1:
-                ol_inner_h = (n_cols_corrected * self.im_w - x_max + x_min - 2. * self.ol_outer) / (
-                        n_cols_corrected - 1.)
-            else:
-                ol_inner_h = ol_inner_min
-            # For each tile of this row: Collect all data for this tile in a dictionary.
-            for j in range(n_cols_corrected):
-                tile = {}
-                tile['row_index'] = i
-                tile['column_index'] = j
-                tile['column_total'] = n_cols_corrected
-                tile['x_right'] = x_max + self.ol_outer - j * (self.im_w - ol_inner_h)
-                tile['x_left'] = tile['x_right'] - self.im_w
-                tile['y_top'] = y_top
-                tile['y_bottom'] = y_bottom
-                tile['x_center'] = (tile['x_right'] + tile['x_left']) / 2.
-                tile['y_center'] = (tile['y_top'] + tile['y_bottom']) / 2.
-                # rotate the (x,y) coordinates to get displacements in (RA,DE) relative to the
-                # moon center. Note the approximate correction of the RA displacement because of
-                # the moon's declination.
-                [tile['delta_ra_center'], tile['delta_de_center']] = (
-                    Miscellaneous.rotate(pos_angle, de_center, scale_factor, flip_x, flip_y,
-                                         tile['x_center'], tile['y_center']))
-                # Append the tile to its row.
-                row_of_tiles.append(tile)
-
-            # A row of tiles is completed, append it to the global structure.
-            self.lists_of_tiles.append(row_of_tiles)
-
-        # Put all tiles in a sequential order. The numbering goes through columns of tiles, always
-        # from top to bottom. Depending on parameter "limb first", the process starts at the sunlit
-        # limb or at the terminator.
-        self.list_of_tiles_sorted = []
-        # Start at the sunlit limb.
-        if self.limb_first:
-            for j in range(max_cols, 0, -1):
-                for i in range(n_rows_corrected):
-                    # Not in all rows there are "max_cols" tiles.
-                    if j <= len(self.lists_of_tiles[i]):
-                        self.list_of_tiles_sorted.append(
-                            self.lists_of_tiles[i][len(self.lists_of_tiles[i]) - j])
+                    x_min = min(x_limb_top * cos(self.phase_angle),
+                                x_limb_bottom * cos(self.phase_angle))
+
+            # The row of tiles must span the x interval [x_min, x_max].
+            (n_cols, ol_inner_h) = self.stack_parameters(x_max - x_min, self.im_w)
+            rows.append((y_top, y_bottom, x_max, n_cols, ol_inner_h))
+        return rows
+
+    def column_extent(self, x_left, x_right):
+        """
+        Compute the extent in y of the sunlit phase between two x coordinates. The sunlit phase is
+        symmetric with respect to the x axis. A point with |y| = sqrt(r**2 - s**2) is sunlit for
+        cos(phase_angle) * s <= x <= s. The y extent is maximal for the smallest s for which this
+        interval intersects [x_left, x_right].
+
+        :param x_left: left border of the column
+        :param x_right: right border of the column
+        :return: maximal y value of the sunlit phase in the column (0. if the column does not
+                 intersect the phase)
+        """
+
+        m_radius = self.m_diameter / 2.
+        cos_phase = cos(self.phase_angle)
+        s_min = max(0., x_left)
+        # Terminator left of the y axis: The terminator is left of x_right for s >= s_min.
+        if cos_phase < 0.:
+            s_min = max(s_min, x_right / cos_phase)
+            if s_min > m_radius:
+                return 0.
+        # Terminator right of the y axis: The terminator is left of x_right for s <= s_max.
+        elif s_min > m_radius or cos_phase * s_min > x_right:
+            return 0.
+        return sqrt(m_radius ** 2 - s_min ** 2)
+
+    def column_strips(self, n_cols, ol_inner_h, shift=0., margin=0.):
+        """
+        Compute the geometry of a layout with vertical columns of tiles, starting at the sunlit
+        limb. Each column spans the y interval covered by the sunlit phase between its left and
+        right border. Depending on the phase and the aspect ratio of the camera, fewer tiles may be
+        needed than with rows.
+
+        :param n_cols: number of columns
+        :param ol_inner_h: horizontal overlap between columns
+        :param shift: shift of the columns to the right (0. if the external margin at the limb is
+                      as specified)
+        :param margin: widening of the x interval of a column for which its y interval is
+                       computed (see method "row_strips")
+        :return: list of columns, each given as (x_right, x_left, y_max, number of tiles, vertical
+                 overlap between tiles)
+        """
+
+        columns = []
+        m_radius = self.m_diameter / 2.
+        for j in range(n_cols):
+            x_right = m_radius + self.ol_outer + shift - j * (self.im_w - ol_inner_h)
+            x_left = x_right - self.im_w
+            y_max = self.column_extent(x_left - margin, x_right + margin)
+            (n_rows, ol_inner_v) = self.stack_parameters(2. * y_max, self.im_h)
+            columns.append((x_right, x_left, y_max, n_rows, ol_inner_v))
+        return columns
+
+    def optimized_strips(self):
+        """
+        Search for the layout with the smallest number of tiles. Both row and column layouts are
+        tried. The number of rows (columns) is kept minimal, but their overlap is varied between
+        the minimum and the value for which the external margin is as specified. The leftover
+        space is used to shift the rows (columns) against the moon. Since the number of tiles in
+        each row (column) depends on its position relative to the limb and the terminator, this
+        can save tiles. If no layout is better, the rectangular row layout is used.
+
+        :return: ("rows" or "columns", list of strips as returned by "row_strips" or
+                 "column_strips")
+        """
+
+        steps = self.configuration.tesselation_search_steps
+        m_radius = self.m_diameter / 2.
+        x_min = min(0., m_radius * cos(self.phase_angle))
+        best = None
+        for (layout_type, extent, size, strips_method) in [
+            ("rows", self.m_diameter, self.im_h, self.row_strips),
+            ("columns", m_radius - x_min, self.im_w, self.column_strips)]:
+            (n_strips, overlap_max) = self.stack_parameters(extent, size)
+            for overlap in np.linspace(overlap_max, self.ol_inner_min, steps):
+                # The space left over by reducing the overlap.
+                slack = n_strips * size - (n_strips - 1) * overlap - extent - 2. * self.ol_outer
+                for shift in np.linspace(0., slack, steps):
+                    # The first candidate is the rectangular layout. Replace it only if the
+                    # number of tiles is reduced. For all other candidates the strips are widened
+                    # by the external margin. With shifted strips, a sunlit point close to the
+                    # border of a strip is not always covered with margin by the neighboring one.
+                    if best is None:
+                        strips = strips_method(n_strips, overlap)
+                        number_tiles_rectangular = sum([strip[3] for strip in strips])
+                    else:
+                        strips = strips_method(n_strips, overlap, shift, margin=self.ol_outer)
+                    number_tiles = sum([strip[3] for strip in strips])
+                    if best is None or number_tiles < best[0]:
+                        best = (number_tiles, layout_type, strips)
+
+        if self.configuration.protocol_level > 1:
+            Miscellaneous.protocol("Optimized tesselation: " + str(best[0]) + " tiles in " + str(
+                len(best[2])) + " " + best[1] + " (rectangular layout: " + str(
+                number_tiles_rectangular) + " tiles).")
+        return best[1], best[2]
+
+    @staticmethod
+    def optimize_path(tiles, column_ranks):
+        """
+        Reduce the total slew time along a sequence of tiles with the 2-opt heuristic for open
+        paths: A segment of the sequence is reversed if this shortens the path. The first tile is
+        kept fixed. The slew time is dominated by the axis with the larger displacement, so the
+        distance between two tiles is the maximum of their offsets in RA and DE.
+
+        To keep the order of columns (from the limb or from the terminator) intact, only segments
+        which contain tiles of a single column are reversed. This way, the column ranks along the
+        path never decrease, i.e. all tiles of a column are recorded before the next column.
+
+        :param tiles: list of tiles in the initial order
+        :param column_ranks: list with the position of each tile's column in the sweep
+        :return: list of tiles in optimized order
+        """
+
+        n = len(tiles)
+        if n < 4:
+            return tiles
+        order = list(range(n))
+        ra = np.array([tile['delta_ra_center'] for tile in tiles])
+        de = np.array([tile['delta_de_center'] for tile in tiles])
+        distance = np.maximum(np.abs(ra[:, np.newaxis] - ra[np.newaxis, :]),
+                              np.abs(de[:, np.newaxis] - de[np.newaxis, :]))
+
+        # Repeat until no improving segment reversal is found.
+        improved = True
+        while improved:
+            improved = False
+            for i in range(1, n - 1):
+                rank_min = rank_max = column_ranks[order[i]]
+                for k in range(i + 1, n):
+                    rank_min = min(rank_min, column_ranks[order[k]])
+                    rank_max = max(rank_max, column_ranks[order[k]])
+                    # The segment extends over more than one column, longer segments will not
+                    # be admissible either.
+                    if rank_max > rank_min:
+                        break
+                    # Change of path length if the segment [i, k] is reversed. The path is open at
+                    # the end, so there is no edge after the last tile.
+                    change = distance[order[i - 1], order[k]] - distance[order[i - 1], order[i]]
+                    if k < n - 1:
+                        change += distance[order[i], order[k + 1]] - distance[
+                            order[k], order[k + 1]]
+                    if change < -1.e-12:
+                        order[i:k + 1] = order[i:k + 1][::-1]
+                        improved = True
+        return [tiles[index] for index in order]
+
+    def update_layout(self, de_center, m_diameter, phase_angle, pos_angle):
+        """
+        Compute the tile layout for the current moon phase during a session. The moon's features
+        covered by the tiles recorded so far (in this and all earlier layouts of the session) are
+        mapped onto the new layout. New tiles which are completely covered this way are marked
+        processed. Only the remaining tiles (e.g. in newly sunlit regions) have to be recorded.
+
+        The new layout is computed in a copy of this object. This object is not changed, so that
+        other threads (e.g. the tile visualization in the GUI thread) can use it until the copy
+        is put in its place.
+
+        :param de_center: declination of the moon's center (radians)
+        :param m_diameter: diameter of the moon (radians)
+        :param phase_angle: phase angle of the sunlit moon phase (0. for New Moon, Pi for Full Moon)
+        :param pos_angle: angle (radians) between North and the "North Pole" of the sunlit phase,
+        counted counterclockwise
+        :return: (TileConstructor object with the new layout, number of tiles which are not
+                 covered by recorded tiles)
+        """
+
+        # Add the tiles recorded in the current layout to the footprints. Tiles which are only
+        # covered by earlier footprints are not added, since parts of them may not have been
+        # sunlit when the footprints were recorded.
+        recorded = self.tile_table['processed'].copy()
+        recorded[list(self.inherited_tiles)] = False
+        tc = copy.copy(self)
+        tc.recorded_footprints = list(self.recorded_footprints)
+        if np.any(recorded):
+            tc.recorded_footprints.append((self.tile_table[recorded], self.pos_angle,
+                                           self.m_diameter))
+
+        tc.compute_layout(de_center, m_diameter, phase_angle, pos_angle)
+        if tc.journal is not None:
+            tc.journal.record_layout(de_center, m_diameter, phase_angle, pos_angle,
+                                     len(tc.tile_table))
+        if tc.recorded_footprints:
+            covered = np.flatnonzero(tc.covered_tiles(tc.recorded_footprints))
+            tc.set_processed(covered, True)
+            tc.inherited_tiles = set(covered.tolist())
+
+        number_unprocessed = bin(tc.unprocessed_bits).count("1")
+        if self.configuration.protocol_level > 0:
+            Miscellaneous.protocol("Tile layout updated, " + str(
+                len(tc.tile_table)) + " tiles, " + str(
+                number_unprocessed) + " of them still to be recorded.")
+        return tc, number_unprocessed
+
+    def covered_tiles(self, footprints, samples=5):
+        """
+        Find the tiles of the current layout which are covered completely by the union of tiles
+        of previous layouts. For each tile a grid of sample points is tested. Only points on the
+        sunlit part of the moon have to be covered.
+
+        The normalized (x,y) coordinate systems of the two layouts differ by the change of the
+        position angle, and by the change of the moon's apparent diameter. The rotation in module
+        miscellaneous maps (x,y) onto (RA,DE) offsets with a matrix which is its own inverse.
+        Therefore, the transformation from new to old coordinates is the product of the rotation
+        matrices for the new and old position angles. The slow rotation of the moon's axis and the
+        change in libration during a session are neglected.
+
+        :param footprints: list of tuples (structured array with tiles of a previous layout,
+                           position angle (radians) and moon diameter (radians) of that layout)
+        :param samples: number of sample points per tile in each coordinate direction
+        :return: boolean Numpy array, True for tiles of the current layout which are covered
+        """
+
+        # Sample points in all tiles. Only points on the sunlit part of the moon must be covered.
+        (x, y) = self.sample_points(self.tile_table, samples)
+        sunlit = self.sunlit_points(x, y)
+        (u, v) = Miscellaneous.rotate(self.pos_angle, 0., 1., 1., 1., x, y)
+
+        # Points on tile borders must not get lost by rounding errors in the transformation.
+        tolerance = 1.e-6 * self.im_w
+        covered = np.zeros(x.shape, dtype=bool)
+        for (old_tiles, old_pos_angle, old_diameter) in footprints:
+            # Transform the points into the coordinate system of the old layout.
+            (x_old, y_old) = Miscellaneous.rotate(old_pos_angle, 0.,
+                                                  old_diameter / self.m_diameter, 1., 1., u, v)
+            # Test for each point if it is contained in any of the old tiles.
+            for tile in old_tiles:
+                covered |= (x_old >= tile['x_left'] - tolerance) & (
+                        x_old <= tile['x_right'] + tolerance) & (
+                        y_old >= tile['y_bottom'] - tolerance) & (
+                        y_old <= tile['y_top'] + tolerance)
+        return np.all(covered | ~sunlit, axis=1)
+
+    def sample_points(self, table, samples):
+        """
+        Compute a regular grid of sample points in each tile of a tile table.
 
-        # Start at the terminator.
+        :param table: structured array with tiles
+        :param samples: number of sample points per tile in each coordinate direction
+        :return: (x, y) Numpy arrays of shape (number of tiles, samples**2)
+        """
+
+        fractions = np.linspace(0., 1., samples)
+        fx, fy = np.meshgrid(fractions, fractions)
+        x = table['x_left'][:, np.newaxis] + self.im_w * fx.ravel()[np.newaxis, :]
+        y = table['y_bottom'][:, np.newaxis] + self.im_h * fy.ravel()[np.newaxis, :]
+        return x, y
+
+    def sunlit_points(self, x, y):
+        """
+        Check which points are on the sunlit part of the moon.
+
+        :param x: Numpy array of x coordinates
+        :param y: Numpy array of y coordinates
+        :return: boolean Numpy array, True for sunlit points
+        """
+
+        m_radius = self.m_diameter / 2.
+        on_moon = x ** 2 + y ** 2 <= m_radius ** 2
+        return on_moon & (self.terminator_distance(x, y) >= 0.)
+
+    def in_region(self, x, y):
+        """
+        Check which points are in the region of the sunlit phase to which the tesselation is
+        restricted (see configuration parameter "tesselation_region").
+
+        :param x: Numpy array of x coordinates
+        :param y: Numpy array of y coordinates
+        :return: boolean Numpy array, True for points in the region
+        """
+
+        region = self.configuration.tesselation_region
+        if region == "full":
+            return np.ones(np.shape(x), dtype=bool)
+        elif region == "terminator":
+            return self.terminator_distance(x, y) <= radians(
+                self.configuration.tesselation_terminator_width / 60.)
+        elif region == "selenographic box":
+            (longitude, latitude) = self.selenographic_coordinates(x, y)
+            box = self.configuration.tesselation_selenographic_box
+            (long_min, long_max, lat_min, lat_max) = [radians(bound) for bound in box]
+            return (longitude >= long_min) & (longitude <= long_max) & (latitude >= lat_min) & (
+                    latitude <= lat_max)
         else:
-            for j in range(max_cols):
-                for i in range(n_rows_corrected):
-                    if j < len(self.lists_of_tiles[i]):
-                        self.list_of_tiles_sorted.append(
-                            self.lists_of_tiles[i][len(self.lists_of_tiles[i]) - j - 1])
+            raise RuntimeError("Unknown tesselation region: " + str(region))
 
-        # Compute the (RA,DE) offsets from moon center for the midpoint on the sunlit limb. The
-        # coordinates of this point are (m_radius, 0.) in the (x,y) coordinate system. Rotate into
-        # (RA,DE) system.
-        [self.delta_ra_limb_center, self.delta_de_limb_center] = (
-            Miscellaneous.rotate(pos_angle, de_center, scale_factor, flip_x, flip_y, m_radius, 0.))
+    def terminator_distance(self, x, y):
+        """
+        Compute the horizontal distance of points from the terminator (positive on the sunlit
+        side).
+
+        :param x: Numpy array of x coordinates
+        :param y: Numpy array of y coordinates
+        :return: Numpy array of distances (radians)
+        """
+
+        m_radius = self.m_diameter / 2.
+        return x - cos(self.phase_angle) * np.sqrt(np.maximum(m_radius ** 2 - y ** 2, 0.))
+
+    def selenographic_coordinates(self, x, y):
+        """
+        Translate points on the visible hemisphere of the moon into selenographic coordinates.
+        This is the inverse of method "coord_translation" in class LandmarkSelection.
+
+        :param x: Numpy array of x coordinates (in the "normalized" orientation)
+        :param y: Numpy array of y coordinates (in the "normalized" orientation)
+        :return: (longitude, latitude) Numpy arrays (radians)
+        """
+
+        if self.me is None:
+            raise RuntimeError("Selenographic coordinates need a moon ephemeris object.")
+        m_radius = self.m_diameter / 2.
+        # Displacements on the moon's disk (without correction for declination).
+        (delta_ra, delta_de) = Miscellaneous.rotate(self.pos_angle, 0., 1., 1., 1., x, y)
+        # Rotate back for the position angle of the moon's rotational axis (lunar north up).
+        da_prime = delta_ra * cos(self.me.pos_rot_north) - delta_de * sin(self.me.pos_rot_north)
+        dd_prime = delta_ra * sin(self.me.pos_rot_north) + delta_de * cos(self.me.pos_rot_north)
+        # Unit vector on the moon's sphere. The observer looks along the positive y axis.
+        x_sphere = -da_prime / m_radius
+        d_sphere = dd_prime / m_radius
+        y_prime = -np.sqrt(np.maximum(1. - x_sphere ** 2 - d_sphere ** 2, 0.))
+        # Undo the libration in latitude and longitude.
+        y_sphere = y_prime * cos(self.me.topocentric_lib_lat) + d_sphere * sin(
+            self.me.topocentric_lib_lat)
+        z_sphere = -y_prime * sin(self.me.topocentric_lib_lat) + d_sphere * cos(
+            self.me.topocentric_lib_lat)
+        latitude = np.arcsin(np.clip(z_sphere, -1., 1.))
+        longitude = (np.arctan2(x_sphere, -y_sphere) + self.me.topocentric_lib_long + np.pi) % (
+                2. * np.pi) - np.pi
+        return longitude, latitude
+
+    def tiles_in_box(self, x_min, x_max, y_min, y_max, mode="contained"):
+        """
+        Find all tiles in a rectangle given in (x,y) coordinates. All tiles are tested at once on
+        the array of tile bounding boxes.
+
+        :param x_min: left border of the rectangle
+        :param x_max: right border of the rectangle
+        :param y_min: lower border of the rectangle
+        :param y_max: upper border of the rectangle
+        :param mode: "contained" for tiles completely contained in the rectangle, "intersecting"
+                     for tiles which overlap with the rectangle
+        :return: list with the indices of the tiles found, in ascending order
+        """
+
+        bounds = self.tile_bounds
+        if mode == "contained":
+            found = (bounds[:, 0] >= x_min) & (bounds[:, 2] <= x_max) & (
+                    bounds[:, 1] >= y_min) & (bounds[:, 3] <= y_max)
+        elif mode == "intersecting":
+            found = (bounds[:, 2] > x_min) & (bounds[:, 0] < x_max) & (
+                    bounds[:, 3] > y_min) & (bounds[:, 1] < y_max)
+        else:
+            raise RuntimeError("Unknown tile selection mode: " + str(mode))
+        return np.flatnonzero(found).tolist()
+
+    def tile_at(self, x, y):
+        """
+        Find the tile under a point given in (x,y) coordinates, e.g. the mouse cursor position in
+        the tile visualization window. If tiles overlap at this point, the tile with the lowest
+        index is returned. (It is drawn on top in the tile visualization window.)
+
+        :param x: x coordinate of the point
+        :param y: y coordinate of the point
+        :return: index of the tile, or None if the point is not on any tile
+        """
+
+        bounds = self.tile_bounds
+        hit = np.flatnonzero((bounds[:, 0] <= x) & (bounds[:, 2] >= x) & (bounds[:, 1] <= y) & (
+                bounds[:, 3] >= y))
+        if len(hit):
+            return int(hit[0])
+        return None
+
+    def set_processed(self, index_list, processed):
+        """
+        Set the "processed" flag of tiles, both in the tile table and in the bit set of unprocessed
+        tiles. All changes of this flag must be done with this method.
+
+        :param index_list: list of tile indices
+        :param processed: True, if the tiles are to be marked processed, False otherwise
+        :return: -
+        """
+
+        if self.journal is not None:
+            self.journal.record_tiles(index_list, processed)
+        # A tile which is marked explicitly is not inherited from recorded footprints anymore.
+        self.inherited_tiles.difference_update(int(index) for index in index_list)
+        mask = 0
+        for index in index_list:
+            mask |= 1 << int(index)
+        self.tile_table['processed'][index_list] = processed
+        if processed:
+            self.unprocessed_bits &= ~mask
+        else:
+            self.unprocessed_bits |= mask
+
+    def set_all_processed(self, processed):
+        """
+        Set the "processed" flag of all tiles.
+
+        :param processed: True, if the tiles are to be marked processed, False otherwise
+        :return: -
+        """
+
+        if self.journal is not None:
+            self.journal.record_all_tiles(processed)
+        self.inherited_tiles = set()
+        self.tile_table['processed'] = processed
+        if processed:
+            self.unprocessed_bits = 0
+        else:
+            self.unprocessed_bits = (1 << len(self.tile_table)) - 1
 
     def find_next_unprocessed_tile(self, workflow):
         """
@@ -199,33 +801,29 @@ class TileConstructor:
         :return: (next tile, index of next tile), or (None, -1) if no "unprocessed" tile is left.
         """
 
-        # Initialize an index vector, starting with 0. Its length is the total number of tiles.
-        indices = list(range(len(self.list_of_tiles_sorted)))
-
-        # After failure in auto-alignment, let the index vector start with index "repeat_from_here",
-        # and wrap around.
+        # After failure in auto-alignment, start the search with index "repeat_from_here".
+        # Otherwise start with index "active_tile_number". In both cases wrap around.
         if workflow.repeat_from_here != -1:
-            indices_shifted = indices[workflow.repeat_from_here:] + indices[
-                                                                    0:workflow.repeat_from_here]
+            start = workflow.repeat_from_here
             workflow.repeat_from_here = -1
-        # Let the index vector start with index "active_tile_number", and wrap around.
         elif workflow.active_tile_number != -1:
-            indices_shifted = indices[workflow.active_tile_number:] + indices[
-                                                                      0:workflow.active_tile_number]
-        # No "repeat from here" and no "active_tile_number" set: Keep the tiles in original order.
+            start = workflow.active_tile_number
+        # No "repeat from here" and no "active_tile_number" set: Start with the first tile.
         else:
-            indices_shifted = indices
+            start = 0
 
-        # Look for first "unprocessed" tile in shifted order. Leave the loop when the first is
-        # found.
+        # Look for the first "unprocessed" tile at or after the start index: Shift the bit set
+        # to the right and isolate the lowest set bit. If there is none, take the first
+        # "unprocessed" tile from the beginning.
         next_tile = None
         next_tile_index = -1
-        for i in indices_shifted:
-            tile = self.list_of_tiles_sorted[i]
-            if not tile['processed']:
-                next_tile = tile
-                next_tile_index = i
-                break
+        bits = self.unprocessed_bits >> start
+        if bits:
+            next_tile_index = start + (bits & -bits).bit_length() - 1
+        elif self.unprocessed_bits:
+            next_tile_index = (self.unprocessed_bits & -self.unprocessed_bits).bit_length() - 1
+        if next_tile_index != -1:
+            next_tile = self.list_of_tiles_sorted[next_tile_index]
 
         return next_tile, next_tile_index
 
@@ -266,3 +864,11 @@ if __name__ == "__main__":
     print(" ")
     print("Limb center coordinates: d_RA: ", tc.delta_ra_limb_center, ", d_DE: ",
           tc.delta_de_limb_center)
+
+    # Compare the number of tiles for the available tesselation strategies.
+    print(" ")
+    for strategy in ["rectangular", "columns", "optimized"]:
+        configuration.tesselation_strategy = strategy
+        tc = TileConstructor(configuration, de_center, m_diameter, phase_angle, pos_angle)
+        print("Tesselation strategy: ", strategy, ", layout: ", tc.layout_type,
+              ", number of tiles: ", len(tc.tile_table))
@@ -0,0 +1,237 @@
+# -*- coding: utf-8; -*-
+"""
+Copyright (c) 2016 Rolf Hempel, rolf6419@gmx.de
+
+This file is part of the MoonPanoramaMaker tool (MPM).
+https://github.com/Rolf-Hempel/MoonPanoramaMaker
+
+MPM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with MPM.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+from functools import lru_cache
+from math import cos
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PatchCollection, PathCollection
+from matplotlib.colors import to_rgba
+from matplotlib.figure import Figure
+from matplotlib.patches import Rectangle, Polygon
+from matplotlib.path import Path
+from matplotlib.textpath import TextPath
+from matplotlib.transforms import Affine2D
+
+
+class TileLayoutRenderer:
+    """
+    This class draws the tesselation computed by the TileConstructor (sunlit moon phase, tiles
+    colored according to their state, tile labels) into a Matplotlib Axes object. It is used by
+    the interactive "Tile Visualization" window, and (with static method "save_layout") for
+    rendering tile layouts to image files without any GUI. In the latter case the Agg backend is
+    used directly, pyplot is not imported.
+
+    All tiles are drawn as a single PatchCollection with one face color per tile, and all tile
+    labels as a single collection of text outlines.
+
+    """
+
+    # Tile colors: unprocessed, processed, active (being processed).
+    color_unprocessed = to_rgba('red', 0.5)
+    color_processed = to_rgba('skyblue', 0.5)
+    color_active = to_rgba('blue', 0.5)
+
+    def __init__(self, configuration, tc, ax, animated=False):
+        """
+        Draw the tile layout into the Axes object. Tiles are colored according to their
+        "processed" flags.
+
+        :param configuration: object containing parameters set by the user
+        :param tc: TileConstructor object with information on the tesselation
+        :param ax: Matplotlib Axes object
+        :param animated: if True, tiles and labels are created as "animated" artists (for
+                         blitting in the interactive window)
+        """
+
+        self.configuration = configuration
+        self.tc = tc
+        self.ax = ax
+
+        # Set the coordinate range in x and y. Coordinates are in radians from now on.
+        fig_half_width = tc.m_diameter / 2. + 0.0003 + tc.ol_outer
+        self.ax.axis(([-fig_half_width, fig_half_width, -fig_half_width, fig_half_width]))
+
+        # Compute and show the current outline of the moon phase.
+        self.moon_outline = Polygon(self.moon_phase(), closed=True, color='#FFD700', alpha=1.)
+        self.ax.add_patch(self.moon_outline)
+
+        # Draw all tiles as a single collection. Add the tiles in reversed order, so that tiles
+        # with low indices are drawn on top.
+        table = tc.tile_table
+        self.tile_colors = np.tile(self.color_unprocessed, (len(table), 1))
+        self.tile_colors[table['processed']] = self.color_processed
+        self.tiles = PatchCollection(
+            [Rectangle((t['x_left'], t['y_bottom']), tc.im_w, tc.im_h) for t in table[::-1]],
+            facecolors=self.tile_colors[::-1], edgecolors=self.tile_colors[::-1],
+            animated=animated)
+        self.ax.add_collection(self.tiles)
+
+        # Compute the label positions for all tiles at once. The labels are drawn as a single
+        # collection of text outlines (in points), centered at the label positions. Other than
+        # text objects, they can be drawn in one go and clipped to a region.
+        label_fontsize = configuration.conf.getint("Tile Visualization", "label fontsize")
+        label_shift = configuration.conf.getfloat("Tile Visualization", "label shift")
+        x_text_pos_col = table['x_right'] - (table['column_index'] + 1.) / (
+                table['column_total'] + 1.) * tc.im_w
+        x_text_pos = label_shift * x_text_pos_col + (1. - label_shift) * table['x_center']
+        label_paths = []
+        for count in range(len(table)):
+            text_path = TextPath((0., 0.), str(count), size=label_fontsize)
+            extents = text_path.get_extents()
+            label_paths.append(Path(text_path.vertices - extents.p0 - 0.5 * extents.size,
+                                    text_path.codes))
+        self.labels = PathCollection(label_paths, offsets=np.column_stack(
+            (x_text_pos, table['y_center'])), transOffset=self.ax.transData,
+                                     facecolors='black', edgecolors='none', animated=animated)
+        self.labels.set_transform(Affine2D().scale(1. / 72.) + self.ax.figure.dpi_scale_trans)
+        self.ax.add_collection(self.labels)
+
+    def remove(self):
+        """
+        Remove all artists of the tile layout from the Axes object.
+
+        :return: -
+        """
+
+        self.moon_outline.remove()
+        self.tiles.remove()
+        self.labels.remove()
+
+    def set_tile_colors(self, index_list, color):
+        """
+        Change the color of tiles.
+
+        :param index_list: list of tile indices, or None for all tiles
+        :param color: RGBA color, e.g. "color_processed"
+        :return: -
+        """
+
+        if index_list is None:
+            self.tile_colors[:] = color
+        else:
+            self.tile_colors[np.asarray(index_list, dtype=int)] = color
+        # The collection contains the tiles in reversed order.
+        self.tiles.set_facecolor(self.tile_colors[::-1])
+        self.tiles.set_edgecolor(self.tile_colors[::-1])
+
+    def moon_phase(self):
+        """
+        Compute the outline of the current sunlit phase of the moon. The number of vertices is
+        adapted to the size of the moon on the screen.
+
+        :return: Numpy array of vertices which outline the moon phase.
+        """
+
+        moon_radius = self.tc.m_diameter / 2.
+        # Length of the limb (half circle) in screen pixels.
+        (x_center, x_limb) = self.ax.transData.transform([[0., 0.], [moon_radius, 0.]])[:, 0]
+        resolution = int(np.pi * abs(x_limb - x_center) /
+                         self.configuration.phase_outline_pixels_per_vertex)
+        resolution = min(max(resolution, self.configuration.phase_outline_min_vertices),
+                         self.configuration.phase_outline_max_vertices)
+        return moon_radius * self.phase_outline(self.tc.phase_angle, resolution)
+
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def phase_outline(phase_angle, resolution):
+        """
+        Compute the outline of the sunlit phase for a moon of unit radius. The outer (sunlit) moon
+        limb is traversed from the top, and the terminator from the bottom. Results are cached, so
+        that repeated redraws for the same phase angle and window size do not recompute them.
+
+        :param phase_angle: phase angle of the sunlit phase (radians)
+        :param resolution: number of vertices on the limb and on the terminator
+        :return: Numpy array (read-only) with 2 * resolution vertices
+        """
+
+        phi = np.pi * np.arange(2 * resolution) / resolution
+        vertices = np.column_stack((np.abs(np.sin(phi)) * np.where(
+            phi < np.pi, 1., cos(phase_angle)), np.cos(phi)))
+        vertices.setflags(write=False)
+        return vertices
+
+    @staticmethod
+    def save_layout(configuration, tc, filename, active_tile=None, figsize=None, dpi=100):
+        """
+        Render a tile layout with the current tile states to an image file, without any GUI. The
+        file format (e.g. PNG or SVG) is taken from the file name extension.
+
+        :param configuration: object containing parameters set by the user
+        :param tc: TileConstructor object with information on the tesselation
+        :param filename: name of the image file
+        :param active_tile: index of a tile to be marked active, or None
+        :param figsize: (width, height) of the image in inches. If None, the size of the
+                        "Tile Visualization" window is used.
+        :param dpi: resolution (dots per inch)
+        :return: -
+        """
+
+        if figsize is None:
+            figsize = (configuration.conf.getfloat("Tile Visualization", "figsize horizontal"),
+                       configuration.conf.getfloat("Tile Visualization", "figsize vertical"))
+        # Create the figure with an Agg canvas directly, so no GUI backend is involved.
+        fig = Figure(figsize=figsize, dpi=dpi, facecolor=(0., 0., 0., 1))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111, facecolor='black')
+        ax.tick_params(axis='both', which='both', bottom=False, top=False, labelbottom=False,
+                       left=False, labelleft=False)
+        renderer = TileLayoutRenderer(configuration, tc, ax)
+        if active_tile is not None:
+            renderer.set_tile_colors([active_tile], TileLayoutRenderer.color_active)
+        fig.tight_layout()
+        fig.savefig(filename, facecolor=fig.get_facecolor())
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    from math import radians
+
+    import configuration
+    from tile_constructor import TileConstructor
+
+    # Batch rendering: Tile layouts for a series of moon phases and all camera profiles, in PNG
+    # and SVG format.
+    c = configuration.Configuration()
+    camera_profiles = [(1280, 960), (640, 480), (1920, 1080), (3000, 2000)]
+    directory = os.path.join(c.home, "MoonPanoramaMaker_layouts")
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    number_files = 0
+    for (pixel_horizontal, pixel_vertical) in camera_profiles:
+        c.conf.set("Camera", "pixel horizontal", str(pixel_horizontal))
+        c.conf.set("Camera", "pixel vertical", str(pixel_vertical))
+        for phase_angle in range(30, 180, 30):
+            tc = TileConstructor(c, radians(10.), radians(0.52), radians(phase_angle),
+                                 radians(30.))
+            # Mark the first half of the tiles as processed.
+            tc.set_processed(range(len(tc.tile_table) // 2), True)
+            name = "layout_" + str(pixel_horizontal) + "x" + str(pixel_vertical) + "_" + str(
+                phase_angle)
+            for extension in [".png", ".svg"]:
+                TileLayoutRenderer.save_layout(c, tc, os.path.join(directory, name + extension),
+                                               active_tile=len(tc.tile_table) // 2)
+                number_files += 1
+    print(str(number_files) + " layout files written to " + directory + " in " + str(
+        round(time.perf_counter() - start, 1)) + " seconds.")
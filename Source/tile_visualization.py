@@ -24,11 +24,13 @@ from math import radians
 
 import matplotlib.pyplot as plt
 import numpy as np
-from matplotlib.patches import Rectangle, Polygon
+from matplotlib.patches import Rectangle
+from matplotlib.transforms import Bbox
 from matplotlib.widgets import RectangleSelector
 
 import configuration
 import tile_constructor
+from tile_layout_renderer import TileLayoutRenderer
 
 
 def toggle_selector(event):
@@ -41,6 +43,13 @@ class TileVisualization:
     TileConstructor. It provides methods for MPM to show the state of different tiles, or for the
     user to select regions of tiles which then can be marked processed / uprocessed collectively.
 
+    The tile layout is drawn by a TileLayoutRenderer object (which is also used for rendering
+    layouts to files without a GUI). Tiles, labels and the selection rectangle are "animated"
+    artists: They are not part of the static background (moon phase and axes), which
+    is saved after each full redraw. If tiles change their color, the background is restored in
+    the screen region of the changed tiles, the animated artists are drawn on top (clipped to the
+    region), and only this region is updated on the screen (blitting).
+
     """
 
     def __init__(self, configuration, tc):
@@ -53,8 +62,6 @@ class TileVisualization:
         """
 
         # Initialize instance variables
-        self.m_diameter = tc.m_diameter
-        self.phase_angle = tc.phase_angle
         self.configuration = configuration
         self.tc = tc
         # The "active tile" is colored blue. It is just being processed. Unprocessed tiles are
@@ -79,35 +86,18 @@ class TileVisualization:
         self.mngr.window.setGeometry(x0, y0, width, height)
 
         self.ax = self.fig.add_subplot(111, facecolor='black')
-        # Set the coordinate range in x and y. Coordinates are in radians from now on.
-        fig_half_width = self.m_diameter / 2. + 0.0003 + self.tc.ol_outer
-        plt.axis(([-fig_half_width, fig_half_width, -fig_half_width, fig_half_width]))
         plt.tick_params(axis='both', which='both', bottom=False, top=False, labelbottom=False,
                         left=False, labelleft=False)
 
-        # Compute and show the current outline of the moon phase.
-        polygon_array = np.array(self.__MoonPhase__())
-        moon_outline = (Polygon(polygon_array, closed=True, color='#FFD700', alpha=1.))
-
-        self.ax.add_patch(moon_outline)
-
-        # Draw all tiles. Their color is red (unprocessed).
-        self.tiles = []
-        label_fontsize = self.configuration.conf.getint("Tile Visualization", "label fontsize")
-        label_shift = self.configuration.conf.getfloat("Tile Visualization", "label shift")
-        for count, t in enumerate(self.tc.list_of_tiles_sorted):
-            rectangle = Rectangle((t['x_left'], t['y_bottom']), self.tc.im_w, self.tc.im_h,
-                                  color='red', alpha=0.5)
-            self.tiles.append(rectangle)
-            x_text_pos_col = (t['x_right'] - float(t['column_index'] + 1) / float(
-                t['column_total'] + 1) * self.tc.im_w)
-            x_text_pos = (label_shift * x_text_pos_col + (1. - label_shift) * t['x_center'])
-            plt.text(x_text_pos, t['y_center'], str(count), horizontalalignment='center',
-                     verticalalignment='center', fontsize=label_fontsize)
-
-        # Add the tiles in reversed order.
-        for t in reversed(self.tiles):
-            self.ax.add_patch(t)
+        # Draw the moon phase and all tiles. Their color is red (unprocessed). After every full
+        # redraw of the window, save the background for blitting. This callback is connected
+        # before the RectangleSelector's, so that its background contains the tiles as well.
+        self.layout = None
+        self.background = None
+        self.selection_rectangle = None
+        self.picked_tile = None
+        self.draw_layout()
+        self.fig.canvas.mpl_connect('draw_event', self.save_background)
 
         # Initialize the RectangleSelector with which patches of tiles can be selected later.
         toggle_selector.RS = RectangleSelector(self.ax, self.line_select_callback, drawtype='box',
@@ -127,7 +117,6 @@ class TileVisualization:
         self.x2 = -2.
         self.y1 = -2.
         self.y2 = -2.
-        self.selection_rectangle = None
         self.reset_selection_rectangle()
 
         self.fig.canvas.set_window_title("MoonPanoramaMaker: Tile Arrangement "
@@ -136,45 +125,172 @@ class TileVisualization:
         plt.tight_layout()
         self.fig.canvas.manager.show()
 
+    def draw_layout(self):
+        """
+        Draw the outline of the moon phase and the tiles of the current layout of the
+        TileConstructor. Tiles are colored according to their "processed" flags.
+
+        :return: -
+        """
+
+        self.layout = TileLayoutRenderer(self.configuration, self.tc, self.ax, animated=True)
+
+    def refresh_layout(self, tc):
+        """
+        Replace the displayed tiles after the layout of the TileConstructor has been updated (see
+        method "update_layout" there). The window is not re-created. Tiles are colored according
+        to their "processed" flags.
+
+        :param tc: TileConstructor object with the new layout
+        :return: -
+        """
+
+        # Remove the artists of the previous layout.
+        self.reset_selection_rectangle()
+        self.layout.remove()
+        self.active_tile = None
+
+        # Draw the new layout.
+        self.tc = tc
+        self.draw_layout()
+        self.background = None
+        self.fig.canvas.draw_idle()
+
+    def save_background(self, event):
+        """
+        Callback function, called after each full redraw of the window. Save the static
+        background for blitting, and draw the animated artists on top of it.
+
+        :param event: draw event
+        :return: -
+        """
+
+        self.background = self.fig.canvas.copy_from_bbox(self.ax.bbox)
+        self.draw_animated_artists()
+
+    def draw_animated_artists(self, region=None):
+        """
+        Draw the tiles, their labels and the selection rectangle (if any) onto the canvas.
+
+        :param region: if given, only draw within this screen region (Bbox in display
+                       coordinates)
+        :return: -
+        """
+
+        for artist in [self.layout.tiles, self.layout.labels, self.selection_rectangle]:
+            if artist is None:
+                continue
+            # Clip the artist temporarily to the region, so that nothing outside is drawn twice.
+            if region is not None:
+                clip_box = artist.get_clip_box()
+                artist.set_clip_box(region)
+            self.ax.draw_artist(artist)
+            if region is not None:
+                artist.set_clip_box(clip_box)
+
+    def update_display(self, index_list=None):
+        """
+        Update the window after tile colors or the selection rectangle have changed. If possible,
+        only the screen region covered by the changed tiles is redrawn. Otherwise (no background
+        saved yet, or backend without blitting support) a full redraw is scheduled. This method
+        must be called from the GUI thread only.
+
+        :param index_list: list of changed tile indices, or None if the whole axes region is to
+                           be updated
+        :return: -
+        """
+
+        canvas = self.fig.canvas
+        if self.background is None or not getattr(canvas, 'supports_blit', False):
+            canvas.draw_idle()
+            return
+
+        if index_list is None or len(index_list) == 0:
+            canvas.restore_region(self.background)
+            self.draw_animated_artists()
+            canvas.blit(self.ax.bbox)
+            return
+
+        # Screen region covered by the changed tiles (with a small border for the edges), rounded
+        # to full pixels and restricted to the axes.
+        table = self.tc.tile_table[np.asarray(index_list, dtype=int)]
+        corners = self.ax.transData.transform(
+            [[table['x_left'].min(), table['y_bottom'].min()],
+             [table['x_right'].max(), table['y_top'].max()]])
+        region = Bbox.intersection(Bbox([np.floor(corners[0]) - 2., np.ceil(corners[1]) + 2.]),
+                                   self.ax.bbox)
+        if region is None:
+            return
+        # Restore the background in this region only. The bbox is given in image coordinates (y
+        # pointing down), and its upper limits are inclusive. The background is restored at its
+        # original position.
+        canvas_height = int(self.fig.bbox.height)
+        canvas.restore_region(self.background, bbox=(region.x0, canvas_height - region.y1,
+                                                     region.x1 - 1, canvas_height - region.y0 - 1),
+                              xy=self.background.get_extents()[:2])
+        self.draw_animated_artists(region)
+        canvas.blit(region)
+
     def line_select_callback(self, eclick, erelease):
         """
         Callback function, called when a rectangle has been drawn with the mouse. It draws a light
-        grey rectangle on the Window to highlight the selected region.
+        grey rectangle on the Window to highlight the selected region. If the mouse has been
+        clicked on a tile without drawing a rectangle, this single tile is selected (picked) and
+        highlighted. A second click on the picked tile deselects it.
 
         :param eclick: event object created when mouse button was clicked
         :param erelease: event object created when mouse button was released
         :return: -
         """
-        # If new coordinates are as the old ones, or if the rectangle has zero width,
-        # a point has been selected.
+        # If new coordinates are as the old ones, the selection is reset.
         if self.x1 == eclick.xdata and self.y1 == eclick.ydata and self.x2 == erelease.xdata and \
-                self.y2 == erelease.ydata or eclick.xdata == erelease.xdata:
+                self.y2 == erelease.ydata:
             self.reset_selection_rectangle()
             return
 
+        # The rectangle has zero width: a point has been selected. Pick the tile under the cursor.
+        if eclick.xdata == erelease.xdata:
+            tile_index = self.tc.tile_at(eclick.xdata, eclick.ydata)
+            if tile_index is None or tile_index == self.picked_tile:
+                self.reset_selection_rectangle()
+                return
+            (x_left, y_bottom, x_right, y_top) = self.tc.tile_bounds[tile_index]
+            self.show_selection_rectangle(x_left, x_right, y_bottom, y_top)
+            self.picked_tile = tile_index
+            return
+
         # eclick and erelease are the press and release events, get corners of rectangle.
         self.x1, self.y1 = eclick.xdata, eclick.ydata
         self.x2, self.y2 = erelease.xdata, erelease.ydata
+        self.show_selection_rectangle(min(self.x1, self.x2), max(self.x1, self.x2),
+                                      min(self.y1, self.y2), max(self.y1, self.y2))
 
-        # Compute corner coordinates, width and height
-        self.select_rect_x_min = min(self.x1, self.x2)
-        self.select_rect_x_max = max(self.x1, self.x2)
-        self.select_rect_y_min = min(self.y1, self.y2)
-        self.select_rect_y_max = max(self.y1, self.y2)
-        width = self.select_rect_x_max - self.select_rect_x_min
-        height = self.select_rect_y_max - self.select_rect_y_min
+    def show_selection_rectangle(self, x_min, x_max, y_min, y_max):
+        """
+        Remove the previous selection_rectangle (or picked tile), and draw a new one.
 
-        # Not a point selected: remove previous selection_rectangle and draw a new one.
+        :param x_min: left border of the rectangle
+        :param x_max: right border of the rectangle
+        :param y_min: lower border of the rectangle
+        :param y_max: upper border of the rectangle
+        :return: -
+        """
+
+        self.picked_tile = None
+        self.select_rect_x_min = x_min
+        self.select_rect_x_max = x_max
+        self.select_rect_y_min = y_min
+        self.select_rect_y_max = y_max
         if self.selection_rectangle is not None:
             self.ax.patches.remove(self.selection_rectangle)
-        self.selection_rectangle = Rectangle((self.select_rect_x_min, self.select_rect_y_min),
-                                             width, height, color='lightgrey', alpha=0.4)
+        self.selection_rectangle = Rectangle((x_min, y_min), x_max - x_min, y_max - y_min,
+                                             color='lightgrey', alpha=0.4, animated=True)
         self.ax.add_patch(self.selection_rectangle)
-        self.fig.canvas.draw()
+        self.update_display()
 
     def reset_selection_rectangle(self):
         """
-        Reset the selection_rectangle.
+        Reset the selection_rectangle and the picked tile.
 
         :return: -
         """
@@ -184,65 +300,46 @@ class TileVisualization:
         self.select_rect_x_max = -2.
         self.select_rect_y_min = -2.
         self.select_rect_y_max = -2.
+        self.picked_tile = None
         # If there is an active selection rectangle: Remove it.
         if self.selection_rectangle is not None:
             self.ax.patches.remove(self.selection_rectangle)
-        self.selection_rectangle = None
+            self.selection_rectangle = None
+            self.update_display()
 
     def get_selected_tile_numbers(self):
         """
-        When a selection_rectangle is drawn, determine which tiles are completely contained in it.
+        If a tile has been picked with the mouse, return its index. Otherwise, when a
+        selection_rectangle is drawn, determine which tiles are contained in it (completely or
+        partly, depending on the configuration parameter "tile_selection_mode").
 
-        :return: list with the indices of all tiles (completely) contained in selection rectangle
+        :return: list with the indices of all tiles selected
         """
 
         selected_tile_numbers = []
+        if self.picked_tile is not None:
+            selected_tile_numbers = [self.picked_tile]
         # Test for a valid x_max coordinate (rectangle was not reset).
-        if self.select_rect_x_max > -1.:
-            # Go through the entire tile list, start with tile 0.
-            for tile_number, t in enumerate(self.tc.list_of_tiles_sorted):
-                # The tile is completely contained in rectangle, add it to the list.
-                if t['x_left'] >= self.select_rect_x_min and t[
-                    'x_right'] <= self.select_rect_x_max and t[
-                    'y_bottom'] >= self.select_rect_y_min and t['y_top'] <= self.select_rect_y_max:
-                    selected_tile_numbers.append(tile_number)
+        elif self.select_rect_x_max > -1.:
+            selected_tile_numbers = self.tc.tiles_in_box(
+                self.select_rect_x_min, self.select_rect_x_max, self.select_rect_y_min,
+                self.select_rect_y_max, mode=self.configuration.tile_selection_mode)
         # Reset the selection_rectangle and return the tile number list.
         self.reset_selection_rectangle()
         return selected_tile_numbers
 
-    def __MoonPhase__(self):
-        """
-        Internal method: Draw the current sunlit phase of the moon to a given resolution.
-
-        :return: list of vertices which outline the moon phase.
-        """
-
-        moon_radius = self.m_diameter / 2.
-        vertices = []
-
-        resolution = 500  # the number of vertices for moon phase
-        # Draw the outer (sunlit) moon limb, starting from the top.
-        for i in range(resolution):
-            phi = np.pi * (float(i) / float(resolution))
-            vertices.append([moon_radius * np.sin(phi), moon_radius * np.cos(phi)])
-        # Now add the terminator, starting from the bottom.
-        for i in range(resolution):
-            phi = np.pi * (float(resolution - i) / float(resolution))
-            vertices.append(
-                [moon_radius * np.sin(phi) * np.cos(self.phase_angle), moon_radius * np.cos(phi)])
-        return vertices
-
     def mark_active(self, index):
         """
-        Mark tile with index "index" as active. Set its color to "blue" and redraw the window.
+        Mark tile with index "index" as active. Set its color to "blue" and redraw the tile.
 
-        :param index:
-        :return:
+        :param index: tile index
+        :return: -
         """
 
         # Memorize this tile as "active_tile".
-        self.active_tile = self.tiles[index]
-        self.active_tile.set_color('blue')
+        self.active_tile = index
+        self.layout.set_tile_colors([index], TileLayoutRenderer.color_active)
+        self.update_display([index])
 
     def mark_processed(self, index_list):
         """
@@ -253,9 +350,9 @@ class TileVisualization:
         :return: -
         """
 
-        for index in index_list:
-            self.tc.list_of_tiles_sorted[index]['processed'] = True
-            self.tiles[index].set_color('skyblue')
+        self.tc.set_processed(index_list, True)
+        self.layout.set_tile_colors(index_list, TileLayoutRenderer.color_processed)
+        self.update_display(index_list)
 
     def mark_all_processed(self):
         """
@@ -265,10 +362,9 @@ class TileVisualization:
         :return: -
         """
 
-        for t in self.tc.list_of_tiles_sorted:
-            t['processed'] = True
-        for t in self.tiles:
-            t.set_color('skyblue')
+        self.tc.set_all_processed(True)
+        self.layout.set_tile_colors(None, TileLayoutRenderer.color_processed)
+        self.update_display()
 
     def mark_unprocessed(self, index_list):
         """
@@ -279,9 +375,9 @@ class TileVisualization:
         :return: -
         """
 
-        for index in index_list:
-            self.tc.list_of_tiles_sorted[index]['processed'] = False
-            self.tiles[index].set_color('red')
+        self.tc.set_processed(index_list, False)
+        self.layout.set_tile_colors(index_list, TileLayoutRenderer.color_unprocessed)
+        self.update_display(index_list)
 
     def mark_all_unprocessed(self):
         """
@@ -291,20 +387,21 @@ class TileVisualization:
         :return: -
         """
 
-        for t in self.tc.list_of_tiles_sorted:
-            t['processed'] = False
-        for t in self.tiles:
-            t.set_color('red')
+        self.tc.set_all_processed(False)
+        self.layout.set_tile_colors(None, TileLayoutRenderer.color_unprocessed)
+        self.update_display()
 
     def save_tile_layout(self, filename):
         """
-        Write the tile layout to a file.
+        Write the tile layout with the current tile states to a file. The layout is rendered
+        off-screen with the same drawing code as in the window.
 
         :param filename: Name of the file where the tile layout is to be written.
         :return: -
         """
 
-        plt.savefig(filename)
+        TileLayoutRenderer.save_layout(self.configuration, self.tc, filename,
+                                       active_tile=self.active_tile)
 
     def close_tile_visualization(self):
         """
@@ -335,7 +432,7 @@ if __name__ == "__main__":
 
     tv.save_tile_layout("tile_layout.png")
 
-    for i in range(len(tv.tiles)):
+    for i in range(len(tc.tile_table)):
         plt.pause(0.1)
         tv.mark_active(i)
         plt.pause(0.1)
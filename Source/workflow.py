@@ -31,6 +31,8 @@ from camera import Camera
 from exceptions import TelescopeException, CameraException
 from miscellaneous import Miscellaneous
 from moon_ephem import MoonEphem
+from session_clock import SessionClock
+from session_journal import SessionJournal
 from telescope import Telescope
 from tile_constructor import TileConstructor
 
@@ -51,6 +53,8 @@ class Workflow(QtCore.QThread):
     camera_initialized_signal = QtCore.pyqtSignal()
     camera_failed_signal = QtCore.pyqtSignal(str)
     tesselation_initialized_signal = QtCore.pyqtSignal()
+    tesselation_updated_signal = QtCore.pyqtSignal(object)
+    tiles_unprocessed_signal = QtCore.pyqtSignal(list, int)
     alignment_point_reached_signal = QtCore.pyqtSignal()
     autoalignment_point_reached_signal = QtCore.pyqtSignal()
     alignment_performed_signal = QtCore.pyqtSignal()
@@ -77,12 +81,18 @@ class Workflow(QtCore.QThread):
         # execution, even if the telescope driver or other configuration parameters are changed.
         self.al = Alignment(self.gui.configuration, debug=self.gui.configuration.alignment_debug)
 
+        # All state changes of the session are recorded in a journal. After a program crash, the
+        # session is resumed from there.
+        self.journal = SessionJournal(self.gui.configuration)
+        self.al.journal = self.journal
+
         self.exiting = False
 
         self.output_channel_initialization_flag = False
         self.telescope_initialization_flag = False
         self.camera_initialization_flag = False
         self.new_tesselation_flag = False
+        self.update_tesselation_flag = False
         self.slew_to_alignment_point_flag = False
         self.perform_alignment_flag = False
         self.perform_autoalignment_flag = False
@@ -114,6 +124,7 @@ class Workflow(QtCore.QThread):
         self.tc = None
         self.repeat_from_here = None
         self.tile_indices_since_last_autoalign = None
+        self.session_resumed = False
 
         self.start()
 
@@ -210,19 +221,40 @@ class Workflow(QtCore.QThread):
                 self.all_tiles_recorded = False
 
                 # Set the time to current time and create a new moon ephemeris object.
-                self.date_time = datetime.now()
+                self.date_time = SessionClock.now()
                 self.me = MoonEphem(self.gui.configuration, self.date_time,
                                     debug=self.gui.configuration.ephemeris_debug)
                 # Register the new ephemeris object with the alignment object.
                 self.al.set_moon_ephem(self.me)
 
-                de_center = self.me.de
-                m_diameter = self.me.diameter
-                phase_angle = self.me.phase_angle
-                pos_angle = self.me.pos_angle_pole
-                # Compute the tesselation of the sunlit moon phase.
-                self.tc = TileConstructor(self.gui.configuration, de_center, m_diameter,
-                                          phase_angle, pos_angle)
+                # At program start, look for a session which was not closed regularly (i.e. the
+                # program has crashed). In this case, rebuild the tile layout from the journal.
+                # The layout is only valid if the camera / telescope parameters did not change.
+                self.session_resumed = False
+                if self.tc is None:
+                    state = self.journal.read_session()
+                    if state is not None:
+                        (de_center, m_diameter, phase_angle, pos_angle) = state['layout']
+                        self.tc = TileConstructor(self.gui.configuration, de_center, m_diameter,
+                                                  phase_angle, pos_angle, me=self.me)
+                        if len(self.tc.tile_table) == state['number_tiles']:
+                            self.tc.set_processed(sorted(state['processed']), True)
+                            self.journal.restore_alignment(self.al, state)
+                            self.session_resumed = True
+                if self.session_resumed:
+                    self.journal.continue_session()
+                    self.all_tiles_recorded = self.tc.unprocessed_bits == 0
+                else:
+                    de_center = self.me.de
+                    m_diameter = self.me.diameter
+                    phase_angle = self.me.phase_angle
+                    pos_angle = self.me.pos_angle_pole
+                    # Compute the tesselation of the sunlit moon phase.
+                    self.tc = TileConstructor(self.gui.configuration, de_center, m_diameter,
+                                              phase_angle, pos_angle, me=self.me)
+                    self.journal.start_session(de_center, m_diameter, phase_angle, pos_angle,
+                                               len(self.tc.tile_table))
+                self.tc.journal = self.journal
 
                 # Write the initialization message to stdout / file:
                 if self.gui.configuration.protocol_level > 0:
@@ -238,12 +270,37 @@ class Workflow(QtCore.QThread):
                                   3)) + " ('),\n" + "           phase_angle: " + str(
                             round(degrees(phase_angle), 2)) + ", pos_angle: " + str(
                             round(degrees(pos_angle), 2)) + " (degrees).")
+                    if self.session_resumed:
+                        Miscellaneous.protocol("Session resumed from journal, " + str(
+                            len(self.tc.tile_table) - bin(self.tc.unprocessed_bits).count(
+                                "1")) + " tiles processed already, " + str(
+                            len(self.al.alignment_points)) + " alignment points restored.")
 
                 self.tesselation_created = True
                 # print ("Signal the main GUI that the tesselation is initialized.")
                 # Signal the main GUI that the tesselation is initialized.
                 self.tesselation_initialized_signal.emit()
 
+            # The moon phase and position angle have changed since the tesselation was computed.
+            # Compute the tile layout for the current time. Tiles which are covered by recorded
+            # tiles get the "processed" status. The new layout is a new TileConstructor object.
+            # The GUI thread keeps using the old one until it puts the new one in place (see
+            # method "tesselation_updated" of the main GUI).
+            elif self.update_tesselation_flag:
+                self.update_tesselation_flag = False
+                self.me.update()
+                (tc, number_unprocessed) = self.tc.update_layout(self.me.de, self.me.diameter,
+                                                                 self.me.phase_angle,
+                                                                 self.me.pos_angle_pole)
+                # Tile numbers of the old layout are not valid anymore.
+                self.active_tile_number = -1
+                self.repeat_from_here = -1
+                self.tile_indices_since_last_autoalign = []
+                self.all_tiles_recorded = number_unprocessed == 0
+                # Signal the main GUI to install the new layout and redraw the tile
+                # visualization window.
+                self.tesselation_updated_signal.emit(tc)
+
             # Slew the telescope to the coordinates of the alignment point.
             elif self.slew_to_alignment_point_flag:
                 self.slew_to_alignment_point_flag = False
@@ -254,7 +311,7 @@ class Workflow(QtCore.QThread):
                 (ra_landmark, de_landmark) = (self.al.compute_telescope_coordinates_of_landmark())
                 if self.gui.configuration.protocol_level > 0:
                     Miscellaneous.protocol("Moving telescope to alignment point.")
-                self.telescope.slew_to(ra_landmark, de_landmark)
+                self.al.slew_telescope(ra_landmark, de_landmark)
                 # Depending on the context where this activity was triggered emit different signals.
                 if self.gui.autoalign_enabled:
                     # In auto-alignment mode: Trigger method "autoalignment_point_reached" in gui.
@@ -310,7 +367,7 @@ class Workflow(QtCore.QThread):
                 if self.gui.configuration.protocol_level > 0:
                     print("")
                     Miscellaneous.protocol("Moving telescope to Moon limb.")
-                self.telescope.slew_to(ra, de)
+                self.al.slew_telescope(ra, de)
                 if self.gui.configuration.protocol_level > 1:
                     Miscellaneous.protocol("Moon speed (arc min./hour), RA: " + str(
                         round(degrees(self.me.rate_ra) * 216000., 1)) + ", DE: " + str(
@@ -347,15 +404,17 @@ class Workflow(QtCore.QThread):
                         Miscellaneous.protocol("Moving telescope to focus star.")
                     else:
                         Miscellaneous.protocol("Moving telescope to focus area.")
-                self.telescope.slew_to(ra_focus, de_focus)
+                self.al.slew_telescope(ra_focus, de_focus)
 
             # This is the most complicated activity of this thread. It is triggered in three
             # different situations (see method "start_continue_recording" in gui).
             elif self.slew_to_tile_and_record_flag:
                 self.slew_to_tile_and_record_flag = False
-                # Maximum time between auto-alignments has passed, do a new alignment
-                if self.al.autoalign_initialized and self.al.seconds_since_last_alignment() > \
-                        self.gui.max_seconds_between_autoaligns:
+                # Index of the tile if it has been chain-aligned below, otherwise None.
+                chain_aligned_tile = None
+                # The scheduler decides if an auto-alignment is due before the next tile.
+                if self.al.autoalign_initialized and \
+                        self.gui.alignment_scheduler.alignment_due():
                     if self.gui.configuration.protocol_level > 0:
                         print("")
                         Miscellaneous.protocol("Trying to perform auto-alignment.")
@@ -366,40 +425,49 @@ class Workflow(QtCore.QThread):
                     for repetition_index in range(self.gui.configuration.align_repetition_count):
                         try:
                             # Perform an auto-alignment. Return value gives size of correction
-                            # relative to width of overlap between tiles (between 0. and 1.).
-                            relative_alignment_error = self.al.align(alignment_manual=False)
+                            # relative to width of overlap between tiles (between 0. and 1.). If
+                            # possible, measure the pointing at the next tile against an image of
+                            # a neighboring tile. This saves the slews to the landmark and back.
+                            relative_alignment_error = None
+                            if self.al.chain_alignment_possible(self.active_tile_number, self.tc):
+                                try:
+                                    relative_alignment_error = self.al.chain_align(
+                                        self.active_tile_number, self.tc)
+                                    chain_aligned_tile = self.active_tile_number
+                                except RuntimeError:
+                                    if self.gui.configuration.protocol_level > 0:
+                                        Miscellaneous.protocol(
+                                            "Chain alignment failed, align on landmark.")
+                            if relative_alignment_error is None:
+                                relative_alignment_error = self.al.align(alignment_manual=False)
                             # If enough alignment points are set, enable drift correction dialog
                             # button.
                             if self.al.drift_dialog_enabled:
                                 self.gui.change_saved_key_status(
                                     self.gui.ui.configure_drift_correction, True)
-                            # On first iteration only: check if time between alignments is to be
-                            # adjusted.
+                            # On first iteration only: Let the scheduler adapt the time until the
+                            # next alignment, and check if the error was too large.
                             if repetition_index == 0:
-                                # If error too large, reduce time between auto-alignments (within
-                                #  bounds
-                                # given by parameters "min_autoalign_interval" and
-                                # "max_autoalign_interval".
-                                if relative_alignment_error > self.gui.max_alignment_error:
-                                    self.gui.max_seconds_between_autoaligns = max((
-                                            self.gui.max_seconds_between_autoaligns /
-                                            self.gui.configuration.align_interval_change_factor),
-                                        self.gui.min_autoalign_interval)
+                                if self.gui.alignment_scheduler.record_alignment(
+                                        relative_alignment_error):
                                     if self.gui.configuration.protocol_level > 0:
                                         Miscellaneous.protocol(
                                             "Auto-alignment inaccurate: Error is " + str(round(
                                             relative_alignment_error / self.gui.max_alignment_error,
                                             2)) + " times the maximum allowed, roll back to "
-                                            "last alignment point. New time between alignments: " +
-                                            str(self.gui.max_seconds_between_autoaligns) +
-                                            " seconds.")
+                                            "last alignment point.")
                                     # Videos since last auto-alignment have to be repeated.
                                     if len(self.tile_indices_since_last_autoalign) > 0:
-                                        self.gui.tv.mark_unprocessed(
+                                        # Let the GUI thread mark the tiles unprocessed in the
+                                        # tile visualization window. Just in case the currently
+                                        # active tile is among them, it is set to active again.
+                                        self.tiles_unprocessed_signal.emit(
+                                            list(self.tile_indices_since_last_autoalign),
+                                            self.active_tile_number)
+                                        # Do not use still images of these tiles for chain
+                                        # alignments.
+                                        self.al.discard_tile_references(
                                             self.tile_indices_since_last_autoalign)
-                                        # Just in case the currently active tile has just be marked
-                                        # unprocessed, set it to active again.
-                                        self.gui.tv.mark_active(self.active_tile_number)
                                         # Reset list of tiles since last auto-align (a fresh
                                         # auto-align has been just performed). Save the lowest
                                         # index of the invalidated tiles. When the TileConstructor
@@ -422,19 +490,6 @@ class Workflow(QtCore.QThread):
                                                 relative_alignment_error /
                                                 self.gui.max_alignment_error,
                                                 2)) + " times the maximum allowed.")
-                                # If the alignment error was very low, increase time between
-                                # auto-alignments (within bounds).
-                                if relative_alignment_error < self.gui.max_alignment_error / \
-                                        self.gui.configuration.align_very_precise_factor:
-                                    self.gui.max_seconds_between_autoaligns = min((
-                                            self.gui.max_seconds_between_autoaligns *
-                                            self.gui.configuration.align_interval_change_factor),
-                                        self.gui.max_autoalign_interval)
-                                    if self.gui.configuration.protocol_level > 0:
-                                        Miscellaneous.protocol(
-                                            "Relative alignment error very small, "
-                                            "new time between alignments: " + str(
-                                            self.gui.max_seconds_between_autoaligns) + " seconds.")
                             if self.gui.configuration.protocol_level > 0:
                                 Miscellaneous.protocol("Auto-alignment successful.")
                         # Auto-alignment was not successful, continue in moon_panorama_maker with
@@ -464,17 +519,27 @@ class Workflow(QtCore.QThread):
                         round(degrees(self.gui.next_tile['delta_ra_center']) * 60.,
                               3)) + ", DE offset ('): " + str(
                         round(degrees(self.gui.next_tile['delta_de_center']) * 60., 3)) + ".")
+                if self.gui.alignment_scheduler is not None:
+                    self.gui.alignment_scheduler.tile_started()
                 (ra, de) = self.al.tile_to_telescope_coordinates(self.gui.next_tile)
-                self.telescope.slew_to(ra, de)
+                self.al.slew_telescope(ra, de)
                 self.set_statusbar_signal.emit()
+                # Keep a still image of the tile for chain alignments at its neighbors. After a
+                # chain alignment at this tile, the image taken there is kept already.
+                if chain_aligned_tile != self.active_tile_number:
+                    self.al.capture_tile_reference(self.active_tile_number, self.tc)
                 # During video acquisition, guide the telescope to follow the moon among stars.
-                guiding_rate_ra = self.me.rate_ra
-                guiding_rate_de = self.me.rate_de
-                # If drift has been determined, include it in guidance rates.
-                if self.al.is_drift_set:
-                    guiding_rate_ra += self.al.drift_ra
-                    guiding_rate_de += self.al.drift_de
-                self.telescope.start_guiding(guiding_rate_ra, guiding_rate_de)
+                # Rates and accelerations are computed for the current time.
+                (guiding_rate_ra, guiding_rate_de, guiding_accel_ra,
+                 guiding_accel_de) = self.me.rates()
+                # If drift has been determined, include it in guidance rates. This is the same
+                # drift rate which is used for the pointing correction.
+                drift = self.al.drift_rate()
+                if drift is not None:
+                    guiding_rate_ra += drift[0]
+                    guiding_rate_de += drift[1]
+                self.telescope.start_guiding(guiding_rate_ra, guiding_rate_de, guiding_accel_ra,
+                                             guiding_accel_de)
                 if self.gui.configuration.conf.getboolean("Workflow", "camera automation"):
                     # Wait a little until telescope pointing has stabilized.
                     time.sleep(
@@ -508,7 +573,7 @@ class Workflow(QtCore.QThread):
                 (ra_selected_tile, de_selected_tile) = (self.al.tile_to_telescope_coordinates(
                     self.tc.list_of_tiles_sorted[self.active_tile_number]))
                 # Move telescope to aim point. (This is a blocking operation.)
-                self.telescope.slew_to(ra_selected_tile, de_selected_tile)
+                self.al.slew_telescope(ra_selected_tile, de_selected_tile)
                 self.set_text_browser_signal.emit("")
                 # Start method "reset_key_status" in gui to re-activate gui buttons.
                 self.reset_key_status_signal.emit()